@@ -0,0 +1 @@
+"""Offline benchmarks with local stand-ins for Reddit, Pushshift and Groq. Run with: python -m benchmarks.run"""
@@ -0,0 +1,356 @@
+"""
+Deterministic local stand-ins for Reddit (PRAW), Pushshift and Groq, with configurable latency
+and injected failures. The miner's own clients, rate limiters, parsers and database code still
+run; only the network on the other side is replaced.
+"""
+import calendar
+import json
+import random
+import re
+import threading
+import time
+import types
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from src.llm_analyzer import CATEGORIES
+from src.prompt_packer import estimate_tokens
+
+_WORDS = (
+    "invoice client payment spreadsheet export report customer schedule booking inventory email "
+    "automate manual hours weekly team tool software pricing onboarding workflow template dashboard "
+    "sync calendar reminder receipt tax contract proposal lead pipeline support ticket survey"
+).split()
+
+
+class InjectedError(Exception):
+    """An HTTP error raised by a fake backend, shaped like the errors of requests and the Groq SDK."""
+    def __init__(self, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status_code} (injected)")
+        self.status_code = status_code
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        self.response = types.SimpleNamespace(status_code=status_code, headers=headers)
+
+
+class LatencyModel:
+    """
+    Latency and failures of one backend. Call n sleeps mean_ms +/- jitter_ms and fails with
+    probability error_rate (HTTP 503) or throttle_rate (HTTP 429 with Retry-After), drawn from a
+    generator seeded with (seed, n), so a run with the same settings sees the same sequence.
+    """
+    def __init__(self, mean_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, retry_after: float = 1.0, seed: int = 0):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.seed = seed
+        self.calls = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """Returns (seconds to sleep, HTTP status to fail with or None) for the next call."""
+        with self._lock:
+            n = self.calls
+            self.calls += 1
+        rng = random.Random(f"{self.seed}:{n}")
+        delay = max(0.0, self.mean_ms + rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+        roll = rng.random()
+        status = None
+        if roll < self.throttle_rate:
+            status = 429
+        elif roll < self.throttle_rate + self.error_rate:
+            status = 503
+        if status is not None:
+            with self._lock:
+                self.failures += 1
+        return delay, status
+
+    def __call__(self):
+        """Waits like a network call, then raises the injected failure, if any."""
+        delay, status = self.draw()
+        time.sleep(delay)
+        if status is not None:
+            raise InjectedError(status, self.retry_after if status == 429 else None)
+
+
+# --- Synthetic data ---
+
+class SyntheticSubreddit:
+    """
+    A reproducible subreddit: `num_posts` posts, newest first, spread evenly over the year `year`.
+    `keyword_rate` of them mention one of `keywords` in the title, `duplicate_rate` are reposts of an
+    earlier post with a few words changed, and most have enough comments to pass the miner's filter.
+    Posts are Pushshift-shaped dicts; the fake PRAW client wraps them.
+    """
+    def __init__(self, name: str = "bench", num_posts: int = 1000, keywords: List[str] = None,
+                 keyword_rate: float = 0.6, duplicate_rate: float = 0.05, comments_per_post: int = 8,
+                 year: int = 2023, seed: int = 0):
+        self.name = name
+        self.keywords = keywords or ["invoice", "spreadsheet", "manual"]
+        self.comments_per_post = comments_per_post
+        rng = random.Random(f"{seed}:{name}")
+        start = calendar.timegm((year, 1, 1, 0, 0, 0))
+        step = (calendar.timegm((year + 1, 1, 1, 0, 0, 0)) - start) / max(1, num_posts)
+
+        self.posts: List[dict] = []
+        for i in range(num_posts):
+            created = int(start + i * step)
+            if self.posts and rng.random() < duplicate_rate:
+                original = rng.choice(self.posts)
+                title, body = original["title"], original["selftext"].split()
+                for _ in range(3):
+                    body[rng.randrange(len(body))] = rng.choice(_WORDS)
+                body = " ".join(body)
+            else:
+                words = [rng.choice(_WORDS) for _ in range(rng.randint(6, 12))]
+                if rng.random() < keyword_rate:
+                    words.insert(rng.randrange(len(words)), rng.choice(self.keywords))
+                title = " ".join(words).capitalize() + "?"
+                body = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(40, 160)))
+            post_id = f"{name}{i:07d}"
+            self.posts.append({
+                "id": post_id, "name": f"t3_{post_id}", "subreddit": name, "title": title, "selftext": body,
+                "score": rng.randint(0, 500), "num_comments": rng.choice([0, 3] + [rng.randint(6, 200)] * 8),
+                "created_utc": created, "permalink": f"/r/{name}/comments/{post_id}/",
+            })
+        self.posts.reverse()
+        self._by_id: Dict[str, dict] = {p["id"]: p for p in self.posts}
+        self._index: Dict[str, int] = {p["name"]: i for i, p in enumerate(self.posts)}
+        self._seed = seed
+
+    def post(self, post_id: str) -> Optional[dict]:
+        return self._by_id.get(post_id)
+
+    def index_of(self, fullname: str) -> Optional[int]:
+        return self._index.get(fullname)
+
+    def comments(self, post_id: str) -> List[dict]:
+        rng = random.Random(f"{self._seed}:{post_id}:comments")
+        return [
+            {"body": " ".join(rng.choice(_WORDS) for _ in range(rng.randint(8, 60))), "score": rng.randint(-5, 300)}
+            for _ in range(self.comments_per_post)
+        ]
+
+
+def synthetic_opportunity(i: int, rng: random.Random) -> dict:
+    """A record shaped like the ones AnalysisGraph saves, for database benchmarks."""
+    category = rng.choice(list(CATEGORIES))
+    created = datetime.fromtimestamp(1_600_000_000 + rng.randrange(3 * 365 * 86400))
+    return {
+        "url": f"https://www.reddit.com/r/bench/comments/b{i:08d}/",
+        "post_id": f"b{i:08d}",
+        "title": " ".join(rng.choice(_WORDS) for _ in range(8)),
+        "post_created_utc": created,
+        "category": category,
+        "sub_category": rng.choice(CATEGORIES[category]),
+        "pain_points": json.dumps(["too much manual work"]),
+        "business_opportunities": json.dumps(["a small SaaS"]),
+        "automation_ideas": json.dumps(["sync it automatically"]),
+        "confidence_score": rng.randint(1, 10),
+        "summary": "Synthetic opportunity.",
+        "prompt_version": "bench",
+        "input_tokens": rng.randint(200, 3000),
+        "input_tokens_untrimmed": rng.randint(200, 6000),
+        "matched_keywords": json.dumps([rng.choice(["invoice", "spreadsheet", "manual"])]),
+        "prescore": round(rng.random(), 3),
+    }
+
+
+# --- Reddit (PRAW) ---
+
+class _FakeSubmission:
+    def __init__(self, data: dict):
+        self.id = data["id"]
+        self.fullname = data["name"]
+        self.title = data["title"]
+        self.selftext = data["selftext"]
+        self.score = data["score"]
+        self.num_comments = data["num_comments"]
+        self.created_utc = data["created_utc"]
+        self.url = f"https://www.reddit.com{data['permalink']}"
+
+
+class _FakeSubredditListing:
+    def __init__(self, reddit: "FakeReddit"):
+        self._reddit = reddit
+
+    def new(self, limit: int = 100, params: dict = None):
+        """Newest first; 'after' pages towards older posts and 'before' towards newer ones, like Reddit."""
+        self._reddit.latency()
+        posts = self._reddit.source.posts
+        params = params or {}
+        if params.get("before"):
+            end = self._reddit.source.index_of(params["before"])
+            page = posts[max(0, end - limit):end] if end is not None else []
+        else:
+            start = 0
+            if params.get("after"):
+                index = self._reddit.source.index_of(params["after"])
+                start = len(posts) if index is None else index + 1
+            page = posts[start:start + limit]
+        return iter([_FakeSubmission(p) for p in page])
+
+
+class FakeReddit:
+    """The parts of praw.Reddit the miner uses, backed by a SyntheticSubreddit."""
+    def __init__(self, source: SyntheticSubreddit, latency: LatencyModel = None):
+        self.source = source
+        self.latency = latency or LatencyModel()
+
+    def subreddit(self, name: str):
+        return _FakeSubredditListing(self)
+
+    def request(self, method: str, path: str, params: dict = None):
+        """GET comments/<id>: the post and its top-level comments, best first, cut at params['limit']."""
+        self.latency()
+        post_id = path.rstrip("/").rsplit("/", 1)[-1]
+        params = params or {}
+        comments = sorted(self.source.comments(post_id), key=lambda c: -c["score"])[:int(params.get("limit", 200))]
+        return [
+            {"kind": "Listing", "data": {"children": [{"kind": "t3", "data": self.source.post(post_id)}]}},
+            {"kind": "Listing", "data": {"children": [{"kind": "t1", "data": c} for c in comments]}},
+        ]
+
+    def info(self, fullnames: list):
+        self.latency()
+        posts = self.source.posts
+        return iter([_FakeSubmission(posts[i]) for i in map(self.source.index_of, fullnames) if i is not None])
+
+
+# --- Pushshift ---
+
+class PushshiftStub:
+    """
+    A Pushshift-compatible submission search endpoint on 127.0.0.1, serving a SyntheticSubreddit.
+    Supports the subreddit, after, before, size, sort and q (keywords joined by '|') parameters.
+    Injected failures are answered with real HTTP 429/503 responses.
+    """
+    def __init__(self, source: SyntheticSubreddit, latency: LatencyModel = None):
+        self.source = source
+        self.latency = latency or LatencyModel()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/reddit/search/submission/"
+
+    def search(self, params: dict) -> List[dict]:
+        after = int(params.get("after", 0))
+        before = int(params.get("before", 2 ** 40))
+        size = int(params.get("size", 100))
+        terms = [t.lower() for t in params.get("q", "").split("|") if t]
+        subreddit = params.get("subreddit", "").lower()
+        matches = [
+            p for p in self.source.posts
+            if after < p["created_utc"] < before
+            and (not subreddit or p["subreddit"].lower() == subreddit)
+            and (not terms or any(t in f"{p['title']} {p['selftext']}".lower() for t in terms))
+        ]
+        matches.sort(key=lambda p: p["created_utc"], reverse=params.get("sort", "desc") == "desc")
+        return matches[:size]
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                delay, status = stub.latency.draw()
+                time.sleep(delay)
+                if status is not None:
+                    self.send_response(status)
+                    if status == 429:
+                        self.send_header("Retry-After", str(stub.latency.retry_after))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                params = {k: v[-1] for k, v in parse_qs(urlparse(self.path).query).items()}
+                body = json.dumps({"data": stub.search(params)}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# --- Groq ---
+
+_POST_ID_RE = re.compile(r"### Post ID: (\S+)")
+_TITLE_RE = re.compile(r"\*\*Post Title:\*\*\s*(.*)")
+
+
+class FakeChatModel:
+    """
+    Stands in for the ChatGroq model at the end of the analyzer's prompt chains. Replies with
+    schema-valid OpportunityAnalysis JSON (an {"analyses": [...]} list for batch prompts), chosen
+    deterministically from the prompt, and reports token usage like Groq does.
+    """
+    def __init__(self, latency: LatencyModel = None, output_tokens_per_post: int = 150):
+        self.latency = latency or LatencyModel()
+        self.output_tokens_per_post = output_tokens_per_post
+
+    @staticmethod
+    def analysis(text: str) -> dict:
+        rng = random.Random(text)
+        category = rng.choice(list(CATEGORIES))
+        return {
+            "pain_points": ["Repetitive manual bookkeeping", "Data spread across spreadsheets"],
+            "business_opportunities": ["A lightweight tool that automates the workflow"],
+            "automation_ideas": ["Sync the records automatically and send reminders"],
+            "confidence_score": rng.randint(1, 10),
+            "summary": "Users describe a recurring manual process that software could take over.",
+            "category": category,
+            "sub_category": rng.choice(CATEGORIES[category]),
+        }
+
+    def invoke(self, prompt) -> AIMessage:
+        self.latency()
+        text = prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+        post_ids = _POST_ID_RE.findall(text)
+        if post_ids:
+            sections = text.split("### Post ID: ")[1:]
+            reply = {"analyses": [dict(self.analysis(section), post_id=post_id) for post_id, section in zip(post_ids, sections)]}
+        else:
+            title = _TITLE_RE.search(text)
+            reply = self.analysis(title.group(1) if title else text)
+        content = json.dumps(reply)
+        input_tokens = estimate_tokens(text)
+        output_tokens = self.output_tokens_per_post * max(1, len(post_ids))
+        return AIMessage(content=content, usage_metadata={
+            "input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens,
+        })
+
+    def runnable(self):
+        return RunnableLambda(self.invoke)
+
+
+def install(graph, reddit: FakeReddit, chat_model: FakeChatModel):
+    """Points an AnalysisGraph's Reddit client and LLM chains at the fakes."""
+    graph.reddit_client.reddit = reddit
+    analyzer = graph.llm_analyzer
+    analyzer.chain = analyzer.prompt_template | chat_model.runnable()
+    analyzer.batch_chain = analyzer.batch_prompt_template | chat_model.runnable()
+    analyzer.reask_chain = analyzer.reask_template | chat_model.runnable()
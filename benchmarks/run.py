@@ -0,0 +1,304 @@
+"""
+Offline benchmarks of the miner against the local stand-ins in benchmarks/fakes.py.
+No credentials or network access are needed; every scenario works on a throwaway database.
+
+    python -m benchmarks.run all --output bench.json
+    python -m benchmarks.run pipeline --posts 2000 --groq-ms 300 --error-rate 0.01 --baseline bench.json
+"""
+import os
+
+# Placeholders so the clients can be constructed; the fakes answer every request. The rate limits
+# are lifted so the benchmark measures the miner and the modeled latency, not the provider quotas.
+for _name in ("GROQ_API_KEY", "REDDIT_CLIENT_ID", "REDDIT_CLIENT_SECRET", "REDDIT_USER_AGENT"):
+    os.environ.setdefault(_name, "benchmark")
+os.environ.update(
+    REDDIT_REQUESTS_PER_MINUTE="1000000", PUSHSHIFT_REQUESTS_PER_MINUTE="1000000",
+    GROQ_REQUESTS_PER_MINUTE="1000000", GROQ_TOKENS_PER_MINUTE="1000000000",
+)
+
+import argparse
+import contextlib
+import json
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from src import database, metrics, rate_limiter
+from src.import_profile import heavy_packages, parse_import_times
+from src.analysis_graph import AnalysisGraph
+from src.run_scheduler import RunJob, RunScheduler
+from benchmarks.fakes import (
+    FakeChatModel, FakeReddit, LatencyModel, PushshiftStub, SyntheticSubreddit, install, synthetic_opportunity,
+)
+
+# Report queries timed at every database size: (name, filters).
+REPORT_QUERIES = [
+    ("category_all_runs", {'report_type': 'category'}),
+    ("category_one_run", {'report_type': 'category', 'run_ids': [1]}),
+    ("category_date_range", {'report_type': 'category', 'runs_after': '2000-01-01'}),
+    ("subcategory", {'report_type': 'subcategory', 'category_filter': 'SaaS'}),
+    ("keyword", {'report_type': 'keyword'}),
+    ("subreddit_bias", {'report_type': 'subreddit_bias'}),
+    ("prescore", {'report_type': 'prescore'}),
+    ("trend", {'report_type': 'trend'}),
+    ("trend_one_run", {'report_type': 'trend', 'run_ids': [1]}),
+    ("top", {'report_type': 'top', 'limit': 20}),
+    ("top_one_category", {'report_type': 'top', 'limit': 20, 'category_filter': 'SaaS'}),
+]
+# Searches timed at every database size: (name, query, filters). The synthetic titles draw from a
+# small vocabulary, so a single word matches a large share of the rows; the phrase is more selective.
+SEARCH_QUERIES = [
+    ("search_word", "invoice", {}),
+    ("search_phrase", '"invoice reminder"', {}),
+    ("search_word_one_category", "invoice", {'category_filter': 'SaaS'}),
+    ("search_phrase_one_run", '"invoice reminder"', {'run_ids': [1]}),
+]
+# CLI invocations timed from process start to exit: (name, arguments, budget in seconds).
+STARTUP_BUDGETS = [
+    ("help", ["--help"], 0.4),
+    ("db_migrate", ["db", "migrate"], 0.4),
+    ("db_list_runs", ["db", "list_runs"], 0.4),
+    ("report_category", ["report", "category"], 0.4),
+    ("run_help", ["run", "--help"], 0.4),
+    ("watch_help", ["watch", "--help"], 0.4),
+]
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+REPORT_RUNS = 20
+FILL_BATCH_SIZE = 1000
+# Timings below this are mostly noise and are not compared with the baseline.
+MIN_COMPARED_SECONDS = 0.005
+
+
+@contextlib.contextmanager
+def _quiet(verbose: bool):
+    """Hides the miner's progress output and bars unless --verbose is given."""
+    if verbose:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        yield
+
+
+def _use_database(workdir: str, name: str):
+    database.DB_FILE = os.path.join(workdir, f"{name}.db")
+    database.initialize_db()
+
+
+def _latency(args, mean_ms: float, seed_offset: int) -> LatencyModel:
+    return LatencyModel(mean_ms=mean_ms, jitter_ms=mean_ms * args.jitter, error_rate=args.error_rate,
+                        throttle_rate=args.throttle_rate, retry_after=args.backoff_seconds, seed=args.seed + seed_offset)
+
+
+def bench_pipeline(args, workdir: str, results: dict, failures: list):
+    """End-to-end runs over a synthetic subreddit, one per data source."""
+    subreddit = SyntheticSubreddit(num_posts=args.posts, seed=args.seed)
+    for source in args.sources:
+        print(f"pipeline: {args.posts} posts from the fake {source} source...")
+        reddit = FakeReddit(subreddit, _latency(args, args.reddit_ms, 1))
+        chat_model = FakeChatModel(_latency(args, args.groq_ms, 2))
+        with PushshiftStub(subreddit, _latency(args, args.pushshift_ms, 3)) as stub, _quiet(args.verbose):
+            _use_database(workdir, f"pipeline_{source}")
+            metrics.reset()
+            graph = AnalysisGraph(
+                reddit_concurrency=args.reddit_concurrency, llm_concurrency=args.llm_concurrency,
+                # Every run should exercise the LLM path, not replay the previous run from the cache.
+                use_llm_cache=False, analysis_mode=args.analysis_mode, batch_size=args.batch_size,
+                pushshift_url=stub.url, pipeline=args.pipeline,
+            )
+            install(graph, reddit, chat_model)
+            time_period = "recent" if source == "recent" else str(time.gmtime(subreddit.posts[0]["created_utc"]).tm_year)
+            job = RunJob.create(subreddit.name, subreddit.keywords, time_period=time_period, target=args.posts)
+            start = time.perf_counter()
+            RunScheduler(graph, options={}, parallel_runs=1).run([job])
+            graph.close()
+            wall = time.perf_counter() - start
+
+        summary = metrics.run_summary(job.run_id)
+        nodes = summary["nodes"]
+        fetched = sum(stats["posts_out"] for name, stats in nodes.items() if name.startswith("fetch_"))
+        saved = nodes.get("save_to_database", {}).get("posts_in", 0)
+        prefix = f"pipeline.{source}"
+        results[f"{prefix}.wall_seconds"] = wall
+        results[f"{prefix}.posts_per_second"] = fetched / wall
+        results[f"{prefix}.analyzed_per_second"] = saved / wall
+        for name, stats in nodes.items():
+            if stats["calls"]:
+                results[f"{prefix}.{name}.seconds_per_batch"] = stats["seconds"] / stats["calls"]
+        for provider in ("reddit", "pushshift", "groq"):
+            calls, seconds = metrics.API_SECONDS.totals(provider=provider)
+            if calls:
+                results[f"{prefix}.{provider}.seconds_per_call"] = seconds / calls
+        retries = metrics.API_RETRIES.total()
+        if retries:
+            results[f"{prefix}.retries"] = retries
+
+
+def bench_database(args, workdir: str, results: dict, failures: list):
+    """Throughput of insert_opportunities for new rows and for re-analyzed (upserted) rows."""
+    print(f"database: inserting {args.insert_rows} opportunities in batches of {args.insert_batch}...")
+    rng = random.Random(args.seed)
+    records = [synthetic_opportunity(i, rng) for i in range(args.insert_rows)]
+    with _quiet(args.verbose):
+        _use_database(workdir, "inserts")
+        run_id = database.create_run(subreddit="bench", keywords="invoice")
+        rerun_id = database.create_run(subreddit="bench", keywords="invoice")
+    for name, target_run in (("insert", run_id), ("upsert", rerun_id)):
+        start = time.perf_counter()
+        stored = 0
+        for i in range(0, len(records), args.insert_batch):
+            stored += sum(database.insert_opportunities(target_run, records[i:i + args.insert_batch]))
+        elapsed = time.perf_counter() - start
+        if stored != len(records):
+            raise RuntimeError(f"Only {stored} of {len(records)} rows were linked in the {name} benchmark.")
+        results[f"database.{name}.rows_per_second"] = len(records) / elapsed
+
+
+def bench_reports(args, workdir: str, results: dict, failures: list):
+    """Report and search query times as the database grows to each of the given sizes."""
+    rng = random.Random(args.seed)
+    with _quiet(args.verbose):
+        _use_database(workdir, "reports")
+        run_ids = [database.create_run(subreddit=f"bench{k % 4}", keywords="invoice") for k in range(REPORT_RUNS)]
+    stored = 0
+    for size in sorted(args.sizes):
+        print(f"reports: growing the database to {size} opportunities...")
+        while stored < size:
+            batch = [synthetic_opportunity(i, rng) for i in range(stored, min(size, stored + FILL_BATCH_SIZE))]
+            database.insert_opportunities(run_ids[(stored // FILL_BATCH_SIZE) % REPORT_RUNS], batch)
+            stored += len(batch)
+        queries = [(name, database.generate_report, (dict(filters),)) for name, filters in REPORT_QUERIES]
+        queries += [(name, database.search_opportunities, (query, filters)) for name, query, filters in SEARCH_QUERIES]
+        for name, function, function_args in queries:
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                with _quiet(args.verbose):
+                    function(*function_args)
+                timings.append(time.perf_counter() - start)
+            results[f"reports.{size}.{name}.seconds"] = min(timings)
+
+
+def bench_startup(args, workdir: str, results: dict, failures: list):
+    """Wall time of CLI commands in fresh processes, without credentials, against STARTUP_BUDGETS."""
+    cwd = os.path.join(workdir, "startup")
+    os.makedirs(cwd, exist_ok=True)
+    env = {k: v for k, v in os.environ.items()
+           if k not in ("GROQ_API_KEY", "REDDIT_CLIENT_ID", "REDDIT_CLIENT_SECRET", "REDDIT_USER_AGENT")}
+    for name, argv, budget in STARTUP_BUDGETS:
+        command = [sys.executable, MAIN_SCRIPT, *argv]
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            subprocess.run(command, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            timings.append(time.perf_counter() - start)
+        seconds = min(timings)
+        results[f"startup.{name}.seconds"] = seconds
+
+        profile = subprocess.run([sys.executable, "-X", "importtime", *command[1:]], cwd=cwd, env=env,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        heavy = heavy_packages(parse_import_times(profile.stderr)[0])
+        print(f"startup: {' '.join(argv):<16} {seconds:.3f}s (budget {budget:.1f}s), "
+              f"analysis stack loaded: {', '.join(heavy) if heavy else 'none'}")
+        if seconds > budget:
+            failures.append(f"OVER BUDGET startup.{name}: {seconds:.3f}s > {budget:.1f}s")
+
+
+def _higher_is_better(metric: str) -> bool:
+    return metric.endswith("_per_second")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Metrics that got worse than the baseline by more than `tolerance` (a fraction)."""
+    regressions = []
+    for metric, value in results.items():
+        old = baseline.get(metric)
+        if not old or metric.endswith(".retries"):
+            continue
+        if not _higher_is_better(metric) and max(old, value) < MIN_COMPARED_SECONDS:
+            continue
+        change = (old - value) / old if _higher_is_better(metric) else (value - old) / old
+        if change > tolerance:
+            regressions.append((metric, old, value, change))
+    return regressions
+
+
+def print_results(results: dict, baseline: dict = None):
+    print(f"\n{'metric':<62} {'value':>12} {'baseline':>12} {'change':>8}")
+    for metric, value in results.items():
+        old = (baseline or {}).get(metric)
+        change = f"{(value - old) / old:+.0%}" if old else ""
+        print(f"{metric:<62} {value:>12.4f} {'' if old is None else f'{old:>12.4f}':>12} {change:>8}")
+
+
+SCENARIOS = {"pipeline": bench_pipeline, "database": bench_database, "reports": bench_reports, "startup": bench_startup}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks with local stand-ins for Reddit, Pushshift and Groq.")
+    parser.add_argument("scenario", choices=list(SCENARIOS) + ['all'], nargs='?', default='all', help="What to benchmark. Default: all.")
+    parser.add_argument("--posts", type=int, default=1000, help="'pipeline': posts in the synthetic subreddit. Default: 1000.")
+    parser.add_argument("--sources", nargs='+', choices=['recent', 'historical'], default=['recent', 'historical'], help="'pipeline': data sources to run. Default: both.")
+    parser.add_argument("--pipeline", choices=['batch', 'streaming'], default='batch', help="'pipeline': the miner's --pipeline. Default: batch.")
+    parser.add_argument("--analysis-mode", choices=['single', 'batch'], default='single', help="'pipeline': the miner's --analysis-mode. Default: single.")
+    parser.add_argument("--batch-size", type=int, default=5, help="'pipeline': posts per LLM request in 'batch' analysis mode. Default: 5.")
+    parser.add_argument("--reddit-concurrency", type=int, default=4, help="'pipeline': parallel comment fetches. Default: 4.")
+    parser.add_argument("--llm-concurrency", type=int, default=4, help="'pipeline': parallel LLM requests. Default: 4.")
+    parser.add_argument("--reddit-ms", type=float, default=20, help="Mean latency of a fake Reddit request. Default: 20.")
+    parser.add_argument("--pushshift-ms", type=float, default=50, help="Mean latency of a Pushshift stub request. Default: 50.")
+    parser.add_argument("--groq-ms", type=float, default=150, help="Mean latency of a fake Groq request. Default: 150.")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Latency varies by up to this fraction of the mean. Default: 0.5.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake requests failing with HTTP 503. Default: 0.")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of fake requests failing with HTTP 429. Default: 0.")
+    parser.add_argument("--backoff-seconds", type=float, default=0.1, help="Base retry backoff and Retry-After of injected failures, scaled down from the real 2s so failures cost retries rather than minutes. Default: 0.1.")
+    parser.add_argument("--insert-rows", type=int, default=20000, help="'database': opportunities to insert. Default: 20000.")
+    parser.add_argument("--insert-batch", type=int, default=100, help="'database': opportunities per insert_opportunities call. Default: 100.")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[10000, 100000, 1000000], help="'reports': database sizes to time the reports at. Default: 10000 100000 1000000.")
+    parser.add_argument("--repeat", type=int, default=3, help="'reports' and 'startup': runs per query or command; the fastest counts. Default: 3.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data and the latency model. Default: 0.")
+    parser.add_argument("--output", metavar='FILE', help="Save the results as JSON, e.g. as the next baseline.")
+    parser.add_argument("--baseline", metavar='FILE', help="Compare with earlier results and exit with status 1 on a regression.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="With --baseline, how much worse (a fraction) a metric may get. Default: 0.25.")
+    parser.add_argument("--workdir", help="Keep the benchmark databases in this directory instead of a temporary one.")
+    parser.add_argument("--verbose", action='store_true', help="Show the miner's own output.")
+    args = parser.parse_args()
+
+    rate_limiter.BACKOFF_BASE_SECONDS = args.backoff_seconds
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="miner-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    results = {}
+    failures = []
+    try:
+        for name in (SCENARIOS if args.scenario == 'all' else [args.scenario]):
+            SCENARIOS[name](args, workdir, results, failures)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"settings": {k: v for k, v in vars(args).items() if k not in ('output', 'baseline')},
+                       "results": results}, f, indent=2)
+    for failure in failures:
+        print(failure)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for metric, old, value, change in regressions:
+            print(f"REGRESSION {metric}: {old:.4f} -> {value:.4f} ({change:.0%} worse)")
+        failures.extend(regressions)
+        if not regressions:
+            print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}.")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,16 @@
 import argparse
-import time
-from src.analysis_graph import AnalysisGraph
-from src.database import generate_report, initialize_db, create_run, list_runs
+import os
+import sys
+# Only light modules are imported here; the analysis stack (LangGraph, LangChain, PRAW) and
+# the credentials are loaded by the commands that use them.
+from src.database import (
+    generate_report, initialize_db, migrate_db, list_runs, purge_llm_cache,
+    check_rollups, rebuild_rollups, list_watch_states, get_run_metrics, search_opportunities, rebuild_search_index,
+)
+from src import metrics
+from src.report_writers import WRITERS
+from src.run_scheduler import RunJob, RunScheduler, load_jobs_file
+from src.watch_scheduler import WatchJob, WatchScheduler
 
 def main():
     """
@@ -12,35 +21,92 @@ def main():
         formatter_class=argparse.RawTextHelpFormatter
     )
     
+    parser.add_argument("--profile-imports", action='store_true', help="Run the command and print how long its imports took, per package.")
+
     # --- Top-level commands ---
     subparsers = parser.add_subparsers(dest='command', required=True, help='Available commands')
 
+    # --- Options shared by 'run' and 'watch' ---
+    analysis_options = argparse.ArgumentParser(add_help=False)
+    analysis_options.add_argument("--parallel-runs", type=int, default=4, help="How many runs process a batch at the same time. Default: 4.")
+    analysis_options.add_argument("--keyword-match", choices=['substring', 'word', 'stem'], default='substring', help="How keywords match post text: anywhere ('substring'), as whole words ('word'), or as whole words including inflections ('stem'). Default: substring.")
+    analysis_options.add_argument("--prescore-threshold", type=float, metavar='SCORE', help="Only send posts with a local pre-score (0-1) of at least SCORE to the LLM.")
+    analysis_options.add_argument("--prescore-top", type=float, metavar='FRACTION', help="Only send the top FRACTION (0-1) of each batch's posts, ranked by local pre-score, to the LLM.")
+    analysis_options.add_argument("--near-dup-threshold", type=float, default=0.8, metavar='SIMILARITY', help="Posts at least this similar (0-1, estimated word-shingle Jaccard) to an analyzed post reuse its analysis. Default: 0.8.")
+    analysis_options.add_argument("--no-near-dup", action='store_true', help="Analyze near-duplicate posts separately.")
+    analysis_options.add_argument("--reanalyze-older-than", dest='reanalyze_after_days', type=int, help="Re-analyze already stored posts whose analysis is older than this many days.")
+    analysis_options.add_argument("--reanalyze-on-prompt-change", action='store_true', help="Re-analyze already stored posts that were analyzed with a different prompt version.")
+    analysis_options.add_argument("--reddit-concurrency", type=int, default=4, help="Maximum parallel comment fetches from Reddit. Default: 4.")
+    analysis_options.add_argument("--llm-concurrency", type=int, default=4, help="Maximum parallel LLM requests to Groq. Default: 4.")
+    analysis_options.add_argument("--analysis-mode", choices=['single', 'batch'], default='single', help="'single' sends one LLM request per post; 'batch' packs several posts into one request. Default: single.")
+    analysis_options.add_argument("--batch-size", type=int, default=5, help="For 'batch' mode, the maximum number of posts per LLM request. Default: 5.")
+    analysis_options.add_argument("--batch-token-budget", type=int, default=12000, help="For 'batch' mode, the estimated token budget per LLM request. Default: 12000.")
+    analysis_options.add_argument("--prompt-token-budget", type=int, default=3000, help="Estimated token budget for one post's title, body and comments; longer posts are trimmed. 0 disables trimming. Default: 3000.")
+    analysis_options.add_argument("--no-cache", action='store_true', help="Bypass the LLM result cache and always call the model.")
+    analysis_options.add_argument("--comment-cache-hours", type=float, default=24, help="Reuse fetched comments of posts whose comment count has not changed for this many hours. 0 disables. Default: 24.")
+    analysis_options.add_argument("--pipeline", choices=['batch', 'streaming'], default='batch', help="'batch' analyzes and saves one page of posts at a time; 'streaming' saves each result as soon as it is ready while the next page is fetched. Default: batch.")
+    analysis_options.add_argument("--metrics-file", metavar='PATH', help="Keep PATH updated with latencies, post counts, token usage, retries and database write times in the Prometheus text format.")
+    analysis_options.add_argument("--metrics-port", type=int, metavar='PORT', help="Serve the same metrics on http://127.0.0.1:PORT/metrics while the command runs.")
+    analysis_options.add_argument("--queue-size", type=int, default=200, help="For the 'streaming' pipeline, how many posts may wait for analysis and for saving. Default: 200.")
+
     # --- 'run' command ---
-    run_parser = subparsers.add_parser('run', help='Start a new analysis run to find opportunities.')
-    run_parser.add_argument("subreddit", type=str, help="The subreddit to analyze (e.g., 'SaaS').")
-    run_parser.add_argument("-k", "--keywords", nargs="+", required=True, help="Keywords to search for.")
-    run_parser.add_argument("--target", type=int, default=10, help="Target number of NEW opportunities to find. Default: 10.")
+    run_parser = subparsers.add_parser('run', parents=[analysis_options], help='Start a new analysis run to find opportunities.')
+    run_parser.add_argument("subreddit", type=str, nargs='*', help="One or more subreddits to analyze (e.g., 'SaaS'). Each gets its own run.")
+    run_parser.add_argument("-k", "--keywords", nargs="+", help="Keywords to search for. Required unless --resume is used or the job file sets them.")
+    run_parser.add_argument("--jobs", metavar='FILE', help="JSON or YAML file listing subreddits with their own keywords, targets and time periods.")
+    run_parser.add_argument("--target", type=int, help="Target number of NEW opportunities to find. Default: 10, or the resumed run's target.")
+    run_parser.add_argument("--shard", choices=['month', 'week'], default='month', help="For historical runs, the time shard size the year is split into. Default: month.")
+    run_parser.add_argument("--backfill-workers", type=int, default=4, help="For historical runs, how many shards are fetched in parallel. Default: 4.")
+    run_parser.add_argument("--pushshift-url", help="For historical runs, a Pushshift-compatible search endpoint or a local NDJSON dump file. Defaults to $PUSHSHIFT_URL or the public Pushshift API.")
+    run_parser.add_argument("--dump", dest='dump_path', metavar='PATH', help="Read posts from a local Pushshift NDJSON dump (plain or .zst) instead of the Reddit API. With -t YEAR only that year is scanned.")
+    run_parser.add_argument("--resume", type=int, nargs='+', metavar='RUN_ID', help="Continue one or more interrupted runs from their last checkpoint.")
     run_parser.add_argument("-t", "--time", default="recent", help="Time period: 'recent' for continuous scanning, or a year (e.g., '2022') for historical.")
 
+    # --- 'watch' command ---
+    watch_parser = subparsers.add_parser('watch', parents=[analysis_options], help='Keep polling subreddits for new posts, adapting to how busy each one is.')
+    watch_parser.add_argument("subreddit", type=str, nargs='*', help="Subreddits to watch. Without any, every previously watched subreddit is resumed.")
+    watch_parser.add_argument("-k", "--keywords", nargs="+", help="Keywords to search for. Needed the first time a subreddit is watched; new keywords start a new run.")
+    watch_parser.add_argument("--jobs", metavar='FILE', help="JSON or YAML file listing subreddits with their own keywords.")
+    watch_parser.add_argument("--min-interval", type=float, default=60, metavar='SECONDS', help="Shortest time between two polls of one subreddit. Default: 60.")
+    watch_parser.add_argument("--max-interval", type=float, default=3600, metavar='SECONDS', help="Longest time between two polls of one subreddit. Default: 3600.")
+    watch_parser.add_argument("--settle-minutes", type=float, default=120, help="Analyze posts once they are this old, so they had time to collect comments. Default: 120.")
+
+    # Filters shared by 'report' and 'search'
+    filter_options = argparse.ArgumentParser(add_help=False)
+    filter_options.add_argument("--run-ids", nargs='+', type=int, help="Filter by specific run IDs (e.g., 1 2 5).")
+    filter_options.add_argument("--runs-after", type=str, help="Filter to runs executed ON or AFTER this date (YYYY-MM-DD).")
+    filter_options.add_argument("--runs-before", type=str, help="Filter to runs executed ON or BEFORE this date (YYYY-MM-DD).")
+    filter_options.add_argument("--posts-after", type=str, help="Filter to posts created ON or AFTER this date (YYYY-MM-DD).")
+    filter_options.add_argument("--posts-before", type=str, help="Filter to posts created ON or BEFORE this date (YYYY-MM-DD).")
+    filter_options.add_argument("--category", dest='category_filter', type=str, help="Filter to one main category. Required for 'subcategory' reports.")
+
     # --- 'report' command ---
-    report_parser = subparsers.add_parser('report', help='Generate reports from the database.')
-    report_parser.add_argument("report_type", choices=['category', 'subcategory', 'subreddit_bias'], help="The type of report to generate.")
-    report_parser.add_argument("--run-ids", nargs='+', type=int, help="Filter by specific run IDs (e.g., 1 2 5).")
-    report_parser.add_argument("--runs-after", type=str, help="Filter to runs executed ON or AFTER this date (YYYY-MM-DD).")
-    report_parser.add_argument("--runs-before", type=str, help="Filter to runs executed ON or BEFORE this date (YYYY-MM-DD).")
-    report_parser.add_argument("--posts-after", type=str, help="Filter to posts created ON or AFTER this date (YYYY-MM-DD).")
-    report_parser.add_argument("--posts-before", type=str, help="Filter to posts created ON or BEFORE this date (YYYY-MM-DD).")
-    report_parser.add_argument("--category", dest='category_filter', type=str, help="For 'subcategory' reports, specify the main category to inspect.")
+    report_parser = subparsers.add_parser('report', parents=[filter_options], help='Generate reports from the database.')
+    report_parser.add_argument("report_type", choices=['category', 'subcategory', 'subreddit_bias', 'keyword', 'prescore', 'duplicates', 'trend', 'top'], help="The type of report to generate.")
+    report_parser.add_argument("--limit", type=int, default=20, help="For 'top' reports, the number of opportunities to show. Default: 20.")
+    _add_output_options(report_parser)
+
+    # --- 'search' command ---
+    search_parser = subparsers.add_parser('search', parents=[filter_options], help='Full-text search over the stored opportunities.')
+    search_parser.add_argument("query", help='Words to find in titles, summaries, pain points, opportunities and automation ideas. Supports "exact phrases", prefix*, AND/OR/NOT and NEAR(...).')
+    search_parser.add_argument("--limit", type=int, default=20, help="The number of best matches to show. Default: 20.")
+    _add_output_options(search_parser)
 
     # --- 'db' command ---
     db_parser = subparsers.add_parser('db', help='Manage the database.')
-    db_parser.add_argument("db_command", choices=['init', 'list_runs'], help="Database command to execute.")
+    db_parser.add_argument("db_command", choices=['init', 'migrate', 'list_runs', 'run_metrics', 'purge_cache', 'check_rollups', 'rebuild_rollups', 'rebuild_search'], help="Database command to execute.")
     db_parser.add_argument("--runs-after", type=str, help="For 'list_runs', filter runs executed ON or AFTER this date (YYYY-MM-DD).")
     db_parser.add_argument("--runs-before", type=str, help="For 'list_runs', filter runs executed ON or BEFORE this date (YYYY-MM-DD).")
+    db_parser.add_argument("--run-ids", nargs='+', type=int, help="For 'run_metrics', the runs to show. Default: all.")
+    _add_output_options(db_parser, "For 'list_runs', the")
 
 
     args = parser.parse_args()
 
+    if args.profile_imports:
+        from src.import_profile import profile_command
+        sys.exit(profile_command(os.path.abspath(__file__), [a for a in sys.argv[1:] if a != "--profile-imports"]))
+
     if args.command == 'db':
         if args.db_command == 'init':
             confirm = input("WARNING: This will delete all existing data in reddit_miner.db. Continue? (y/n): ")
@@ -48,12 +114,40 @@ def main():
                 initialize_db()
             else:
                 print("Database initialization cancelled.")
+        elif args.db_command == 'migrate':
+            version = migrate_db()
+            print(f"Database is at schema version {version}.")
         elif args.db_command == 'list_runs':
-            list_runs(runs_after=args.runs_after, runs_before=args.runs_before)
+            _check_output_options(parser, args)
+            try:
+                list_runs(runs_after=args.runs_after, runs_before=args.runs_before,
+                          output_format=args.format, output_path=args.output)
+            except ImportError as e:
+                parser.error(str(e))
+        elif args.db_command == 'run_metrics':
+            _print_run_metrics(args.run_ids)
+        elif args.db_command == 'purge_cache':
+            deleted = purge_llm_cache()
+            print(f"Removed {deleted} cached LLM results.")
+        elif args.db_command == 'check_rollups':
+            mismatches = check_rollups()
+            if mismatches:
+                print(f"Report rollups are out of sync ({mismatches} mismatching rows). Run 'db rebuild_rollups' to fix them.")
+            else:
+                print("Report rollups match the opportunity tables.")
+        elif args.db_command == 'rebuild_rollups':
+            rebuild_rollups()
+            print("Report rollups rebuilt from the opportunity tables.")
+        elif args.db_command == 'rebuild_search':
+            rebuild_search_index()
+            print("Search index rebuilt from the opportunity tables.")
     
     elif args.command == 'report':
         if args.report_type == 'subcategory' and not args.category_filter:
             parser.error("--category is required for the 'subcategory' report type.")
+        if args.limit < 1:
+            parser.error("--limit must be at least 1.")
+        _check_output_options(parser, args)
         
         filters = {
             'report_type': args.report_type,
@@ -62,66 +156,230 @@ def main():
             'runs_before': args.runs_before,
             'posts_after': args.posts_after,
             'posts_before': args.posts_before,
-            'category_filter': args.category_filter
+            'category_filter': args.category_filter,
+            'limit': args.limit,
+        }
+        try:
+            generate_report(filters, output_format=args.format, output_path=args.output)
+        except ImportError as e:
+            parser.error(str(e))
+
+    elif args.command == 'search':
+        if args.limit < 1:
+            parser.error("--limit must be at least 1.")
+        _check_output_options(parser, args)
+
+        filters = {
+            'run_ids': args.run_ids,
+            'runs_after': args.runs_after,
+            'runs_before': args.runs_before,
+            'posts_after': args.posts_after,
+            'posts_before': args.posts_before,
+            'category_filter': args.category_filter,
         }
-        generate_report(filters)
+        try:
+            search_opportunities(args.query, filters, limit=args.limit, output_format=args.format, output_path=args.output)
+        except (ValueError, ImportError) as e:
+            parser.error(str(e))
+
+    elif args.command in ('run', 'watch'):
+        if args.command == 'run' and not args.resume and not args.jobs and (not args.subreddit or not args.keywords):
+            parser.error("'run' needs a subreddit and -k/--keywords unless --jobs or --resume is given.")
+        if args.command == 'watch' and not 0 < args.min_interval <= args.max_interval:
+            parser.error("--min-interval must be positive and at most --max-interval.")
+        for name in ('prescore_threshold', 'prescore_top', 'near_dup_threshold'):
+            value = getattr(args, name)
+            if value is not None and not 0 <= value <= 1:
+                parser.error(f"--{name.replace('_', '-')} must be between 0 and 1.")
+        if args.comment_cache_hours < 0:
+            parser.error("--comment-cache-hours must not be negative.")
+        metrics.configure(file_path=args.metrics_file, port=args.metrics_port)
+        if args.command == 'run':
+            run_command(args)
+        else:
+            watch_command(args)
+
 
-    elif args.command == 'run':
-        run_command(args)
+def _add_output_options(parser, prefix: str = "The"):
+    parser.add_argument("--format", choices=list(WRITERS), default="table",
+                        help=f"{prefix} output format. 'parquet' and 'arrow' need --output and the 'pyarrow' package. Default: table.")
+    parser.add_argument("--output", type=str, metavar="PATH", help="Write to this file instead of the terminal.")
+
+def _check_output_options(parser, args):
+    if WRITERS[args.format].binary and not args.output:
+        parser.error(f"--format {args.format} needs --output PATH.")
+
+def _build_jobs(args):
+    """Creates or resumes the runs requested on the command line. Returns a list of RunJobs."""
+    if args.resume:
+        return [job for job in (RunJob.resume(run_id, target=args.target) for run_id in args.resume) if job]
+
+    specs = [{"subreddit": subreddit} for subreddit in args.subreddit]
+    if args.jobs:
+        specs.extend(load_jobs_file(args.jobs))
+    jobs = []
+    for spec in specs:
+        keywords = spec.get("keywords") or args.keywords
+        if not keywords:
+            print(f"Skipping r/{spec['subreddit']}: no keywords given.")
+            continue
+        jobs.append(RunJob.create(
+            subreddit=spec["subreddit"],
+            keywords=keywords,
+            time_period=spec.get("time") or args.time,
+            target=spec.get("target") or args.target or 10,
+            dump_path=spec.get("dump") or args.dump_path,
+        ))
+    return jobs
+
+
+def _build_analysis_graph(args, **source_options):
+    from src.analysis_graph import AnalysisGraph
+    return AnalysisGraph(
+        reddit_concurrency=args.reddit_concurrency,
+        llm_concurrency=args.llm_concurrency,
+        use_llm_cache=not args.no_cache,
+        analysis_mode=args.analysis_mode,
+        batch_size=args.batch_size,
+        batch_token_budget=args.batch_token_budget,
+        prompt_token_budget=args.prompt_token_budget,
+        keyword_match=args.keyword_match,
+        prescore_threshold=args.prescore_threshold,
+        prescore_top=args.prescore_top,
+        near_dup_threshold=None if args.no_near_dup else args.near_dup_threshold,
+        pipeline=args.pipeline,
+        queue_size=args.queue_size,
+        comment_cache_hours=args.comment_cache_hours,
+        **source_options,
+    )
+
+
+def _print_run_stats(graph):
+    if graph.llm_analyzer.use_cache:
+        stats = graph.llm_analyzer.cache_stats()
+        print(f"LLM cache: {stats['hits']} hits, {stats['misses']} misses.")
+    outputs = {outcome: metrics.LLM_OUTPUTS.total(outcome=outcome) for outcome in ("repaired", "reasked", "rejected")}
+    if any(outputs.values()):
+        print(f"LLM outputs: {outputs['repaired']:.0f} repaired locally, {outputs['reasked']:.0f} fixed by asking again, "
+              f"{outputs['rejected']:.0f} rejected.")
+    for limiter in (graph.reddit_client.limiter, graph.reddit_client.pushshift_limiter, graph.llm_analyzer.limiter):
+        stats = limiter.stats()
+        if stats['retries']:
+            print(f"{limiter.name}: {stats['retries']} retries, {stats['throttled']} of them after rate limiting.")
+    if graph.pre_scorer is not None:
+        stats = graph.pre_scorer.stats()
+        precision = "n/a" if stats['precision'] is None else f"{stats['precision']:.0%}"
+        print(f"Pre-scorer: skipped {stats['skipped']} of {stats['scored']} posts ({stats['skip_rate']:.0%}); "
+              f"precision of forwarded posts against LLM confidence: {precision}.")
+
+
+def _print_run_metrics(run_ids=None):
+    rows = get_run_metrics(run_ids)
+    if not rows:
+        print("No run metrics found. They are recorded by runs started with this version.")
+        return
+    for run_id, summary, updated_at in rows:
+        print(f"\n--- Run {run_id} (updated {updated_at}, {summary['wall_seconds']:.0f}s since start) ---")
+        print(f"  {'node':<24} {'calls':>6} {'seconds':>9} {'posts in':>9} {'posts out':>10}")
+        for node, stats in summary['nodes'].items():
+            print(f"  {node:<24} {stats['calls']:>6} {stats['seconds']:>9.2f} {stats['posts_in']:>9} {stats['posts_out']:>10}")
+        process = summary['process']
+        for provider in ('reddit', 'pushshift', 'groq'):
+            p = process[provider]
+            if p['calls'] or p['errors']:
+                print(f"  {provider}: {p['calls']} calls in {p['seconds']:.1f}s, waited {p['rate_limit_wait_seconds']:.1f}s "
+                      f"for the rate limiter, {p['retries']:.0f} retries, {p['errors']:.0f} errors")
+        print(f"  LLM tokens: {process['llm_tokens']['input']:.0f} in, {process['llm_tokens']['output']:.0f} out; "
+              f"cache {process['llm_cache']['hits']:.0f} hits, {process['llm_cache']['misses']:.0f} misses")
+        if 'llm_outputs' in process:
+            outputs = process['llm_outputs']
+            print(f"  LLM outputs: {outputs['valid']:.0f} valid, {outputs['repaired']:.0f} repaired locally, "
+                  f"{outputs['reasked']:.0f} fixed by asking again, {outputs['rejected']:.0f} rejected")
+        if 'comment_cache' in process:
+            print(f"  Comment cache: {process['comment_cache']['hits']:.0f} hits, {process['comment_cache']['misses']:.0f} misses")
+        print(f"  Database: {process['db_writes']} writes in {process['db_write_seconds']:.2f}s")
+    print("\nAPI, LLM and database figures cover the whole process the run was part of.")
 
 
 def run_command(args):
-    print("Starting a new Reddit Opportunity Miner run...")
+    scheduler = None
     try:
-        keyword_str = ", ".join(args.keywords)
-        run_id = create_run(subreddit=args.subreddit, keywords=keyword_str)
-        print(f"Created new run with ID: {run_id}. Target: {args.target} new opportunities.")
-        
-        graph = AnalysisGraph()
+        if not args.resume:
+            print("Starting a new Reddit Opportunity Miner run...")
+        jobs = _build_jobs(args)
+        if not jobs:
+            return
         
-        total_new_found = 0
-        after_token = None
-        batch_num = 0
-
-        while total_new_found < args.target:
-            batch_num += 1
-            print(f"\n--- Starting Batch {batch_num} (Found {total_new_found}/{args.target}) ---")
-            
-            initial_state = {
-                "run_id": run_id,
-                "subreddit": args.subreddit,
-                "keywords": args.keywords,
-                "time_period": args.time,
-                "after": after_token,
-                "start_date": "", "end_date": "", "posts": [], "filtered_posts": [],
-                "analysis_results": [], "new_opportunities_count": 0,
-            }
-
-            final_state = graph.run(initial_state)
-            
-            batch_new_count = final_state.get("new_opportunities_count", 0)
-            total_new_found += batch_new_count
-            
-            after_token = final_state.get("after")
-
-            if not after_token:
-                print("--- Reached the end of available posts. Stopping run. ---")
-                break
-            
-            if batch_new_count == 0 and args.time == 'recent':
-                print("--- No new posts found in this batch. Waiting before retrying... ---")
-                time.sleep(60) # Wait a minute if we're scanning for recent posts and find nothing
-
-            time.sleep(2)
-
-        print(f"\n--- Run {run_id} Complete ---")
-        print(f"Target of {args.target} met or exceeded. Found a total of {total_new_found} new opportunities.")
+        graph = _build_analysis_graph(
+            args,
+            backfill_shard=args.shard,
+            backfill_workers=args.backfill_workers,
+            pushshift_url=args.pushshift_url,
+        )
+
+        scheduler = RunScheduler(graph, options={
+            'reanalyze_after_days': args.reanalyze_after_days,
+            'reanalyze_on_prompt_change': args.reanalyze_on_prompt_change,
+        }, parallel_runs=args.parallel_runs)
+        try:
+            scheduler.run(jobs)
+        finally:
+            # Also on Ctrl-C: saves the posts still queued in the streaming pipeline and the final metrics.
+            graph.close()
+
+        for job in jobs:
+            if job.done:
+                print(f"\n--- Run {job.run_id} Complete ---")
+                print(f"Target of {job.checkpoint['target']} met or exceeded for r/{job.checkpoint['subreddit']}. "
+                      f"Found a total of {job.checkpoint['total_new_found']} new opportunities.")
+        _print_run_stats(graph)
         
-        print("\nFinal analysis for this run:")
-        generate_report(filters={'report_type': 'category', 'run_ids': [run_id]})
+        completed = [job.run_id for job in jobs if job.done]
+        if completed:
+            print("\nFinal analysis for this run:" if len(jobs) == 1 else "\nFinal analysis for these runs:")
+            generate_report(filters={'report_type': 'category', 'run_ids': completed})
+        if scheduler.unfinished_run_ids():
+            print(f"Continue the unfinished runs with: python main.py run --resume {' '.join(map(str, scheduler.unfinished_run_ids()))}")
 
+    except KeyboardInterrupt:
+        unfinished = scheduler.unfinished_run_ids() if scheduler else []
+        if unfinished:
+            print(f"\nInterrupted. Continue with: python main.py run --resume {' '.join(map(str, unfinished))}")
     except Exception as e:
         print(f"An error occurred during the run: {e}")
+        if scheduler and scheduler.unfinished_run_ids():
+            print(f"Continue it with: python main.py run --resume {' '.join(map(str, scheduler.unfinished_run_ids()))}")
+
+
+def watch_command(args):
+    specs = [{"subreddit": subreddit} for subreddit in args.subreddit]
+    if args.jobs:
+        specs.extend(load_jobs_file(args.jobs))
+    if not specs:
+        specs = [{"subreddit": state['subreddit']} for state in list_watch_states()]
+        if not specs:
+            print("No subreddits to watch. Start with: python main.py watch <subreddit> -k <keywords>")
+            return
+    jobs = [job for job in (WatchJob.load(spec["subreddit"], spec.get("keywords") or args.keywords) for spec in specs) if job]
+    if not jobs:
+        return
+
+    graph = _build_analysis_graph(args)
+    scheduler = WatchScheduler(graph, options={
+        'reanalyze_after_days': args.reanalyze_after_days,
+        'reanalyze_on_prompt_change': args.reanalyze_on_prompt_change,
+        'min_interval': args.min_interval,
+        'max_interval': args.max_interval,
+        'settle_seconds': args.settle_minutes * 60,
+    }, parallel_runs=args.parallel_runs)
+    try:
+        scheduler.run(jobs)
+    except KeyboardInterrupt:
+        print("\nStopped watching. Run 'python main.py watch' to continue where it left off.")
+    finally:
+        # Saves the posts still queued in the streaming pipeline and the final metrics.
+        graph.close()
+    _print_run_stats(graph)
 
 
 if __name__ == "__main__":
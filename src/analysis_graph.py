@@ -1,11 +1,28 @@
 from langgraph.graph import StateGraph, END
-from typing import TypedDict, List, Any
-from datetime import datetime
+from typing import TypedDict, List, Any, Optional
+from datetime import datetime, timedelta
 from .reddit_client import RedditClient
 from .llm_analyzer import LLMAnalyzer
-from . import database
+from .prompt_packer import PromptPacker
+from .backfill import HistoricalBackfill, created_ts, make_time_shards
+from .dump_reader import DumpScanner
+from .keyword_matcher import KeywordMatcher
+from .pre_scorer import PreScorer
+from .rate_limiter import CallFailure
+from .near_dup import BatchIndex, band_buckets, minhash, post_text
+from .streaming import StreamingPipeline
+from itertools import islice
+from . import database, metrics
 from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
 import json
+import time
+
+# How often a post that failed analysis with a transient error is requeued within its batch before it is dropped.
+MAX_ANALYSIS_PASSES = 3
+# Pages of 100 posts one watch poll may fetch; a busier subreddit catches up on the next poll.
+WATCH_MAX_PAGES = 5
 
 class GraphState(TypedDict):
     run_id: int
@@ -19,53 +36,140 @@ class GraphState(TypedDict):
     analysis_results: List[dict]
     after: str 
     new_opportunities_count: int
+    reanalyze_after_days: Optional[int]
+    reanalyze_on_prompt_change: bool
+    linked_opportunities_count: int
+    dump_path: Optional[str]
+    near_duplicates: List[dict]
+    watch: Optional[dict]
+    ticket: Any
 
 class AnalysisGraph:
-    def __init__(self):
-        self.reddit_client = RedditClient()
-        self.llm_analyzer = LLMAnalyzer()
+    def __init__(self, reddit_concurrency: int = 4, llm_concurrency: int = 4, use_llm_cache: bool = True,
+                 analysis_mode: str = "single", batch_size: int = 5, batch_token_budget: int = 12000,
+                 prompt_token_budget: int = 3000, backfill_shard: str = "month", backfill_workers: int = 4,
+                 pushshift_url: str = None, keyword_match: str = "substring",
+                 prescore_threshold: float = None, prescore_top: float = None,
+                 near_dup_threshold: Optional[float] = 0.8, pipeline: str = "batch", queue_size: int = 200,
+                 comment_cache_hours: float = 24):
+        self.reddit_client = RedditClient(pushshift_url=pushshift_url, pool_size=max(1, reddit_concurrency),
+                                          comment_cache_hours=comment_cache_hours)
+        self.llm_analyzer = LLMAnalyzer(use_cache=use_llm_cache)
+        self.prompt_packer = PromptPacker(token_budget=prompt_token_budget)
+        self.backfill_shard = backfill_shard
+        self.backfill_workers = backfill_workers
+        # Open historical backfills and dump scans by run_id; each graph invocation takes the next page.
+        self._sources = {}
+        self.keyword_match = keyword_match
+        # Compiled keyword matchers by keyword list, built once per run rather than per batch.
+        self._matchers = {}
+        # Estimated Jaccard similarity at which a post reuses another post's analysis; None disables the check.
+        self.near_dup_threshold = near_dup_threshold
+        self.pre_scorer = None
+        if prescore_threshold is not None or prescore_top is not None:
+            self.pre_scorer = PreScorer(threshold=prescore_threshold, top_fraction=prescore_top)
+            training = self.pre_scorer.train(database.get_prescore_training_rows())
+            if training is None:
+                print("Pre-scorer: not enough analyzed posts to train on yet, using heuristics only.")
+            else:
+                precision = "n/a" if training["precision"] is None else f"{training['precision']:.0%}"
+                print(f"Pre-scorer: trained on {training['rows']} analyzed posts; on held-out posts it would forward "
+                      f"{training['forwarded']:.0%} with precision {precision} (base rate {training['base_rate']:.0%}).")
+        self.analysis_mode = analysis_mode
+        self.batch_size = max(1, batch_size)
+        self.batch_token_budget = batch_token_budget
+        # Separate limits so a slow provider cannot starve the other one of workers.
+        self.reddit_concurrency = max(1, reddit_concurrency)
+        self.llm_concurrency = max(1, llm_concurrency)
+        self._reddit_slots = threading.BoundedSemaphore(self.reddit_concurrency)
+        self._llm_slots = threading.BoundedSemaphore(self.llm_concurrency)
+        # 'streaming' analyzes and saves posts in the background while the next page is fetched.
+        self.streaming = None
+        if pipeline == "streaming":
+            self.streaming = StreamingPipeline(self, queue_size=queue_size, max_attempts=MAX_ANALYSIS_PASSES)
         self.workflow = self._build_graph()
 
     def _build_graph(self):
         builder = StateGraph(GraphState)
 
-        builder.add_node("route_data_source", self.route_data_source)
-        builder.add_node("fetch_new_posts", self.fetch_new_posts)
-        builder.add_node("fetch_historical_posts", self.fetch_historical_posts)
-        builder.add_node("filter_posts", self.filter_posts)
-        builder.add_node("analyze_posts", self.analyze_posts)
-        builder.add_node("save_to_database", self.save_to_database)
+        # Every node is timed, along with the posts it takes in and passes on (state keys).
+        nodes = [
+            ("route_data_source", self.route_data_source, None, None),
+            ("fetch_new_posts", self.fetch_new_posts, None, "posts"),
+            ("fetch_historical_posts", self.fetch_historical_posts, None, "posts"),
+            ("fetch_dump_posts", self.fetch_dump_posts, None, "posts"),
+            ("fetch_watch_posts", self.fetch_watch_posts, None, "posts"),
+            ("filter_posts", self.filter_posts, "posts", "filtered_posts"),
+            ("dedup_posts", self.dedup_posts, "filtered_posts", "filtered_posts"),
+            ("prescore_posts", self.prescore_posts, "filtered_posts", "filtered_posts"),
+            ("analyze_posts", self.analyze_posts, "filtered_posts", "analysis_results"),
+            ("stream_posts", self.stream_posts, "filtered_posts", None),
+            ("save_to_database", self.save_to_database, "analysis_results", "new_opportunities_count"),
+        ]
+        for name, node, in_key, out_key in nodes:
+            builder.add_node(name, self._instrumented(name, node, in_key, out_key))
 
         builder.set_entry_point("route_data_source")
 
         builder.add_conditional_edges(
             "route_data_source",
             self.decide_data_source,
-            {"recent": "fetch_new_posts", "historical": "fetch_historical_posts"},
+            {"recent": "fetch_new_posts", "historical": "fetch_historical_posts", "dump": "fetch_dump_posts",
+             "watch": "fetch_watch_posts"},
         )
 
         builder.add_edge("fetch_new_posts", "filter_posts")
         builder.add_edge("fetch_historical_posts", "filter_posts")
-        builder.add_edge("filter_posts", "analyze_posts")
+        builder.add_edge("fetch_dump_posts", "filter_posts")
+        builder.add_edge("fetch_watch_posts", "filter_posts")
+        builder.add_edge("filter_posts", "dedup_posts")
+        builder.add_edge("dedup_posts", "prescore_posts")
+        builder.add_conditional_edges(
+            "prescore_posts",
+            lambda state: "streaming" if self.streaming is not None else "batch",
+            {"batch": "analyze_posts", "streaming": "stream_posts"},
+        )
+        builder.add_edge("stream_posts", END)
         builder.add_edge("analyze_posts", "save_to_database")
         builder.add_edge("save_to_database", END)
 
         return builder.compile()
 
+    @staticmethod
+    def _instrumented(name: str, node, in_key: Optional[str], out_key: Optional[str]):
+        def count(state, key):
+            if key is None:
+                return None
+            value = state.get(key)
+            return value if isinstance(value, int) else len(value or [])
+
+        def run_node(state: GraphState):
+            posts_in = count(state, in_key)
+            start = time.perf_counter()
+            result = node(state)
+            metrics.record_node(state["run_id"], name, time.perf_counter() - start, posts_in, count(result, out_key))
+            return result
+        return run_node
+
     def decide_data_source(self, state: GraphState):
-        if state["time_period"] == "recent":
-            return "recent"
+        if state["time_period"] in ("recent", "dump", "watch"):
+            return state["time_period"]
         return "historical"
 
     def route_data_source(self, state: GraphState):
         print("---ROUTING DATA SOURCE---")
         if any(char.isdigit() for char in state["time_period"]):
-            state["time_period"] = "historical"
             year = int(''.join(filter(str.isdigit, state["time_period"])))
+            state["time_period"] = "historical"
             state["start_date"] = f"{year}-01-01"
             state["end_date"] = f"{year}-12-31"
         else:
             state["time_period"] = "recent"
+        if state.get("dump_path"):
+            # A dump can be scanned for a given year or, with 'recent', across its whole time span.
+            state["time_period"] = "dump"
+        if state.get("watch") is not None:
+            state["time_period"] = "watch"
         return state
 
     def fetch_new_posts(self, state: GraphState):
@@ -77,37 +181,142 @@ class AnalysisGraph:
         )
         print(f"Fetched {len(posts_praw)} posts.")
         
-        # Extract required data, including the creation timestamp
-        posts_data = [
-            {
-                "id": p.id, "title": p.title, "selftext": p.selftext, 
-                "score": p.score, "num_comments": p.num_comments, "url": p.url,
-                "created_utc": datetime.fromtimestamp(p.created_utc) # Convert to datetime
-            } 
-            for p in posts_praw
-        ]
-        state["posts"] = posts_data
+        state["posts"] = [self._praw_post_data(p) for p in posts_praw]
         state["after"] = after_token
         return state
 
-    def fetch_historical_posts(self, state: GraphState):
-        print(f"---FETCHING HISTORICAL POSTS for r/{state['subreddit']}---")
-        posts_pushshift = self.reddit_client.get_historical_posts(
-            state["subreddit"], state["keywords"], state["start_date"], state["end_date"]
+    @staticmethod
+    def _praw_post_data(p) -> dict:
+        # Extract required data, including the creation timestamp
+        return {
+            "id": p.id, "title": p.title, "selftext": p.selftext,
+            "score": p.score, "num_comments": p.num_comments, "url": p.url,
+            "created_utc": datetime.fromtimestamp(p.created_utc) # Convert to datetime
+        }
+
+    def fetch_watch_posts(self, state: GraphState):
+        """
+        Polls for posts newer than the watch cursor, the newest post seen so far. Posts younger than
+        `settle_seconds` have had no time to collect comments, so they wait in state["watch"]["pending"]
+        and are fetched again, with their current comment counts, once they are old enough.
+        Reports what it saw back in state["watch"].
+        """
+        watch = dict(state["watch"])
+        print(f"---POLLING r/{state['subreddit']} FOR NEW POSTS---")
+        posts_praw = self.reddit_client.get_posts_before(
+            state["subreddit"], before=watch.get("before_fullname"), limit=100, max_pages=WATCH_MAX_PAGES
         )
-        
-        # Extract and convert timestamp
-        posts_data = [
-            {
-                "id": p.get("id"), "title": p.get("title"), "selftext": p.get("selftext"),
-                "score": p.get("score"), "num_comments": p.get("num_comments"), "url": p.get("full_link"),
-                "created_utc": datetime.fromtimestamp(p.get("created_utc")) # Convert to datetime
-            }
-            for p in posts_pushshift
-        ]
-        state["posts"] = posts_data
+
+        newer = posts_praw
+        if not watch.get("before_fullname") and watch.get("before_created"):
+            # An unanchored poll returns the newest page, which may reach back past the cursor.
+            newer = [p for p in posts_praw if p.created_utc > watch["before_created"]]
+        if newer:
+            watch["before_fullname"] = newer[0].fullname
+            watch["before_created"] = newer[0].created_utc
+
+        settled_before = time.time() - watch.get("settle_seconds", 0)
+        pending = list(watch.get("pending") or [])
+        waiting = {fullname for fullname, _ in pending}
+        ready = []
+        for p in newer:
+            if p.fullname in waiting:
+                continue
+            if p.created_utc <= settled_before:
+                ready.append(p)
+            else:
+                pending.append([p.fullname, p.created_utc])
+        due = [fullname for fullname, created in pending if created <= settled_before]
+        if due:
+            ready.extend(self.reddit_client.get_posts_by_fullname(due))
+        pending = [[fullname, created] for fullname, created in pending if created > settled_before]
+
+        watch["pending"] = pending
+        watch["arrivals"] = len(newer)
+        watch["span_seconds"] = newer[0].created_utc - newer[-1].created_utc if len(newer) > 1 else None
+        watch["full"] = len(posts_praw) >= 100 * WATCH_MAX_PAGES
+        print(f"Fetched {len(newer)} new posts; {len(ready)} ready for analysis, {len(pending)} still collecting comments.")
+
+        state["posts"] = [self._praw_post_data(p) for p in ready]
+        state["after"] = None
+        state["watch"] = watch
         return state
 
+    def _take_page(self, state: GraphState, prefix: str, make_iterator, page_size: int):
+        """
+        Takes the next page of posts from a long-running source kept open across graph invocations.
+        The 'after' cursor is "<prefix>:<posts already handed out>"; the sources yield posts in a
+        stable order, so a resumed run in a new process skips that many posts.
+        Returns (posts, next_cursor or None when the source is exhausted).
+        """
+        cursor = state.get("after") or ""
+        offset = int(cursor.split(":", 1)[1]) if cursor.startswith(f"{prefix}:") else 0
+
+        source = self._sources.get(state["run_id"])
+        if source is None:
+            source = {"iterator": make_iterator(), "position": 0}
+            self._sources[state["run_id"]] = source
+        if offset > source["position"]:
+            source["position"] += sum(1 for _ in islice(source["iterator"], offset - source["position"]))
+
+        posts = list(islice(source["iterator"], page_size))
+        source["position"] += len(posts)
+        if len(posts) < page_size:
+            self.close_source(state["run_id"])
+            return posts, None
+        return posts, f"{prefix}:{source['position']}"
+
+    def close_source(self, run_id: int):
+        """Stops a run's open backfill or dump scan, cancelling historical shards it has not fetched yet."""
+        source = self._sources.pop(run_id, None)
+        if source is not None:
+            source["iterator"].close()
+
+    @staticmethod
+    def _pushshift_post_data(p: dict) -> dict:
+        return {
+            "id": p.get("id"), "title": p.get("title"), "selftext": p.get("selftext"),
+            "score": p.get("score"), "num_comments": p.get("num_comments"),
+            "url": p.get("full_link") or (f"https://www.reddit.com{p['permalink']}" if p.get("permalink") else None),
+            "created_utc": datetime.fromtimestamp(created_ts(p)) # Convert to datetime
+        }
+
+    def fetch_historical_posts(self, state: GraphState, page_size: int = 100):
+        print(f"---FETCHING HISTORICAL POSTS for r/{state['subreddit']}---")
+        posts_pushshift, state["after"] = self._take_page(state, "backfill", lambda: iter(HistoricalBackfill(
+            self.reddit_client, state["subreddit"], state["keywords"], state["start_date"], state["end_date"],
+            shard=self.backfill_shard, workers=self.backfill_workers, keyword_match=self.keyword_match
+        )), page_size)
+        print(f"Fetched {len(posts_pushshift)} posts.")
+
+        state["posts"] = [self._pushshift_post_data(p) for p in posts_pushshift]
+        return state
+
+    def fetch_dump_posts(self, state: GraphState, page_size: int = 100):
+        print(f"---SCANNING DUMP {state['dump_path']} for r/{state['subreddit']}---")
+
+        def make_iterator():
+            start_ts = end_ts = None
+            if state["start_date"]:
+                shards = make_time_shards(state["start_date"], state["end_date"])
+                start_ts, end_ts = shards[0][0], shards[-1][1]
+            return iter(DumpScanner(
+                state["dump_path"], subreddit=state["subreddit"], keywords=state["keywords"],
+                start_ts=start_ts, end_ts=end_ts, keyword_match=self.keyword_match,
+            ))
+
+        posts_dump, state["after"] = self._take_page(state, "dump", make_iterator, page_size)
+        print(f"Matched {len(posts_dump)} posts.")
+
+        state["posts"] = [self._pushshift_post_data(p) for p in posts_dump]
+        return state
+
+    def _keyword_matcher(self, keywords: List[str]) -> KeywordMatcher:
+        key = tuple(keywords or [])
+        if key not in self._matchers:
+            self._matchers[key] = KeywordMatcher(list(key), mode=self.keyword_match)
+        return self._matchers[key]
+
     def filter_posts(self, state: GraphState):
         print("---FILTERING POSTS---")
         
@@ -116,68 +325,288 @@ class AnalysisGraph:
             if p.get("num_comments", 0) > 5
         ]
         
-        if state["time_period"] == "recent":
-            keywords = [k.lower() for k in state["keywords"]]
-            filtered = [
-                p for p in filtered
-                if any(k in p.get("title", "").lower() or k in p.get("selftext", "").lower() for k in keywords)
-            ]
+        # Historical sources search by keyword server-side, but with their own matching rules;
+        # every source goes through the same matcher so the stored matched keywords are consistent.
+        matcher = self._keyword_matcher(state["keywords"])
+        matched = []
+        for p in filtered:
+            p["matched_keywords"] = matcher.find(f"{p.get('title') or ''}\n{p.get('selftext') or ''}")
+            if p["matched_keywords"]:
+                matched.append(p)
+        filtered = matched
 
         print(f"Found {len(state['posts'])} posts, filtered down to {len(filtered)}.")
         state["filtered_posts"] = filtered
         return state
 
+    def dedup_posts(self, state: GraphState):
+        print("---CHECKING FOR ALREADY ANALYZED POSTS---")
+        filtered = state["filtered_posts"]
+        known = database.find_known_opportunities(filtered)
+
+        max_age_days = state.get("reanalyze_after_days")
+        cutoff = None
+        if max_age_days is not None:
+            # analyzed_at is written by SQLite's CURRENT_TIMESTAMP, i.e. UTC 'YYYY-MM-DD HH:MM:SS'
+            cutoff = (datetime.utcnow() - timedelta(days=max_age_days)).strftime("%Y-%m-%d %H:%M:%S")
+        check_prompt = state.get("reanalyze_on_prompt_change", False)
+
+        to_analyze = []
+        known_ids = []
+        for post in filtered:
+            row = known.get(post.get("id") or post.get("url"))
+            if row is None:
+                to_analyze.append(post)
+            elif cutoff is not None and (row["analyzed_at"] is None or str(row["analyzed_at"]) < cutoff):
+                to_analyze.append(post)
+            elif check_prompt and row["prompt_version"] != self.llm_analyzer.prompt_version:
+                to_analyze.append(post)
+            else:
+                known_ids.append(row["opportunity_id"])
+
+        linked = database.link_opportunities(state["run_id"], known_ids)
+        state["near_duplicates"] = []
+        if self.near_dup_threshold is not None and to_analyze:
+            to_analyze, alias_links = self._drop_near_duplicates(state, to_analyze)
+            linked += alias_links
+        print(f"{len(known_ids)} posts already analyzed ({linked} newly linked to this run), "
+              f"{len(to_analyze)} left to analyze.")
+        state["filtered_posts"] = to_analyze
+        state["linked_opportunities_count"] = linked
+        return state
+
+    def _drop_near_duplicates(self, state: GraphState, posts: List[dict]):
+        """
+        Takes near-duplicates (reposts, crossposts, reworded questions) out of the posts to analyze.
+        Duplicates of a stored opportunity reuse its analysis right away; duplicates of another post
+        in this batch are recorded in state["near_duplicates"] and attached after the batch is saved.
+        Returns (posts to analyze, new run links).
+        """
+        for post in posts:
+            post["minhash"] = minhash(post_text(post))
+        stored = database.find_near_duplicate_opportunities(
+            {post["id"]: post["minhash"] for post in posts if post["minhash"]}, self.near_dup_threshold
+        )
+
+        batch_index = BatchIndex()
+        to_analyze, aliases, pending = [], [], []
+        for post in posts:
+            signature = post["minhash"]
+            if signature is None:
+                to_analyze.append(post)
+                continue
+            if post["id"] in stored:
+                opportunity_id, score = stored[post["id"]]
+                aliases.append({"url": post.get("url"), "post_id": post["id"], "opportunity_id": opportunity_id, "similarity": score})
+                continue
+            buckets = band_buckets(signature)
+            match = batch_index.find(signature, buckets, self.near_dup_threshold)
+            if match is not None:
+                canonical, score = match
+                pending.append({"url": post.get("url"), "post_id": post["id"], "canonical_url": canonical.get("url"), "similarity": score})
+                continue
+            batch_index.add(post, signature, buckets)
+            to_analyze.append(post)
+
+        linked = database.add_opportunity_aliases(state["run_id"], aliases)
+        if aliases or pending:
+            print(f"{len(aliases)} near-duplicates of stored posts reuse their analysis; "
+                  f"{len(pending)} near-duplicates within this batch wait for their canonical post.")
+        state["near_duplicates"] = pending
+        return to_analyze, linked
+
+    def prescore_posts(self, state: GraphState):
+        # Runs before any comments are fetched, so skipped posts cost neither Reddit nor LLM calls.
+        if self.pre_scorer is None or not state["filtered_posts"]:
+            return state
+        print("---PRE-SCORING POSTS---")
+        forwarded, skipped = self.pre_scorer.select(state["filtered_posts"])
+        print(f"Forwarding {len(forwarded)} posts to the LLM, skipped {len(skipped)} low-scoring posts.")
+        state["filtered_posts"] = forwarded
+        return state
+
     def analyze_posts(self, state: GraphState):
         print("---ANALYZING POSTS WITH LLM---")
-        results = []
-        if not state["filtered_posts"]:
+        posts = state["filtered_posts"]
+        if not posts:
             state["analysis_results"] = []
             return state
 
-        for post in tqdm(state["filtered_posts"], desc="Analyzing Posts"):
-            try:
-                comments_praw = self.reddit_client.get_comments(post["id"])
-                comment_bodies = [c.body for c in comments_praw]
-                
+        # Posts that still fail with a transient error after the rate limiter's retries go back into the
+        # queue for another pass; each pass waits behind the limiter's backoff. Other failures (bad requests,
+        # rejected model output) would fail the same way again and are dropped right away.
+        results = [None] * len(posts)
+        pending = list(range(len(posts)))
+        for attempt in range(MAX_ANALYSIS_PASSES):
+            if attempt:
+                print(f"Requeued {len(pending)} posts that could not be analyzed (pass {attempt + 1}/{MAX_ANALYSIS_PASSES}).")
+            batch = [posts[i] for i in pending]
+            if self.analysis_mode == "batch":
+                batch_results = self._analyze_posts_batched(batch)
+            else:
+                batch_results = self._analyze_posts_individually(batch)
+            for i, result in zip(pending, batch_results):
+                results[i] = result
+            pending = [i for i in pending if isinstance(results[i], CallFailure) and results[i].retryable]
+            if not pending:
+                break
+        if pending:
+            print(f"Giving up on {len(pending)} posts after {MAX_ANALYSIS_PASSES} passes.")
+        dropped = sum(isinstance(r, CallFailure) and not r.retryable for r in results)
+        if dropped:
+            print(f"Dropped {dropped} posts that failed with errors a retry would not fix.")
+
+        state["analysis_results"] = [r for r in results if not isinstance(r, CallFailure)]
+        if self.pre_scorer is not None:
+            self.pre_scorer.record_outcomes(state["analysis_results"])
+        sent = sum(r["input_tokens"] for r in state["analysis_results"])
+        untrimmed = sum(r["input_tokens_untrimmed"] for r in state["analysis_results"])
+        print(f"Sent ~{sent} post/comment tokens for {len(state['analysis_results'])} posts (~{untrimmed} before trimming).")
+        return state
+
+    def stream_posts(self, state: GraphState):
+        """Hands the posts to the streaming pipeline, which saves each result as soon as it is ready."""
+        print(f"---QUEUING {len(state['filtered_posts'])} POSTS FOR ANALYSIS---")
+        state["ticket"] = self.streaming.submit(state["run_id"], state["filtered_posts"], state.get("near_duplicates"))
+        state["analysis_results"] = []
+        # Posts linked to already stored opportunities count right away; new ones once the ticket completes.
+        state["new_opportunities_count"] = state.get("linked_opportunities_count", 0)
+        return state
+
+    def _analyze_posts_individually(self, posts: List[dict]) -> list:
+        # Results are slotted back by index so save_to_database sees the same order as the input.
+        results = [None] * len(posts)
+        workers = self.reddit_concurrency + self.llm_concurrency
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self._analyze_single_post, post): i for i, post in enumerate(posts)}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Analyzing Posts"):
+                results[futures[future]] = future.result()
+        return results
+
+    def _analyze_posts_batched(self, posts: List[dict], progress: bool = True) -> list:
+        """Returns, in input order, the database record of each post or the CallFailure that ended it."""
+        # Comments of the whole batch in one pass: cached threads first, the rest fetched concurrently.
+        index = {post["id"]: i for i, post in enumerate(posts)}
+        packed = [None] * len(posts)
+        errors = {}
+        fetches = self.reddit_client.iter_comments([{"id": post["id"], "num_comments": post.get("num_comments")} for post in posts])
+        for post_id, comments, error in tqdm(fetches, total=len(posts), desc="Fetching Comments", disable=not progress):
+            post = posts[index[post_id]]
+            if error is not None:
+                print(f"Could not fetch comments for post {post_id}: {error}")
+                errors[post_id] = error
+                continue
+            packed[index[post_id]] = self.prompt_packer.pack(post["title"], post.get("selftext", ""), comments)
+
+        batch_input = [
+            {"post_id": post["id"], "post_title": p["title"], "post_body": p["body"], "comments": p["comments"]}
+            for post, p in zip(posts, packed) if p is not None
+        ]
+        batches = self.llm_analyzer.pack_batches(batch_input, self.batch_size, self.batch_token_budget)
+
+        analyses = {}
+        with ThreadPoolExecutor(max_workers=self.llm_concurrency) as executor:
+            futures = {executor.submit(self.llm_analyzer.analyze_posts_batch, batch, errors): batch for batch in batches}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Analyzing Batches", disable=not progress):
+                # A failing batch only loses its own posts, not the results of the others.
+                try:
+                    analyses.update(future.result())
+                except Exception as e:
+                    print(f"Could not analyze a batch of {len(futures[future])} posts: {e}")
+                    for item in futures[future]:
+                        errors.setdefault(item["post_id"], e)
+
+        return [
+            self._to_db_record(post, analyses[post["id"]], p) if post["id"] in analyses
+            else CallFailure(errors.get(post["id"]) or RuntimeError("The model returned no analysis."))
+            for post, p in zip(posts, packed)
+        ]
+
+    def _fetch_comments(self, post: dict) -> List[dict]:
+        with self._reddit_slots:
+            return self.reddit_client.get_comments(post["id"], num_comments=post.get("num_comments"))
+
+    def _analyze_single_post(self, post: dict):
+        """
+        Fetches comments, fits the post into the prompt token budget and runs the LLM for one post.
+        Returns the analysis dict ready for the database, or the CallFailure that ended it.
+        """
+        try:
+            packed = self.prompt_packer.pack(post["title"], post.get("selftext", ""), self._fetch_comments(post))
+
+            with self._llm_slots:
                 analysis_dict = self.llm_analyzer.analyze_post(
-                    post_title=post["title"],
-                    post_body=post.get("selftext", ""),
-                    comments=comment_bodies
+                    post_title=packed["title"],
+                    post_body=packed["body"],
+                    comments=packed["comments"]
                 )
-                
-                # Add post metadata to the analysis results
-                analysis_dict['url'] = post.get("url")
-                analysis_dict['title'] = post.get("title")
-                analysis_dict['post_created_utc'] = post.get("created_utc") # Pass date through
-
-                # Convert lists to JSON strings for DB storage
-                analysis_dict['pain_points'] = json.dumps(analysis_dict.get('pain_points', []))
-                analysis_dict['business_opportunities'] = json.dumps(analysis_dict.get('business_opportunities', []))
-                analysis_dict['automation_ideas'] = json.dumps(analysis_dict.get('automation_ideas', []))
-
-                results.append(analysis_dict)
-            except Exception as e:
-                print(f"Could not analyze or parse post {post.get('id')}: {e}")
-        state["analysis_results"] = results
-        return state
+
+            return self._to_db_record(post, analysis_dict, packed)
+        except Exception as e:
+            print(f"Could not analyze or parse post {post.get('id')}: {e}")
+            return CallFailure(e)
+
+    def _to_db_record(self, post: dict, analysis_dict: dict, packed: dict) -> dict:
+        analysis_dict = dict(analysis_dict)
+
+        # Add post metadata to the analysis results
+        analysis_dict['url'] = post.get("url")
+        analysis_dict['post_id'] = post.get("id")
+        analysis_dict['title'] = post.get("title")
+        analysis_dict['post_created_utc'] = post.get("created_utc") # Pass date through
+        analysis_dict['prompt_version'] = self.llm_analyzer.prompt_version
+        analysis_dict['input_tokens'] = packed["input_tokens"]
+        analysis_dict['input_tokens_untrimmed'] = packed["input_tokens_untrimmed"]
+        analysis_dict['matched_keywords'] = json.dumps(post.get("matched_keywords", []))
+        analysis_dict['prescore'] = post.get("prescore")
+        analysis_dict['minhash'] = post.get("minhash")
+
+        # Convert lists to JSON strings for DB storage
+        analysis_dict['pain_points'] = json.dumps(analysis_dict.get('pain_points', []))
+        analysis_dict['business_opportunities'] = json.dumps(analysis_dict.get('business_opportunities', []))
+        analysis_dict['automation_ideas'] = json.dumps(analysis_dict.get('automation_ideas', []))
+
+        return analysis_dict
 
     def save_to_database(self, state: GraphState):
         print("---SAVING RESULTS TO DATABASE---")
+        linked_count = state.get("linked_opportunities_count", 0)
         if not state["analysis_results"]:
             print("No results to save.")
-            state["new_opportunities_count"] = 0
+            state["new_opportunities_count"] = linked_count
             return state
         
         run_id = state["run_id"]
-        new_count = 0
-        for result in tqdm(state["analysis_results"], desc="Saving to DB"):
-            is_new = database.insert_opportunity(run_id, result)
-            if is_new:
-                new_count += 1
+        statuses = database.insert_opportunities(run_id, state["analysis_results"])
+        new_count = sum(statuses)
+        # Duplicates within the batch point at their canonical post, which now has an opportunity ID.
+        database.add_opportunity_aliases(run_id, state.get("near_duplicates") or [])
         
         print(f"Saved {new_count} new opportunities to the database for run ID {run_id}.")
-        state["new_opportunities_count"] = new_count
+        state["new_opportunities_count"] = new_count + linked_count
         return state
 
     def run(self, initial_state: dict):
-        return self.workflow.invoke(initial_state)
+        try:
+            return self.workflow.invoke(initial_state)
+        finally:
+            self._save_metrics([initial_state["run_id"]])
+
+    @staticmethod
+    def _save_metrics(run_ids: List[int]):
+        """Updates the runs' metrics summaries and the metrics file."""
+        try:
+            for run_id in run_ids:
+                database.save_run_metrics(run_id, metrics.run_summary(run_id))
+            metrics.export()
+        except Exception as e:
+            print(f"Could not save metrics: {e}")
+
+    def close(self):
+        """Stops the open historical sources and waits for posts still in the streaming pipeline to be analyzed and saved."""
+        for run_id in list(self._sources):
+            self.close_source(run_id)
+        if self.streaming is not None:
+            self.streaming.close()
+            # The writer kept saving after the last batch returned; bring the summaries up to date.
+            self._save_metrics(metrics.run_ids())
@@ -0,0 +1,131 @@
+import calendar
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Iterator, List, Tuple
+from .dump_reader import DumpScanner
+
+
+def _to_epoch(day: datetime) -> int:
+    return calendar.timegm(day.timetuple())
+
+
+def created_ts(post: dict, default: int = 0) -> int:
+    """created_utc as epoch seconds; dumps store it as int, float or string depending on the year."""
+    try:
+        return int(float(post.get("created_utc")))
+    except (TypeError, ValueError):
+        return default
+
+
+def make_time_shards(start_date: str, end_date: str, granularity: str = "month") -> List[Tuple[int, int]]:
+    """
+    Splits the inclusive date range [start_date, end_date] (YYYY-MM-DD) into
+    consecutive (after_ts, before_ts) epoch-second windows of a month or a week, in UTC.
+    """
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    end = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
+
+    shards = []
+    shard_start = start
+    while shard_start < end:
+        if granularity == "week":
+            shard_end = shard_start + timedelta(days=7)
+        elif granularity == "month":
+            year, month = divmod(shard_start.month, 12)
+            shard_end = datetime(shard_start.year + year, month + 1, 1)
+        else:
+            raise ValueError(f"Unknown shard granularity: {granularity}")
+        shard_end = min(shard_end, end)
+        shards.append((_to_epoch(shard_start), _to_epoch(shard_end)))
+        shard_start = shard_end
+    return shards
+
+
+class HistoricalBackfill:
+    """
+    Pages through a date range of a subreddit's submissions on a Pushshift-compatible source.
+    The range is split into time shards that are fetched concurrently by a bounded worker pool, at
+    most `workers` shards ahead of the consumer; posts are yielded shard by shard (oldest shard first)
+    and de-duplicated by post ID, so the output order is stable across restarts. Closing the iterator
+    cancels the shards not yet fetched.
+    When the source is a local NDJSON dump (plain or .zst) instead of a URL, the dump is scanned once.
+    """
+    def __init__(self, reddit_client, subreddit: str, keywords: list, start_date: str, end_date: str,
+                 shard: str = "month", workers: int = 4, page_size: int = 100, keyword_match: str = "substring"):
+        self.reddit_client = reddit_client
+        self.subreddit = subreddit
+        self.keywords = keywords
+        self.keyword_match = keyword_match
+        # Pushshift's q searches whole words, which would drop the inflections 'stem' mode matches;
+        # filter_posts does the keyword matching then.
+        self.search_keywords = [] if keyword_match == "stem" else keywords
+        self.start_date = start_date
+        self.end_date = end_date
+        self.shards = make_time_shards(start_date, end_date, shard)
+        self.workers = max(1, workers)
+        self.page_size = page_size
+
+    def _fetch_shard(self, shard: Tuple[int, int], stop: threading.Event) -> List[dict]:
+        after_ts, before_ts = shard
+        posts = []
+        while not stop.is_set():
+            page = self.reddit_client.get_historical_page(
+                self.subreddit, self.search_keywords, after_ts, before_ts, self.page_size
+            )
+            if not page:
+                break
+            posts.extend(page)
+            oldest = min(created_ts(p, before_ts) for p in page)
+            # Stop on a short page, or if the source ignores 'before' and would loop forever.
+            if len(page) < self.page_size or oldest >= before_ts:
+                break
+            # 'before' is exclusive: ask for the oldest second again so posts sharing it with the end of
+            # this page are not skipped; __iter__ drops the repeats by ID. Only a full page within a
+            # single second forces moving past it.
+            before_ts = oldest + 1 if oldest + 1 < before_ts else oldest
+        return posts
+
+    def _iter_dump(self) -> Iterator[dict]:
+        return iter(DumpScanner(
+            self.reddit_client.pushshift_url, subreddit=self.subreddit, keywords=self.keywords,
+            keyword_match=self.keyword_match,
+            start_ts=self.shards[0][0], end_ts=self.shards[-1][1],
+        ))
+
+    def _iter_api(self) -> Iterator[dict]:
+        stop = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        shards = iter(self.shards)
+        futures = deque()
+        try:
+            while True:
+                # Keep the pool busy without fetching far ahead of a consumer that may stop early.
+                for shard in islice(shards, self.workers - len(futures)):
+                    futures.append(executor.submit(self._fetch_shard, shard, stop))
+                if not futures:
+                    return
+                for post in sorted(futures.popleft().result(), key=created_ts):
+                    yield post
+        finally:
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def __iter__(self) -> Iterator[dict]:
+        seen = set()
+        if os.path.isfile(self.reddit_client.pushshift_url):
+            source = self._iter_dump()
+        else:
+            source = self._iter_api()
+        try:
+            for post in source:
+                post_id = post.get("id")
+                if post_id in seen:
+                    continue
+                seen.add(post_id)
+                yield post
+        finally:
+            source.close()
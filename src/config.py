@@ -1,12 +1,26 @@
 import os
-from dotenv import load_dotenv
+import threading
+
+_env_lock = threading.Lock()
+_env_loaded = False
+
+
+def _load_env():
+    """Reads the .env file into the environment, once. Variables that are already set win."""
+    global _env_loaded
+    with _env_lock:
+        if not _env_loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _env_loaded = True
+
 
 def load_api_keys():
     """
     Loads API keys from the .env file.
     Make sure to create a .env file with your credentials.
     """
-    load_dotenv()
+    _load_env()
     groq_api_key = os.getenv("GROQ_API_KEY")
     reddit_client_id = os.getenv("REDDIT_CLIENT_ID")
     reddit_client_secret = os.getenv("REDDIT_CLIENT_SECRET")
@@ -22,9 +36,42 @@ def load_api_keys():
         "reddit_user_agent": reddit_user_agent,
     }
 
-# Load keys at the module level for easy access
-try:
-    api_keys = load_api_keys()
-except ValueError as e:
-    print(f"Error: {e}")
-    api_keys = {}
+
+def _api_keys():
+    try:
+        return load_api_keys()
+    except ValueError as e:
+        print(f"Error: {e}")
+        return {}
+
+
+# Settings read from the environment (or .env) as (variable, default, type).
+_SETTINGS = {
+    # Pushshift-compatible submission search endpoint used for historical runs.
+    # Point it at a local stand-in (http://...) or at a newline-delimited JSON dump file.
+    "PUSHSHIFT_URL": ("PUSHSHIFT_URL", "https://api.pushshift.io/reddit/search/submission/", str),
+    # Request budgets used by the shared rate limiters, per minute. Defaults follow the providers'
+    # documented limits (Reddit OAuth: 100 QPM; Groq free tier for llama-3.3-70b: 30 RPM, 12K TPM);
+    # the limiters tighten or widen them from the rate-limit headers of each response.
+    "REDDIT_REQUESTS_PER_MINUTE": ("REDDIT_REQUESTS_PER_MINUTE", "100", float),
+    "PUSHSHIFT_REQUESTS_PER_MINUTE": ("PUSHSHIFT_REQUESTS_PER_MINUTE", "60", float),
+    "GROQ_REQUESTS_PER_MINUTE": ("GROQ_REQUESTS_PER_MINUTE", "30", float),
+    "GROQ_TOKENS_PER_MINUTE": ("GROQ_TOKENS_PER_MINUTE", "12000", float),
+}
+
+
+def __getattr__(name: str):
+    """
+    `api_keys` and the settings above are resolved on first use rather than at import, so commands
+    that never talk to Reddit or Groq neither read .env nor need credentials.
+    """
+    if name == "api_keys":
+        value = _api_keys()
+    elif name in _SETTINGS:
+        _load_env()
+        variable, default, cast = _SETTINGS[name]
+        value = cast(os.getenv(variable, default))
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
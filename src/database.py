@@ -1,24 +1,47 @@
 import sqlite3
-import pandas as pd
+import threading
+import json
+import re
 from datetime import datetime
+from . import metrics
+from .report_writers import write_rows
+from .pre_scorer import GOOD_CONFIDENCE
 
 DB_FILE = "reddit_miner.db"
 
-def get_db_connection():
-    """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(DB_FILE, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+# SQLite caps the number of bound parameters per statement; stay well below the old 999 limit.
+QUERY_BATCH_SIZE = 500
+
+# Databases already brought up to date by this process, so migrations are checked once per file.
+_migrated_files = set()
+_migration_lock = threading.Lock()
+
+def _connect():
+    conn = sqlite3.connect(DB_FILE, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES, timeout=30)
     conn.row_factory = sqlite3.Row
+    # WAL lets report queries read while a run is writing; NORMAL sync is safe under WAL.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-20000")
     return conn
 
-def initialize_db():
-    """Initializes the database with the new schema, including sub-categories."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("DROP TABLE IF EXISTS run_opportunities")
-    cursor.execute("DROP TABLE IF EXISTS opportunities")
-    cursor.execute("DROP TABLE IF EXISTS runs")
+def get_db_connection():
+    """Establishes a connection to the SQLite database, upgrading its schema on first use."""
+    conn = _connect()
+    if DB_FILE not in _migrated_files:
+        with _migration_lock:
+            if DB_FILE not in _migrated_files:
+                migrate_db(conn)
+                _migrated_files.add(DB_FILE)
+    return conn
+
+# --- Schema migrations ---
+# Each migration runs once, in order, in its own transaction. The applied version is kept
+# in PRAGMA user_version, so existing databases are upgraded in place without losing data.
 
+def _migration_base_schema(cursor):
+    """The original schema: runs, opportunities and the run/opportunity link table."""
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS runs (
             run_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -35,7 +58,7 @@ def initialize_db():
             title TEXT,
             post_created_utc DATETIME,
             category TEXT,
-            sub_category TEXT, -- New field
+            sub_category TEXT,
             pain_points TEXT,
             business_opportunities TEXT,
             automation_ideas TEXT,
@@ -53,10 +76,287 @@ def initialize_db():
             PRIMARY KEY (run_id, opportunity_id)
         )
     """)
+
+def _add_missing_columns(cursor, table: str, columns: list):
+    # Databases that ran pre-migration builds may already have some of these columns.
+    existing = {row['name'] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    for name, decl in columns:
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+def _migration_analysis_bookkeeping(cursor):
+    """Analysis timestamp, prompt version and token counts per opportunity."""
+    # SQLite does not allow a non-constant default on ALTER TABLE, so old rows keep analyzed_at NULL.
+    _add_missing_columns(cursor, "opportunities", [
+        ("analyzed_at", "DATETIME"),
+        ("prompt_version", "TEXT"),
+        ("input_tokens", "INTEGER"),
+        ("input_tokens_untrimmed", "INTEGER"),
+    ])
+
+def _migration_llm_cache(cursor):
+    """Content-addressed cache of LLM results."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            cache_key TEXT PRIMARY KEY,
+            model TEXT,
+            prompt_version TEXT,
+            result TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_used_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            hits INTEGER DEFAULT 0
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache(last_used_at)")
+
+def _migration_report_indexes(cursor):
+    """Covering indexes for the report filters and the run_opportunities reverse lookup."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_opportunities_category ON opportunities(category, sub_category, post_created_utc)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_opportunities_post_created ON opportunities(post_created_utc, category, sub_category)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_runs_timestamp ON runs(timestamp, subreddit)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_run_opportunities_opportunity ON run_opportunities(opportunity_id, run_id)")
+
+_PERMALINK_ID_RE = re.compile(r"/comments/([a-z0-9]+)")
+
+def _migration_post_id(cursor):
+    """Reddit post ID per opportunity, backfilled from permalink URLs where possible."""
+    _add_missing_columns(cursor, "opportunities", [("post_id", "TEXT")])
+    rows = cursor.execute("SELECT opportunity_id, url FROM opportunities WHERE post_id IS NULL").fetchall()
+    backfill = []
+    for row in rows:
+        match = _PERMALINK_ID_RE.search(row['url'] or "")
+        if match:
+            backfill.append((match.group(1), row['opportunity_id']))
+    cursor.executemany("UPDATE opportunities SET post_id = ? WHERE opportunity_id = ?", backfill)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_opportunities_post_id ON opportunities(post_id)")
+
+def _migration_report_rollups(cursor):
+    """Pre-aggregated report counts, kept up to date by the opportunity write paths."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS report_rollups (
+            scope TEXT NOT NULL,
+            scope_key TEXT NOT NULL,
+            category TEXT NOT NULL,
+            sub_category TEXT NOT NULL,
+            post_day TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (scope, scope_key, category, sub_category, post_day)
+        ) WITHOUT ROWID
+    """)
+    _rebuild_rollups(cursor)
+
+def _migration_run_checkpoints(cursor):
+    """Persisted pagination cursor and progress of each run, for 'run --resume'."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS run_checkpoints (
+            run_id INTEGER PRIMARY KEY REFERENCES runs(run_id),
+            subreddit TEXT,
+            keywords TEXT,
+            time_period TEXT,
+            target INTEGER,
+            after_token TEXT,
+            batch_num INTEGER DEFAULT 0,
+            total_new_found INTEGER DEFAULT 0,
+            status TEXT DEFAULT 'running',
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def _migration_checkpoint_dump_path(cursor):
+    """Runs that read a local dump file need its path to be resumed."""
+    _add_missing_columns(cursor, "run_checkpoints", [("dump_path", "TEXT")])
+
+def _migration_matched_keywords(cursor):
+    """Which of the run's keywords each opportunity's post matched, as a JSON list."""
+    _add_missing_columns(cursor, "opportunities", [("matched_keywords", "TEXT")])
+
+def _migration_prescore(cursor):
+    """The local pre-score each opportunity's post had when it was forwarded to the LLM."""
+    _add_missing_columns(cursor, "opportunities", [("prescore", "REAL")])
+
+def _migration_near_duplicates(cursor):
+    """MinHash signatures with LSH band buckets, and URLs that reuse a near-duplicate's analysis."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS post_signatures (
+            opportunity_id INTEGER PRIMARY KEY REFERENCES opportunities(opportunity_id),
+            signature BLOB NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS lsh_buckets (
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            opportunity_id INTEGER NOT NULL,
+            PRIMARY KEY (band, bucket, opportunity_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS opportunity_aliases (
+            url TEXT PRIMARY KEY,
+            post_id TEXT,
+            opportunity_id INTEGER NOT NULL REFERENCES opportunities(opportunity_id),
+            run_id INTEGER REFERENCES runs(run_id),
+            similarity REAL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_opportunity_aliases_post_id ON opportunity_aliases(post_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_opportunity_aliases_opportunity ON opportunity_aliases(opportunity_id)")
+
+def _migration_watch_state(cursor):
+    """Per-subreddit cursor, observed post rate and poll schedule of 'watch' mode."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS watch_state (
+            subreddit TEXT PRIMARY KEY,
+            run_id INTEGER REFERENCES runs(run_id),
+            keywords TEXT,
+            before_fullname TEXT,
+            before_created REAL,
+            pending TEXT,
+            posts_per_hour REAL,
+            poll_interval REAL,
+            last_polled_at REAL,
+            next_poll_at REAL,
+            polls INTEGER DEFAULT 0,
+            empty_polls INTEGER DEFAULT 0,
+            total_new_found INTEGER DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def _migration_run_metrics(cursor):
+    """Per-run summary of node timings, post counts and API, LLM and database figures."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS run_metrics (
+            run_id INTEGER PRIMARY KEY REFERENCES runs(run_id),
+            summary TEXT,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def _migration_confidence_index(cursor):
+    """Lets the 'top' report read the most confident opportunities without sorting the table."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_opportunities_confidence ON opportunities(confidence_score, opportunity_id)")
+
+def _migration_opportunity_search(cursor):
+    """Full-text index over each opportunity's title, summary and analysis lists, for 'search'."""
+    # Porter stemming lets "invoicing" find "invoice"; the columns mirror SEARCH_COLUMNS.
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS opportunities_fts USING fts5(
+            title, summary, pain_points, business_opportunities, automation_ideas,
+            tokenize = 'porter unicode61'
+        )
+    """)
+    # Default ranking for ORDER BY rank: bm25 with matches in the title and summary weighted higher.
+    weights = ", ".join(str(weight) for weight in SEARCH_COLUMNS.values())
+    cursor.execute(f"INSERT INTO opportunities_fts (opportunities_fts, rank) VALUES ('rank', 'bm25({weights})')")
+    # The triggers keep the index in step with every write to opportunities, including upserts.
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS opportunities_fts_insert AFTER INSERT ON opportunities BEGIN
+            INSERT INTO opportunities_fts (rowid, {', '.join(SEARCH_COLUMNS)}) VALUES ({_search_values('new')});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS opportunities_fts_update
+        AFTER UPDATE OF {', '.join(SEARCH_COLUMNS)} ON opportunities BEGIN
+            DELETE FROM opportunities_fts WHERE rowid = old.opportunity_id;
+            INSERT INTO opportunities_fts (rowid, {', '.join(SEARCH_COLUMNS)}) VALUES ({_search_values('new')});
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS opportunities_fts_delete AFTER DELETE ON opportunities BEGIN
+            DELETE FROM opportunities_fts WHERE rowid = old.opportunity_id;
+        END
+    """)
+    _rebuild_search_index(cursor)
+
+def _migration_comment_cache(cursor):
+    """Top comments of each post with its comment count when fetched, so unchanged threads are not downloaded again."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS comment_cache (
+            post_id TEXT PRIMARY KEY,
+            num_comments INTEGER,
+            comments TEXT NOT NULL,
+            fetched_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_comment_cache_fetched ON comment_cache(fetched_at)")
+
+MIGRATIONS = [
+    (1, _migration_base_schema),
+    (2, _migration_analysis_bookkeeping),
+    (3, _migration_llm_cache),
+    (4, _migration_report_indexes),
+    (5, _migration_post_id),
+    (6, _migration_report_rollups),
+    (7, _migration_run_checkpoints),
+    (8, _migration_checkpoint_dump_path),
+    (9, _migration_matched_keywords),
+    (10, _migration_prescore),
+    (11, _migration_near_duplicates),
+    (12, _migration_watch_state),
+    (13, _migration_run_metrics),
+    (14, _migration_confidence_index),
+    (15, _migration_opportunity_search),
+    (16, _migration_comment_cache),
+]
+
+def migrate_db(conn=None) -> int:
+    """
+    Applies all pending migrations and returns the resulting schema version.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = _connect()
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for target, migration in MIGRATIONS:
+            if target <= version:
+                continue
+            cursor = conn.cursor()
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                # Another process may have migrated while we waited for the write lock.
+                if conn.execute("PRAGMA user_version").fetchone()[0] >= target:
+                    conn.rollback()
+                    continue
+                migration(cursor)
+                cursor.execute(f"PRAGMA user_version = {target}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            version = target
+        return version
+    finally:
+        if own_conn:
+            conn.close()
+
+def initialize_db():
+    """Drops all data and recreates the database at the latest schema version."""
+    conn = _connect()
+    cursor = conn.cursor()
     
+    cursor.execute("DROP TABLE IF EXISTS run_opportunities")
+    cursor.execute("DROP TABLE IF EXISTS opportunities")
+    cursor.execute("DROP TABLE IF EXISTS runs")
+    cursor.execute("DROP TABLE IF EXISTS llm_cache")
+    cursor.execute("DROP TABLE IF EXISTS report_rollups")
+    cursor.execute("DROP TABLE IF EXISTS run_checkpoints")
+    cursor.execute("DROP TABLE IF EXISTS post_signatures")
+    cursor.execute("DROP TABLE IF EXISTS lsh_buckets")
+    cursor.execute("DROP TABLE IF EXISTS opportunity_aliases")
+    cursor.execute("DROP TABLE IF EXISTS watch_state")
+    cursor.execute("DROP TABLE IF EXISTS run_metrics")
+    cursor.execute("DROP TABLE IF EXISTS opportunities_fts")
+    cursor.execute("DROP TABLE IF EXISTS comment_cache")
+    cursor.execute("PRAGMA user_version = 0")
     conn.commit()
+
+    version = migrate_db(conn)
+    _migrated_files.add(DB_FILE)
     conn.close()
-    print(f"Database '{DB_FILE}' initialized with sub-category and date tracking.")
+    print(f"Database '{DB_FILE}' initialized at schema version {version}.")
 
 def create_run(subreddit: str, keywords: str) -> int:
     """Creates a new run entry and returns the run_id."""
@@ -68,169 +368,1012 @@ def create_run(subreddit: str, keywords: str) -> int:
     conn.close()
     return run_id
 
+@metrics.DB_WRITE_SECONDS.time(operation="save_run_checkpoint")
+def save_run_checkpoint(run_id: int, checkpoint: dict):
+    """
+    Stores the resumable state of a run: its configuration (subreddit, keywords, time_period,
+    target, dump_path), the pagination cursor, progress counters and a status.
+    """
+    conn = get_db_connection()
+    try:
+        with conn:
+            conn.execute("""
+                INSERT INTO run_checkpoints (run_id, subreddit, keywords, time_period, target, dump_path, after_token,
+                                             batch_num, total_new_found, status, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(run_id) DO UPDATE SET
+                    subreddit=excluded.subreddit,
+                    keywords=excluded.keywords,
+                    time_period=excluded.time_period,
+                    target=excluded.target,
+                    dump_path=excluded.dump_path,
+                    after_token=excluded.after_token,
+                    batch_num=excluded.batch_num,
+                    total_new_found=excluded.total_new_found,
+                    status=excluded.status,
+                    updated_at=excluded.updated_at
+            """, (
+                run_id,
+                checkpoint.get('subreddit'),
+                json.dumps(checkpoint.get('keywords', [])),
+                checkpoint.get('time_period'),
+                checkpoint.get('target'),
+                checkpoint.get('dump_path'),
+                checkpoint.get('after_token'),
+                checkpoint.get('batch_num', 0),
+                checkpoint.get('total_new_found', 0),
+                checkpoint.get('status', 'running')
+            ))
+    finally:
+        conn.close()
+
+def get_run_checkpoint(run_id: int):
+    """Returns the saved checkpoint of a run as a dict, or None if it has none."""
+    conn = get_db_connection()
+    try:
+        row = conn.execute("SELECT * FROM run_checkpoints WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+        checkpoint = dict(row)
+        checkpoint['keywords'] = json.loads(checkpoint['keywords'] or '[]')
+        return checkpoint
+    finally:
+        conn.close()
+
+_WATCH_STATE_COLUMNS = (
+    "subreddit", "run_id", "keywords", "before_fullname", "before_created", "pending", "posts_per_hour",
+    "poll_interval", "last_polled_at", "next_poll_at", "polls", "empty_polls", "total_new_found",
+)
+
+@metrics.DB_WRITE_SECONDS.time(operation="save_watch_state")
+def save_watch_state(state: dict):
+    """
+    Stores a watched subreddit's state: its run, keywords, the fullname and creation time of the newest
+    post seen, the [fullname, created] pairs of posts waiting to be analyzed, the observed post rate and
+    the poll schedule (epoch seconds).
+    """
+    row = {column: state.get(column) for column in _WATCH_STATE_COLUMNS}
+    row["subreddit"] = state["subreddit"].lower()
+    row["keywords"] = json.dumps(state.get("keywords", []))
+    row["pending"] = json.dumps(state.get("pending", []))
+    conn = get_db_connection()
+    try:
+        with conn:
+            conn.execute(f"""
+                INSERT INTO watch_state ({", ".join(_WATCH_STATE_COLUMNS)}, updated_at)
+                VALUES ({", ".join("?" for _ in _WATCH_STATE_COLUMNS)}, CURRENT_TIMESTAMP)
+                ON CONFLICT(subreddit) DO UPDATE SET
+                    {", ".join(f"{c}=excluded.{c}" for c in _WATCH_STATE_COLUMNS[1:])},
+                    updated_at=excluded.updated_at
+            """, [row[column] for column in _WATCH_STATE_COLUMNS])
+    finally:
+        conn.close()
+
+def _watch_state(row) -> dict:
+    state = dict(row)
+    state['keywords'] = json.loads(state['keywords'] or '[]')
+    state['pending'] = json.loads(state['pending'] or '[]')
+    return state
+
+def get_watch_state(subreddit: str):
+    """Returns the saved watch state of a subreddit as a dict, or None if it was never watched."""
+    conn = get_db_connection()
+    try:
+        row = conn.execute("SELECT * FROM watch_state WHERE subreddit = ?", (subreddit.lower(),)).fetchone()
+        return None if row is None else _watch_state(row)
+    finally:
+        conn.close()
+
+def list_watch_states() -> list:
+    """All watched subreddits, soonest poll first."""
+    conn = get_db_connection()
+    try:
+        rows = conn.execute("SELECT * FROM watch_state ORDER BY next_poll_at").fetchall()
+        return [_watch_state(row) for row in rows]
+    finally:
+        conn.close()
+
+def save_run_metrics(run_id: int, summary: dict):
+    """Stores (or replaces) the metrics summary of a run."""
+    conn = get_db_connection()
+    try:
+        with conn:
+            conn.execute("""
+                INSERT INTO run_metrics (run_id, summary, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(run_id) DO UPDATE SET summary=excluded.summary, updated_at=excluded.updated_at
+            """, (run_id, json.dumps(summary)))
+    finally:
+        conn.close()
+
+def get_run_metrics(run_ids: list = None) -> list:
+    """Returns (run_id, summary dict, updated_at) of the given runs, or of all runs, newest first."""
+    conn = get_db_connection()
+    try:
+        query = "SELECT run_id, summary, updated_at FROM run_metrics"
+        params = []
+        if run_ids:
+            query += " WHERE run_id IN ({seq})".format(seq=','.join(['?'] * len(run_ids)))
+            params = list(run_ids)
+        rows = conn.execute(query + " ORDER BY run_id DESC", params).fetchall()
+        return [(row['run_id'], json.loads(row['summary']), row['updated_at']) for row in rows]
+    finally:
+        conn.close()
+
+def _opportunity_row(opportunity: dict) -> tuple:
+    return (
+        opportunity.get('url'),
+        opportunity.get('title'),
+        opportunity.get('post_created_utc'),
+        opportunity.get('category'),
+        opportunity.get('sub_category'),
+        opportunity.get('pain_points'),
+        opportunity.get('business_opportunities'),
+        opportunity.get('automation_ideas'),
+        opportunity.get('confidence_score'),
+        opportunity.get('summary'),
+        opportunity.get('prompt_version'),
+        opportunity.get('input_tokens'),
+        opportunity.get('input_tokens_untrimmed'),
+        opportunity.get('post_id'),
+        opportunity.get('matched_keywords'),
+        opportunity.get('prescore')
+    )
+
+# --- Report rollups ---
+# report_rollups holds COUNT(DISTINCT opportunity_id) per (category, sub_category, post day) at three scopes:
+#   'run'       - per run_id (scope_key), for single-run reports
+#   'subreddit' - per subreddit (scope_key), distinct across all runs of that subreddit
+#   'all'       - across every run (scope_key ''), for unfiltered category/subcategory reports
+# Per-run counts cannot simply be summed across runs because one opportunity can be linked to
+# several runs, hence the separate scopes. NULLs are stored as '' so they can be part of the key.
+
+_ROLLUP_SELECTS = [
+    """
+        SELECT 'run' AS scope, CAST(ro.run_id AS TEXT) AS scope_key, IFNULL(o.category, '') AS category,
+               IFNULL(o.sub_category, '') AS sub_category, IFNULL(date(o.post_created_utc), '') AS post_day,
+               COUNT(*) AS count
+        FROM opportunities o
+        JOIN run_opportunities ro ON ro.opportunity_id = o.opportunity_id
+        WHERE {where}
+        GROUP BY 1, 2, 3, 4, 5
+    """,
+    """
+        SELECT 'subreddit' AS scope, IFNULL(r.subreddit, '') AS scope_key, IFNULL(o.category, '') AS category,
+               IFNULL(o.sub_category, '') AS sub_category, IFNULL(date(o.post_created_utc), '') AS post_day,
+               COUNT(DISTINCT o.opportunity_id) AS count
+        FROM opportunities o
+        JOIN run_opportunities ro ON ro.opportunity_id = o.opportunity_id
+        JOIN runs r ON r.run_id = ro.run_id
+        WHERE {where}
+        GROUP BY 1, 2, 3, 4, 5
+    """,
+    """
+        SELECT 'all' AS scope, '' AS scope_key, IFNULL(o.category, '') AS category,
+               IFNULL(o.sub_category, '') AS sub_category, IFNULL(date(o.post_created_utc), '') AS post_day,
+               COUNT(DISTINCT o.opportunity_id) AS count
+        FROM opportunities o
+        JOIN run_opportunities ro ON ro.opportunity_id = o.opportunity_id
+        WHERE {where}
+        GROUP BY 1, 2, 3, 4, 5
+    """,
+]
+
+def _apply_rollup_delta(conn, opportunity_ids: list, sign: int):
+    """
+    Adds (sign=1) or removes (sign=-1) the rollup contribution of the given opportunities,
+    based on their current rows and run links. Callers remove before changing an
+    opportunity or its links and add back afterwards, within the same transaction.
+    """
+    ids = list(dict.fromkeys(opportunity_ids))
+    for i in range(0, len(ids), QUERY_BATCH_SIZE):
+        batch = ids[i:i + QUERY_BATCH_SIZE]
+        where = "o.opportunity_id IN ({seq})".format(seq=','.join(['?'] * len(batch)))
+        for select in _ROLLUP_SELECTS:
+            conn.execute(f"""
+                INSERT INTO report_rollups (scope, scope_key, category, sub_category, post_day, count)
+                SELECT scope, scope_key, category, sub_category, post_day, ? * count
+                FROM ({select.format(where=where)}) WHERE true
+                ON CONFLICT(scope, scope_key, category, sub_category, post_day)
+                DO UPDATE SET count = count + excluded.count
+            """, [sign] + batch)
+    # Buckets emptied by a category change are left at zero; reports skip them and a rebuild drops them.
+
+# Columns of the full-text index and their bm25 weights.
+SEARCH_COLUMNS = {
+    "title": 5.0,
+    "summary": 3.0,
+    "pain_points": 1.0,
+    "business_opportunities": 1.0,
+    "automation_ideas": 1.0,
+}
+# The analysis lists are stored as JSON arrays; they are indexed as their items joined by "; ".
+_SEARCH_LIST_COLUMNS = ("pain_points", "business_opportunities", "automation_ideas")
+
+def _search_values(row: str) -> str:
+    """SQL expressions for the index row of an opportunity, with `row` as the table alias or new/old."""
+    values = [f"{row}.opportunity_id"]
+    for column in SEARCH_COLUMNS:
+        value = f"{row}.{column}"
+        if column in _SEARCH_LIST_COLUMNS:
+            value = (f"CASE WHEN json_valid({value}) THEN "
+                     f"(SELECT group_concat(value, '; ') FROM json_each({value})) ELSE {value} END")
+        values.append(value)
+    return ", ".join(values)
+
+def _rebuild_search_index(cursor):
+    cursor.execute("DELETE FROM opportunities_fts")
+    cursor.execute(f"INSERT INTO opportunities_fts (rowid, {', '.join(SEARCH_COLUMNS)}) "
+                   f"SELECT {_search_values('o')} FROM opportunities o")
+
+def rebuild_search_index():
+    """Recomputes the full-text search index from the opportunities table."""
+    conn = get_db_connection()
+    try:
+        with conn:
+            _rebuild_search_index(conn.cursor())
+    finally:
+        conn.close()
+
+def _rebuild_rollups(cursor):
+    cursor.execute("DELETE FROM report_rollups")
+    for select in _ROLLUP_SELECTS:
+        cursor.execute(f"INSERT INTO report_rollups {select.format(where='1')}")
+
+def rebuild_rollups():
+    """Recomputes all report rollups from the base tables."""
+    conn = get_db_connection()
+    try:
+        with conn:
+            _rebuild_rollups(conn.cursor())
+    finally:
+        conn.close()
+
+def check_rollups() -> int:
+    """
+    Compares the maintained rollups with a fresh aggregation of the base tables.
+    Returns the number of mismatching rollup rows (0 means consistent).
+    """
+    conn = get_db_connection()
+    try:
+        expected = "SELECT * FROM ({})".format(" UNION ALL ".join(select.format(where='1') for select in _ROLLUP_SELECTS))
+        maintained = "SELECT scope, scope_key, category, sub_category, post_day, count FROM report_rollups WHERE count != 0"
+        row = conn.execute(f"""
+            SELECT (SELECT COUNT(*) FROM ({expected} EXCEPT {maintained}))
+                 + (SELECT COUNT(*) FROM ({maintained} EXCEPT {expected}))
+        """).fetchone()
+        return row[0]
+    finally:
+        conn.close()
+
+@metrics.DB_WRITE_SECONDS.time(operation="insert_opportunities")
+def insert_opportunities(run_id: int, opportunities: list) -> list:
+    """
+    Upserts a batch of opportunities and links them to a run over one connection
+    and in one transaction.
+    Returns a list aligned with `opportunities`: True where a new link was created
+    for this run, False where the opportunity was already linked (or the batch failed).
+    """
+    if not opportunities:
+        return []
+
+    # Rows without a URL can never be stored; keep them from aborting the whole transaction.
+    storable = [o for o in opportunities if o.get('url')]
+    if len(storable) < len(opportunities):
+        print(f"Skipping {len(opportunities) - len(storable)} opportunities without a URL.")
+    if not storable:
+        return [False] * len(opportunities)
+    metrics.DB_ROWS.inc(len(storable), operation="insert_opportunities")
+
+    conn = get_db_connection()
+    try:
+        with conn:
+            # Take the write lock up front: the existing ids read below must not change
+            # under us when several runs save at the same time.
+            conn.execute("BEGIN IMMEDIATE")
+            urls = list(dict.fromkeys(o.get('url') for o in storable))
+            existing_ids = []
+            for i in range(0, len(urls), QUERY_BATCH_SIZE):
+                batch = urls[i:i + QUERY_BATCH_SIZE]
+                existing_ids.extend(row['opportunity_id'] for row in conn.execute(
+                    "SELECT opportunity_id FROM opportunities WHERE url IN ({seq})".format(seq=','.join(['?'] * len(batch))),
+                    batch
+                ))
+            # Re-analysis can move an existing opportunity to another category, so take its old counts out first.
+            _apply_rollup_delta(conn, existing_ids, -1)
+
+            conn.executemany("""
+                INSERT INTO opportunities (url, title, post_created_utc, category, sub_category, pain_points,
+                                         business_opportunities, automation_ideas, confidence_score, summary,
+                                         analyzed_at, prompt_version, input_tokens, input_tokens_untrimmed, post_id,
+                                         matched_keywords, prescore)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    title=excluded.title,
+                    post_created_utc=excluded.post_created_utc,
+                    category=excluded.category,
+                    sub_category=excluded.sub_category,
+                    pain_points=excluded.pain_points,
+                    business_opportunities=excluded.business_opportunities,
+                    automation_ideas=excluded.automation_ideas,
+                    confidence_score=excluded.confidence_score,
+                    summary=excluded.summary,
+                    analyzed_at=excluded.analyzed_at,
+                    prompt_version=excluded.prompt_version,
+                    input_tokens=excluded.input_tokens,
+                    input_tokens_untrimmed=excluded.input_tokens_untrimmed,
+                    post_id=COALESCE(excluded.post_id, post_id),
+                    matched_keywords=COALESCE(excluded.matched_keywords, matched_keywords),
+                    prescore=excluded.prescore
+            """, [_opportunity_row(o) for o in storable])
+
+            # executemany() discards RETURNING rows, so resolve ids and existing links
+            # with one indexed lookup per batch instead of one SELECT per row.
+            lookup = {}
+            for i in range(0, len(urls), QUERY_BATCH_SIZE):
+                batch = urls[i:i + QUERY_BATCH_SIZE]
+                rows = conn.execute("""
+                    SELECT o.url, o.opportunity_id, ro.run_id IS NOT NULL AS linked
+                    FROM opportunities o
+                    LEFT JOIN run_opportunities ro ON ro.opportunity_id = o.opportunity_id AND ro.run_id = ?
+                    WHERE o.url IN ({seq})
+                """.format(seq=','.join(['?'] * len(batch))), [run_id] + batch).fetchall()
+                for row in rows:
+                    lookup[row['url']] = (row['opportunity_id'], bool(row['linked']))
+
+            statuses = []
+            new_links = []
+            linked_now = set()
+            for opportunity in opportunities:
+                opportunity_id, linked = lookup.get(opportunity.get('url'), (None, True))
+                is_new = not linked and opportunity_id not in linked_now
+                if is_new:
+                    linked_now.add(opportunity_id)
+                    new_links.append((run_id, opportunity_id))
+                statuses.append(is_new)
+
+            conn.executemany("INSERT OR IGNORE INTO run_opportunities (run_id, opportunity_id) VALUES (?, ?)", new_links)
+            _apply_rollup_delta(conn, [opportunity_id for opportunity_id, _ in lookup.values()], 1)
+            _store_signatures(conn, {
+                lookup[o['url']][0]: o['minhash'] for o in storable if o.get('minhash') and o['url'] in lookup
+            })
+        return statuses
+    except Exception as e:
+        print(f"Database error: {e}")
+        return [False] * len(opportunities)
+    finally:
+        conn.close()
+
 def insert_opportunity(run_id: int, opportunity: dict) -> bool:
     """
     Inserts an opportunity and links it to a run.
     Returns True if a new link was created for this run, False otherwise.
     """
+    return insert_opportunities(run_id, [opportunity])[0]
+
+def find_known_opportunities(posts: list, batch_size: int = QUERY_BATCH_SIZE) -> dict:
+    """
+    Looks up which posts are already stored as opportunities, matching on the indexed
+    post_id first and falling back to the URL for rows stored without one.
+    `posts` items are dicts with "id" and "url". Returns {post id: row}.
+    """
+    posts = [p for p in posts if p.get("id") or p.get("url")]
+    if not posts:
+        return {}
+
     conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("""
-            INSERT INTO opportunities (url, title, post_created_utc, category, sub_category, pain_points,
-                                     business_opportunities, automation_ideas, confidence_score, summary)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(url) DO UPDATE SET
-                title=excluded.title,
-                post_created_utc=excluded.post_created_utc,
-                category=excluded.category,
-                sub_category=excluded.sub_category,
-                pain_points=excluded.pain_points,
-                business_opportunities=excluded.business_opportunities,
-                automation_ideas=excluded.automation_ideas,
-                confidence_score=excluded.confidence_score,
-                summary=excluded.summary
-        """, (
-            opportunity.get('url'),
-            opportunity.get('title'),
-            opportunity.get('post_created_utc'),
-            opportunity.get('category'),
-            opportunity.get('sub_category'), # New field
-            opportunity.get('pain_points'),
-            opportunity.get('business_opportunities'),
-            opportunity.get('automation_ideas'),
-            opportunity.get('confidence_score'),
-            opportunity.get('summary')
-        ))
-        
-        cursor.execute("SELECT opportunity_id FROM opportunities WHERE url = ?", (opportunity.get('url'),))
-        result = cursor.fetchone()
-        if result is None: return False
-        opportunity_id = result['opportunity_id']
-
-        cursor.execute("INSERT OR IGNORE INTO run_opportunities (run_id, opportunity_id) VALUES (?, ?)", (run_id, opportunity_id))
-        
-        is_new_link = cursor.rowcount > 0
-        conn.commit()
-        return is_new_link
-    except Exception as e:
-        print(f"Database error: {e}")
-        return False
+        def lookup(column, values):
+            rows_by_value = {}
+            for i in range(0, len(values), batch_size):
+                batch = values[i:i + batch_size]
+                rows = conn.execute(
+                    "SELECT opportunity_id, url, post_id, analyzed_at, prompt_version FROM opportunities "
+                    "WHERE {column} IN ({seq})".format(column=column, seq=','.join(['?'] * len(batch))),
+                    batch
+                ).fetchall()
+                for row in rows:
+                    rows_by_value[row[column]] = row
+            return rows_by_value
+
+        by_post_id = lookup("post_id", list(dict.fromkeys(p["id"] for p in posts if p.get("id"))))
+        known = {p["id"]: by_post_id[p["id"]] for p in posts if p.get("id") in by_post_id}
+
+        remaining = [p for p in posts if p.get("id") not in known and p.get("url")]
+        by_url = lookup("url", list(dict.fromkeys(p["url"] for p in remaining)))
+        for p in remaining:
+            if p["url"] in by_url:
+                known[p.get("id") or p["url"]] = by_url[p["url"]]
+
+        # Posts recorded as near-duplicates resolve to the opportunity whose analysis they reuse.
+        remaining = [p for p in posts if (p.get("id") or p.get("url")) not in known]
+        for column, key in (("post_id", "id"), ("url", "url")):
+            values = list(dict.fromkeys(p[key] for p in remaining if p.get(key)))
+            for i in range(0, len(values), batch_size):
+                batch = values[i:i + batch_size]
+                rows = conn.execute(
+                    "SELECT a.{column} AS alias_key, o.opportunity_id, o.url, o.post_id, o.analyzed_at, o.prompt_version "
+                    "FROM opportunity_aliases a JOIN opportunities o ON o.opportunity_id = a.opportunity_id "
+                    "WHERE a.{column} IN ({seq})".format(column=column, seq=','.join(['?'] * len(batch))),
+                    batch
+                ).fetchall()
+                by_alias = {row['alias_key']: row for row in rows}
+                for p in remaining:
+                    if p.get(key) in by_alias:
+                        known.setdefault(p.get("id") or p["url"], by_alias[p[key]])
+        return known
     finally:
         conn.close()
 
-def list_runs(runs_after: str = None, runs_before: str = None):
-    # This function remains the same as before
+@metrics.DB_WRITE_SECONDS.time(operation="link_opportunities")
+def link_opportunities(run_id: int, opportunity_ids: list) -> int:
+    """
+    Links already-stored opportunities to a run without touching their analysis.
+    Returns the number of links that did not exist before.
+    """
+    if not opportunity_ids:
+        return 0
+
     conn = get_db_connection()
     try:
-        query = "SELECT run_id, timestamp, subreddit, keywords FROM runs"
-        conditions = []
-        params = []
+        with conn:
+            return _link_opportunities(conn, run_id, opportunity_ids)
+    finally:
+        conn.close()
+
+def _link_opportunities(conn, run_id: int, opportunity_ids: list) -> int:
+    _apply_rollup_delta(conn, opportunity_ids, -1)
+    before = conn.total_changes
+    conn.executemany(
+        "INSERT OR IGNORE INTO run_opportunities (run_id, opportunity_id) VALUES (?, ?)",
+        [(run_id, opportunity_id) for opportunity_id in opportunity_ids]
+    )
+    new_links = conn.total_changes - before
+    _apply_rollup_delta(conn, opportunity_ids, 1)
+    return new_links
+
+# --- Near-duplicate index ---
 
-        if runs_after:
-            conditions.append("timestamp >= ?")
-            params.append(runs_after)
-        
-        if runs_before:
-            conditions.append("timestamp <= ?")
-            params.append(runs_before)
+def _store_signatures(conn, signatures: dict):
+    """Stores {opportunity_id: MinHash signature} and its LSH buckets, replacing older ones."""
+    if not signatures:
+        return
+    # Imported here so commands that never compare posts start quickly.
+    from .near_dup import band_buckets, encode_signature
+    ids = list(signatures)
+    for i in range(0, len(ids), QUERY_BATCH_SIZE):
+        batch = ids[i:i + QUERY_BATCH_SIZE]
+        conn.execute("DELETE FROM lsh_buckets WHERE opportunity_id IN ({seq})".format(seq=','.join(['?'] * len(batch))), batch)
+    conn.executemany(
+        "INSERT OR REPLACE INTO post_signatures (opportunity_id, signature) VALUES (?, ?)",
+        [(opportunity_id, encode_signature(signature)) for opportunity_id, signature in signatures.items()]
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO lsh_buckets (band, bucket, opportunity_id) VALUES (?, ?, ?)",
+        [(band, bucket, opportunity_id)
+         for opportunity_id, signature in signatures.items()
+         for band, bucket in enumerate(band_buckets(signature))]
+    )
+
+def find_near_duplicate_opportunities(signatures: dict, threshold: float) -> dict:
+    """
+    Finds stored opportunities whose posts are near-duplicates of the given ones.
+    `signatures` maps a post key to its MinHash signature. Candidates come from the LSH buckets
+    and are kept if their estimated similarity is at least `threshold`.
+    Returns {post key: (opportunity_id, similarity)} for the most similar match of each post.
+    """
+    if not signatures:
+        return {}
+    from .near_dup import band_buckets, decode_signature, similarity
+
+    conn = get_db_connection()
+    try:
+        candidates = {}
+        for key, signature in signatures.items():
+            pairs = list(enumerate(band_buckets(signature)))
+            rows = conn.execute(
+                "SELECT DISTINCT opportunity_id FROM lsh_buckets WHERE (band, bucket) IN (VALUES {seq})".format(
+                    seq=','.join(['(?, ?)'] * len(pairs))),
+                [value for pair in pairs for value in pair]
+            ).fetchall()
+            candidates[key] = [row['opportunity_id'] for row in rows]
 
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-            
-        query += " ORDER BY timestamp DESC"
+        candidate_ids = list({i for ids in candidates.values() for i in ids})
+        stored = {}
+        for i in range(0, len(candidate_ids), QUERY_BATCH_SIZE):
+            batch = candidate_ids[i:i + QUERY_BATCH_SIZE]
+            for row in conn.execute(
+                "SELECT opportunity_id, signature FROM post_signatures WHERE opportunity_id IN ({seq})".format(
+                    seq=','.join(['?'] * len(batch))), batch
+            ):
+                stored[row['opportunity_id']] = decode_signature(row['signature'])
 
-        df = pd.read_sql_query(query, conn, params=params)
-        print("\n--- Previous Runs ---")
-        if df.empty:
-            print("No runs found for the specified criteria.")
-        else:
-            print(df.to_string(index=False))
-        print("---------------------\n")
+        matches = {}
+        for key, ids in candidates.items():
+            scored = [(similarity(signatures[key], stored[i]), i) for i in ids if i in stored]
+            scored = [(score, i) for score, i in scored if score >= threshold]
+            if scored:
+                score, opportunity_id = max(scored)
+                matches[key] = (opportunity_id, score)
+        return matches
     finally:
         conn.close()
 
-# This is the new, more powerful analysis function
-def generate_report(filters: dict):
+@metrics.DB_WRITE_SECONDS.time(operation="add_opportunity_aliases")
+def add_opportunity_aliases(run_id: int, aliases: list) -> int:
     """
-    Generates and prints a report based on a set of filters.
+    Records posts that reuse the analysis of a near-duplicate and links that opportunity to the run.
+    `aliases` items are dicts with "url", "post_id", "similarity" and either "opportunity_id" or,
+    for a duplicate of a post saved in the same batch, "canonical_url".
+    Aliases whose canonical post was not stored are dropped. Returns the number of new run links.
+    """
+    if not aliases:
+        return 0
+
+    conn = get_db_connection()
+    try:
+        with conn:
+            canonical_urls = list({a['canonical_url'] for a in aliases if a.get('canonical_url')})
+            ids_by_url = {}
+            for i in range(0, len(canonical_urls), QUERY_BATCH_SIZE):
+                batch = canonical_urls[i:i + QUERY_BATCH_SIZE]
+                for row in conn.execute(
+                    "SELECT url, opportunity_id FROM opportunities WHERE url IN ({seq})".format(
+                        seq=','.join(['?'] * len(batch))), batch
+                ):
+                    ids_by_url[row['url']] = row['opportunity_id']
+
+            rows = []
+            for alias in aliases:
+                opportunity_id = alias.get('opportunity_id') or ids_by_url.get(alias.get('canonical_url'))
+                if opportunity_id is not None and alias.get('url'):
+                    rows.append((alias['url'], alias.get('post_id'), opportunity_id, run_id, alias.get('similarity')))
+            conn.executemany("""
+                INSERT INTO opportunity_aliases (url, post_id, opportunity_id, run_id, similarity)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    opportunity_id=excluded.opportunity_id,
+                    run_id=excluded.run_id,
+                    similarity=excluded.similarity
+            """, rows)
+            metrics.DB_ROWS.inc(len(rows), operation="add_opportunity_aliases")
+            return _link_opportunities(conn, run_id, [row[2] for row in rows])
+    finally:
+        conn.close()
+
+def get_prescore_training_rows(limit: int = 20000) -> list:
+    """Returns (title, confidence_score) of the most recently analyzed opportunities, to train the pre-scorer."""
+    conn = get_db_connection()
+    try:
+        rows = conn.execute("""
+            SELECT title, confidence_score FROM opportunities
+            WHERE title IS NOT NULL AND confidence_score IS NOT NULL
+            ORDER BY opportunity_id DESC LIMIT ?
+        """, (limit,)).fetchall()
+        return [(row['title'], row['confidence_score']) for row in rows]
+    finally:
+        conn.close()
+
+def get_cached_analysis(cache_key: str, max_age_days: int = None):
+    """
+    Returns the cached LLM result (a JSON string) for a key, or None on a miss.
+    Entries older than max_age_days are treated as misses.
+    """
+    conn = get_db_connection()
+    try:
+        with conn:
+            query = "SELECT result FROM llm_cache WHERE cache_key = ?"
+            params = [cache_key]
+            if max_age_days is not None:
+                query += " AND created_at >= datetime('now', ?)"
+                params.append(f"-{max_age_days} days")
+            row = conn.execute(query, params).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE llm_cache SET hits = hits + 1, last_used_at = CURRENT_TIMESTAMP WHERE cache_key = ?",
+                (cache_key,)
+            )
+            return row['result']
+    finally:
+        conn.close()
+
+@metrics.DB_WRITE_SECONDS.time(operation="put_cached_analysis")
+def put_cached_analysis(cache_key: str, model: str, prompt_version: str, result: str):
+    """Stores (or refreshes) an LLM result in the cache."""
+    conn = get_db_connection()
+    try:
+        with conn:
+            conn.execute("""
+                INSERT INTO llm_cache (cache_key, model, prompt_version, result)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(cache_key) DO UPDATE SET
+                    result=excluded.result,
+                    created_at=CURRENT_TIMESTAMP,
+                    last_used_at=CURRENT_TIMESTAMP
+            """, (cache_key, model, prompt_version, result))
+    finally:
+        conn.close()
+
+def evict_llm_cache(max_entries: int = None, max_age_days: int = None) -> int:
+    """
+    Drops cache entries older than max_age_days, then the least recently used
+    entries beyond max_entries. Returns the number of evicted entries.
+    """
+    conn = get_db_connection()
+    try:
+        with conn:
+            before = conn.total_changes
+            if max_age_days is not None:
+                conn.execute("DELETE FROM llm_cache WHERE created_at < datetime('now', ?)", (f"-{max_age_days} days",))
+            if max_entries is not None:
+                conn.execute("""
+                    DELETE FROM llm_cache WHERE cache_key IN (
+                        SELECT cache_key FROM llm_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                    )
+                """, (max_entries,))
+            return conn.total_changes - before
+    finally:
+        conn.close()
+
+def purge_llm_cache() -> int:
+    """Deletes every cached LLM result. Returns the number of deleted entries."""
+    conn = get_db_connection()
+    try:
+        with conn:
+            return conn.execute("DELETE FROM llm_cache").rowcount
+    finally:
+        conn.close()
+
+def _stream_query(query: str, params) -> tuple:
+    """
+    Runs a query and returns (column names, row iterator). Rows are read from the cursor as
+    they are consumed, and the connection is closed once the iterator is exhausted or dropped.
+    """
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(query, params)
+    except Exception:
+        conn.close()
+        raise
+    columns = [description[0] for description in cursor.description]
+
+    def rows():
+        try:
+            for row in cursor:
+                yield tuple(row)
+        finally:
+            conn.close()
+    return columns, rows()
+
+def get_cached_comments(post_ids: list, max_age_hours: float) -> dict:
+    """Returns {post_id: (num_comments, [comment dicts])} for the posts cached within the last max_age_hours."""
+    cached = {}
+    conn = get_db_connection()
+    try:
+        for i in range(0, len(post_ids), QUERY_BATCH_SIZE):
+            batch = post_ids[i:i + QUERY_BATCH_SIZE]
+            rows = conn.execute(f"""
+                SELECT post_id, num_comments, comments FROM comment_cache
+                WHERE post_id IN ({','.join('?' * len(batch))}) AND fetched_at >= datetime('now', ?)
+            """, [*batch, f"-{max_age_hours * 3600:.0f} seconds"])
+            for row in rows:
+                cached[row['post_id']] = (row['num_comments'], json.loads(row['comments']))
+    finally:
+        conn.close()
+    return cached
+
+@metrics.DB_WRITE_SECONDS.time(operation="put_cached_comments")
+def put_cached_comments(entries: list):
+    """Stores (or refreshes) the comments of posts, given as (post_id, num_comments, [comment dicts])."""
+    if not entries:
+        return
+    metrics.DB_ROWS.inc(len(entries), operation="put_cached_comments")
+    conn = get_db_connection()
+    try:
+        with conn:
+            conn.executemany("""
+                INSERT INTO comment_cache (post_id, num_comments, comments) VALUES (?, ?, ?)
+                ON CONFLICT(post_id) DO UPDATE SET
+                    num_comments=excluded.num_comments,
+                    comments=excluded.comments,
+                    fetched_at=CURRENT_TIMESTAMP
+            """, [(post_id, num_comments, json.dumps(comments)) for post_id, num_comments, comments in entries])
+    finally:
+        conn.close()
+
+def evict_comment_cache(max_age_hours: float) -> int:
+    """Drops cached comments older than max_age_hours. Returns the number of evicted entries."""
+    conn = get_db_connection()
+    try:
+        with conn:
+            return conn.execute("DELETE FROM comment_cache WHERE fetched_at < datetime('now', ?)",
+                                (f"-{max_age_hours * 3600:.0f} seconds",)).rowcount
+    finally:
+        conn.close()
+
+def list_runs(runs_after: str = None, runs_before: str = None, output_format: str = "table", output_path: str = None):
+    query = "SELECT run_id, timestamp, subreddit, keywords FROM runs"
+    conditions = []
+    params = []
+
+    if runs_after:
+        conditions.append("timestamp >= ?")
+        params.append(runs_after)
+
+    if runs_before:
+        conditions.append("timestamp <= ?")
+        params.append(runs_before)
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    query += " ORDER BY timestamp DESC"
+
+    columns, rows = _stream_query(query, params)
+    write_rows("Previous Runs", columns, rows, output_format, output_path,
+               empty_message="No runs found for the specified criteria.")
+
+_PLAIN_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+def _rollup_report_query(filters: dict):
+    """
+    Builds the grouped report query against report_rollups when the filters can be answered from it.
+    Returns (query, params) without an ORDER BY, or None when the report has to run on the base tables
+    (run date filters, several run IDs, or post dates that are not plain YYYY-MM-DD).
+    """
+    report_type = filters.get('report_type')
+    run_ids = filters.get('run_ids') or []
+    if filters.get('runs_after') or filters.get('runs_before') or len(run_ids) > 1:
+        return None
+    for key in ('posts_after', 'posts_before'):
+        if filters.get(key) and not _PLAIN_DATE_RE.fullmatch(filters[key]):
+            return None
+
+    conditions = []
+    params = []
+    if run_ids:
+        conditions.append("rr.scope = 'run' AND rr.scope_key = ?")
+        params.append(str(run_ids[0]))
+        subreddit_column = "(SELECT subreddit FROM runs WHERE run_id = ?)"
+        subreddit_params = [run_ids[0]]
+    elif report_type == 'subreddit_bias':
+        conditions.append("rr.scope = 'subreddit'")
+        subreddit_column = "NULLIF(rr.scope_key, '')"
+        subreddit_params = []
+    else:
+        conditions.append("rr.scope = 'all'")
+        subreddit_column, subreddit_params = None, []
+
+    # post_created_utc is stored as 'YYYY-MM-DD HH:MM:SS', so the base query's
+    # "post_created_utc <= 'D'" excludes day D itself; the day buckets mirror that.
+    if filters.get('posts_after'):
+        conditions.append("rr.post_day != '' AND rr.post_day >= ?")
+        params.append(filters['posts_after'])
+    if filters.get('posts_before'):
+        conditions.append("rr.post_day != '' AND rr.post_day < ?")
+        params.append(filters['posts_before'])
+    if filters.get('category_filter'):
+        conditions.append("rr.category = ?")
+        params.append(filters['category_filter'])
+
+    if report_type == 'category':
+        select_clause = "SELECT NULLIF(rr.category, '') AS category, SUM(rr.count) as count"
+        group_by_clause = "GROUP BY rr.category"
+        select_params = []
+    elif report_type == 'subcategory':
+        select_clause = "SELECT NULLIF(rr.category, '') AS category, NULLIF(rr.sub_category, '') AS sub_category, SUM(rr.count) as count"
+        group_by_clause = "GROUP BY rr.category, rr.sub_category"
+        select_params = []
+    elif report_type == 'subreddit_bias':
+        select_clause = f"SELECT {subreddit_column} AS subreddit, NULLIF(rr.category, '') AS category, SUM(rr.count) as count"
+        group_by_clause = "GROUP BY subreddit, rr.category"
+        select_params = subreddit_params
+    elif report_type == 'trend':
+        # Weeks start on Monday, like the base query.
+        select_clause = "SELECT date(rr.post_day, 'weekday 0', '-6 days') AS week_start, NULLIF(rr.category, '') AS category, SUM(rr.count) as count"
+        conditions.append("rr.post_day != ''")
+        group_by_clause = "GROUP BY week_start, rr.category"
+        select_params = []
+    else:
+        return None
+
+    query = (f"{select_clause} FROM report_rollups rr WHERE {' AND '.join(conditions)} "
+             f"{group_by_clause} HAVING SUM(rr.count) > 0")
+    return query, select_params + params
+
+def _filter_conditions(filters: dict) -> tuple:
+    """
+    WHERE conditions and parameters for the run, date and category filters shared by reports and
+    search, on the tables aliased r (runs) and o (opportunities).
+    """
+    conditions = []
+    params = []
+    if filters.get('run_ids'):
+        ids = filters['run_ids']
+        conditions.append("r.run_id IN ({seq})".format(seq=','.join(['?']*len(ids))))
+        params.extend(ids)
+    if filters.get('runs_after'):
+        conditions.append("r.timestamp >= ?")
+        params.append(filters['runs_after'])
+    if filters.get('runs_before'):
+        conditions.append("r.timestamp <= ?")
+        params.append(filters['runs_before'])
+    if filters.get('posts_after'):
+        conditions.append("o.post_created_utc >= ?")
+        params.append(filters['posts_after'])
+    if filters.get('posts_before'):
+        conditions.append("o.post_created_utc <= ?")
+        params.append(filters['posts_before'])
+    if filters.get('category_filter'):
+        conditions.append("o.category = ?")
+        params.append(filters['category_filter'])
+    return conditions, params
+
+DEFAULT_TOP_LIMIT = 20
+
+def _report_query(filters: dict):
+    """
+    Builds the SQL for a report. Returns (title, query, params), or None for an unknown report type.
+    Grouped reports get a 'percentage' column computed over their counts by a window function.
+    """
+    report_type = filters.get('report_type')
+
+    # Base query joining all tables
+    query = """
+        FROM opportunities o
+        JOIN run_opportunities ro ON o.opportunity_id = ro.opportunity_id
+        JOIN runs r ON ro.run_id = r.run_id
+    """
+
+    if report_type == 'duplicates':
+        # One row per near-duplicate post, attributed to the run that found it.
+        query = """
+            FROM opportunity_aliases a
+            JOIN opportunities o ON o.opportunity_id = a.opportunity_id
+            JOIN runs r ON a.run_id = r.run_id
+        """
+    if report_type == 'keyword':
+        # One row per keyword the opportunity's post matched
+        query += " JOIN json_each(o.matched_keywords) kw"
+
+    # Build WHERE clause from filters
+    conditions, params = _filter_conditions(filters)
+    if report_type == 'trend':
+        conditions.append("o.post_created_utc IS NOT NULL")
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    # --- Select and Group based on Report Type ---
+    order_by = "count DESC"
+    partition = ""
+    if report_type == 'category':
+        select_clause = "SELECT o.category, COUNT(DISTINCT o.opportunity_id) as count"
+        group_by_clause = "GROUP BY o.category"
+        title = "Category Summary"
+    elif report_type == 'subcategory':
+        select_clause = "SELECT o.category, o.sub_category, COUNT(DISTINCT o.opportunity_id) as count"
+        group_by_clause = "GROUP BY o.category, o.sub_category"
+        title = f"Sub-Category Summary for '{filters.get('category_filter', 'All')}'"
+    elif report_type == 'subreddit_bias':
+        select_clause = "SELECT r.subreddit, o.category, COUNT(DISTINCT o.opportunity_id) as count"
+        group_by_clause = "GROUP BY r.subreddit, o.category"
+        title = "Subreddit-Category Bias"
+    elif report_type == 'keyword':
+        select_clause = "SELECT kw.value AS keyword, COUNT(DISTINCT o.opportunity_id) as count"
+        group_by_clause = "GROUP BY kw.value"
+        title = "Matched Keywords"
+    elif report_type == 'prescore':
+        select_clause = f"""
+            SELECT printf('%.1f-%.1f', MIN(CAST(op.prescore * 10 AS INTEGER), 9) / 10.0,
+                          MIN(CAST(op.prescore * 10 AS INTEGER), 9) / 10.0 + 0.1) AS prescore,
+                   COUNT(*) AS count, ROUND(AVG(op.confidence_score), 2) AS avg_confidence,
+                   ROUND(100.0 * AVG(op.confidence_score >= {GOOD_CONFIDENCE}), 1) AS pct_confident
+        """
+        # Each opportunity counts once even if it is linked to several of the selected runs.
+        query = (f"FROM opportunities op WHERE op.prescore IS NOT NULL AND EXISTS (SELECT 1 {query} "
+                 f"{'AND' if conditions else 'WHERE'} o.opportunity_id = op.opportunity_id)")
+        group_by_clause = "GROUP BY 1"
+        order_by = "prescore DESC"
+        title = f"Pre-score vs. LLM Confidence (confident = {GOOD_CONFIDENCE}+)"
+    elif report_type == 'duplicates':
+        select_clause = """
+            SELECT o.opportunity_id, substr(o.title, 1, 60) AS canonical_title, COUNT(DISTINCT a.url) AS count,
+                   ROUND(MIN(a.similarity), 2) AS min_similarity, GROUP_CONCAT(DISTINCT r.subreddit) AS subreddits
+        """
+        group_by_clause = "GROUP BY o.opportunity_id"
+        title = "Near-Duplicate Clusters (count = duplicate posts reusing the analysis)"
+    elif report_type == 'trend':
+        # Weeks start on Monday; the percentage is each category's share of its week.
+        select_clause = ("SELECT date(o.post_created_utc, 'weekday 0', '-6 days') AS week_start, o.category, "
+                         "COUNT(DISTINCT o.opportunity_id) as count")
+        group_by_clause = "GROUP BY week_start, o.category"
+        order_by = "week_start, count DESC"
+        partition = "PARTITION BY q.week_start"
+        title = "Weekly Category Trend"
+    elif report_type == 'top':
+        limit = filters.get('limit') or DEFAULT_TOP_LIMIT
+        # Walks idx_opportunities_confidence from the top and stops after `limit` matches.
+        full_query = f"""
+            SELECT op.opportunity_id, op.confidence_score, op.category, op.sub_category,
+                   op.title, op.post_created_utc, op.url
+            FROM opportunities op
+            WHERE op.confidence_score IS NOT NULL AND EXISTS (SELECT 1 {query}
+                {'AND' if conditions else 'WHERE'} o.opportunity_id = op.opportunity_id)
+            ORDER BY op.confidence_score DESC, op.opportunity_id DESC
+            LIMIT ?
+        """
+        return f"Top {limit} Opportunities by Confidence", full_query, params + [limit]
+    else:
+        return None
+
+    grouped_query = f"{select_clause} {query} {group_by_clause}"
+    rollup = _rollup_report_query(filters)
+    if rollup is not None:
+        grouped_query, params = rollup
+
+    full_query = (f"SELECT q.*, ROUND(100.0 * q.count / SUM(q.count) OVER ({partition}), 2) AS percentage "
+                  f"FROM ({grouped_query}) q ORDER BY {order_by}")
+    return title, full_query, params
+
+def generate_report(filters: dict, output_format: str = "table", output_path: str = None):
+    """
+    Generates a report based on a set of filters and streams it to stdout or output_path.
     
     Args:
         filters (dict): A dictionary containing filters like:
-            'report_type': 'category', 'subcategory', or 'subreddit_bias'
+            'report_type': 'category', 'subcategory', 'subreddit_bias', 'keyword', 'prescore',
+                           'duplicates', 'trend' or 'top'
             'run_ids': list of ints
             'runs_after'/'runs_before': 'YYYY-MM-DD' strings
             'posts_after'/'posts_before': 'YYYY-MM-DD' strings
             'category_filter': string for filtering by main category
+            'limit': number of opportunities in the 'top' report
+        output_format: one of report_writers.WRITERS ('table', 'csv', 'jsonl', 'parquet', 'arrow')
     """
-    conn = get_db_connection()
-    try:
-        report_type = filters.get('report_type')
-        
-        # Base query joining all tables
-        query = """
-            FROM opportunities o
+    report = _report_query(filters)
+    if report is None:
+        print("Invalid report type specified.")
+        return
+    title, query, params = report
+    columns, rows = _stream_query(query, params)
+    write_rows(f"Report: {title}", columns, rows, output_format, output_path)
+
+DEFAULT_SEARCH_LIMIT = 20
+# Marks the matched terms in search snippets.
+SEARCH_HIGHLIGHT = ("[", "]")
+
+def search_opportunities(query: str, filters: dict = None, limit: int = DEFAULT_SEARCH_LIMIT,
+                         output_format: str = "table", output_path: str = None):
+    """
+    Full-text search over opportunities, best bm25 matches first, with a highlighted snippet of each.
+
+    Args:
+        query: an FTS5 query: words, "exact phrases", prefix*, AND/OR/NOT and NEAR(...).
+               Words are stemmed, so "invoicing" also finds "invoice".
+        filters: the run, date and category filters of generate_report.
+    Raises ValueError for a malformed query.
+    """
+    conditions, params = _filter_conditions(filters or {})
+    # Each opportunity is listed once even if it is linked to several of the selected runs.
+    full_query = f"""
+        SELECT op.opportunity_id, ROUND(-f.rank, 2) AS relevance, op.category, op.sub_category,
+               op.confidence_score, date(op.post_created_utc) AS posted, op.url,
+               snippet(opportunities_fts, -1, ?, ?, '...', 12) AS snippet
+        FROM opportunities_fts f
+        JOIN opportunities op ON op.opportunity_id = f.rowid
+        WHERE f.opportunities_fts MATCH ? AND EXISTS (
+            SELECT 1 FROM opportunities o
             JOIN run_opportunities ro ON o.opportunity_id = ro.opportunity_id
             JOIN runs r ON ro.run_id = r.run_id
-        """
-        
-        conditions = []
-        params = []
-        
-        # Build WHERE clause from filters
-        if filters.get('run_ids'):
-            ids = filters['run_ids']
-            conditions.append("r.run_id IN ({seq})".format(seq=','.join(['?']*len(ids))))
-            params.extend(ids)
-        if filters.get('runs_after'):
-            conditions.append("r.timestamp >= ?")
-            params.append(filters['runs_after'])
-        if filters.get('runs_before'):
-            conditions.append("r.timestamp <= ?")
-            params.append(filters['runs_before'])
-        if filters.get('posts_after'):
-            conditions.append("o.post_created_utc >= ?")
-            params.append(filters['posts_after'])
-        if filters.get('posts_before'):
-            conditions.append("o.post_created_utc <= ?")
-            params.append(filters['posts_before'])
-        if filters.get('category_filter'):
-            conditions.append("o.category = ?")
-            params.append(filters['category_filter'])
-
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-
-        # --- Select and Group based on Report Type ---
-        if report_type == 'category':
-            select_clause = "SELECT o.category, COUNT(DISTINCT o.opportunity_id) as count"
-            group_by_clause = "GROUP BY o.category"
-            title = "Category Summary"
-        elif report_type == 'subcategory':
-            select_clause = "SELECT o.category, o.sub_category, COUNT(DISTINCT o.opportunity_id) as count"
-            group_by_clause = "GROUP BY o.category, o.sub_category"
-            title = f"Sub-Category Summary for '{filters.get('category_filter', 'All')}'"
-        elif report_type == 'subreddit_bias':
-            select_clause = "SELECT r.subreddit, o.category, COUNT(DISTINCT o.opportunity_id) as count"
-            group_by_clause = "GROUP BY r.subreddit, o.category"
-            title = "Subreddit-Category Bias"
-        else:
-            print("Invalid report type specified.")
-            return
-
-        full_query = f"{select_clause} {query} {group_by_clause} ORDER BY count DESC"
-        
-        df = pd.read_sql_query(full_query, conn, params=params)
-        
-        print(f"\n--- Report: {title} ---")
-        if df.empty:
-            print("No data found for the specified criteria.")
-        else:
-            # Calculate and add percentage column
-            total = df['count'].sum()
-            df['percentage'] = (df['count'] / total * 100).round(2).astype(str) + '%' # Corrected percentage calculation
-            print(df.to_string(index=False))
-        print("--------------------------------\n")
-
-    finally:
-        conn.close()
+            WHERE {' AND '.join(conditions + ['o.opportunity_id = op.opportunity_id'])}
+        )
+        ORDER BY f.rank
+        LIMIT ?
+    """
+    try:
+        columns, rows = _stream_query(full_query, [*SEARCH_HIGHLIGHT, query, *params, limit])
+    except sqlite3.OperationalError as e:
+        raise ValueError(f"Invalid search query {query!r}: {e}. Put phrases with punctuation in double quotes.")
+    write_rows(f"Search: {query}", columns, rows, output_format, output_path,
+               empty_message="No opportunities match the search.")
@@ -0,0 +1,107 @@
+import json
+import os
+from typing import Iterator, List, Optional
+from tqdm import tqdm
+from .keyword_matcher import KeywordMatcher
+
+# Reddit dumps are compressed with a long window; the decoder must be allowed to use it.
+ZSTD_MAX_WINDOW_SIZE = 2 ** 31
+READ_CHUNK_SIZE = 1 << 20
+
+
+def _open_decompressed(raw):
+    """Wraps a binary file in a streaming decompressor based on its name (.zst or plain NDJSON)."""
+    if raw.name.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Reading .zst dumps requires the 'zstandard' package (pip install zstandard).")
+        return zstandard.ZstdDecompressor(max_window_size=ZSTD_MAX_WINDOW_SIZE).stream_reader(raw, read_size=READ_CHUNK_SIZE)
+    return raw
+
+
+def iter_lines(stream, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yields the lines of a binary stream, reading it in fixed-size chunks."""
+    remainder = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (remainder + chunk).split(b"\n")
+        remainder = lines.pop()
+        yield from lines
+    if remainder:
+        yield remainder
+
+
+class DumpScanner:
+    """
+    Streams submissions out of a Pushshift-style NDJSON dump (optionally zstd-compressed) in
+    constant memory. Subreddit, date range and keyword filters are applied during the scan:
+    a cheap substring check on the raw line comes first, so most lines are never JSON-parsed.
+    Keywords are matched like filter_posts does, in the given KeywordMatcher mode.
+    """
+    def __init__(self, path: str, subreddit: str = None, start_ts: int = None, end_ts: int = None,
+                 keywords: Optional[List[str]] = None, show_progress: bool = True, keyword_match: str = "substring"):
+        self.path = path
+        self.subreddit = subreddit.lower() if subreddit else None
+        self.start_ts = start_ts
+        self.end_ts = end_ts
+        self.keyword_matcher = KeywordMatcher(keywords, mode=keyword_match) if keywords else None
+        self.show_progress = show_progress
+        self.lines_scanned = 0
+        self.matches = 0
+
+    def _matches(self, post: dict) -> bool:
+        if self.subreddit and (post.get("subreddit") or "").lower() != self.subreddit:
+            return False
+        if self.start_ts is not None or self.end_ts is not None:
+            try:
+                created = int(float(post.get("created_utc")))
+            except (TypeError, ValueError):
+                return False
+            if self.start_ts is not None and created < self.start_ts:
+                return False
+            if self.end_ts is not None and created >= self.end_ts:
+                return False
+        if self.keyword_matcher is not None:
+            if not self.keyword_matcher.matches(f"{post.get('title') or ''} {post.get('selftext') or ''}"):
+                return False
+        return True
+
+    def __iter__(self) -> Iterator[dict]:
+        subreddit_bytes = self.subreddit.encode("utf-8") if self.subreddit else None
+        # Dumps may \u-escape non-ASCII text, so only ASCII keywords can be pre-checked on the raw line.
+        terms = self.keyword_matcher.prefilter_terms() if self.keyword_matcher is not None else []
+        keyword_bytes = [t.encode("ascii") for t in terms] if all(t.isascii() for t in terms) else []
+
+        with open(self.path, "rb") as raw:
+            progress = tqdm(
+                total=os.path.getsize(self.path), unit="B", unit_scale=True,
+                desc=f"Scanning {os.path.basename(self.path)}", disable=not self.show_progress,
+            )
+            position = 0
+            try:
+                for line in iter_lines(_open_decompressed(raw)):
+                    self.lines_scanned += 1
+                    if self.lines_scanned % 50000 == 0:
+                        progress.update(raw.tell() - position)
+                        position = raw.tell()
+                        progress.set_postfix(lines=self.lines_scanned, matches=self.matches)
+
+                    lowered = line.lower()
+                    if subreddit_bytes and subreddit_bytes not in lowered:
+                        continue
+                    if keyword_bytes and not any(k in lowered for k in keyword_bytes):
+                        continue
+                    try:
+                        post = json.loads(line)
+                    except ValueError:
+                        continue
+                    if self._matches(post):
+                        self.matches += 1
+                        yield post
+                progress.update(raw.tell() - position)
+                progress.set_postfix(lines=self.lines_scanned, matches=self.matches)
+            finally:
+                progress.close()
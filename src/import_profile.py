@@ -0,0 +1,54 @@
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# The analysis stack. 'report' and 'db' should start without any of these.
+HEAVY_PACKAGES = ("langgraph", "langchain", "langchain_core", "langchain_groq", "groq", "praw", "pandas", "numpy", "tqdm")
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)\s*$")
+
+
+def parse_import_times(stderr: str) -> Tuple[List[Tuple[str, int, int, int]], str]:
+    """
+    Splits the output of `python -X importtime` from the rest of stderr.
+    Returns ([(module, self_us, cumulative_us, depth), ...], other stderr).
+    """
+    imports, other = [], []
+    for line in stderr.splitlines(keepends=True):
+        match = _LINE_RE.match(line.rstrip("\n"))
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            imports.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+        elif not line.startswith("import time: self [us]"):
+            other.append(line)
+    return imports, "".join(other)
+
+
+def package_times(imports: List[Tuple[str, int, int, int]]) -> Dict[str, int]:
+    """Microseconds spent importing each top-level package, counting every module's own time once."""
+    totals = {}
+    for module, self_us, _, _ in imports:
+        package = module.split(".")[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return totals
+
+
+def heavy_packages(imports: List[Tuple[str, int, int, int]]) -> List[str]:
+    loaded = {module.split(".")[0] for module, _, _, _ in imports}
+    return [package for package in HEAVY_PACKAGES if package in loaded]
+
+
+def profile_command(script: str, argv: List[str], top: int = 15) -> int:
+    """Runs `script argv` under -X importtime and prints where its import time went. Returns its exit code."""
+    result = subprocess.run([sys.executable, "-X", "importtime", script, *argv], stderr=subprocess.PIPE, text=True)
+    imports, other = parse_import_times(result.stderr)
+    sys.stderr.write(other)
+
+    totals = package_times(imports)
+    print(f"\n--- Import time: {sum(totals.values()) / 1000:.0f} ms in {len(imports)} modules ---", file=sys.stderr)
+    for package, us in sorted(totals.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {package:<32} {us / 1000:>8.1f} ms", file=sys.stderr)
+    heavy = heavy_packages(imports)
+    print(f"Analysis stack loaded: {', '.join(heavy) if heavy else 'none'}", file=sys.stderr)
+    return result.returncode
@@ -0,0 +1,132 @@
+import re
+from typing import Dict, List
+
+MATCH_MODES = ("substring", "word", "stem")
+
+# Suffixes stripped from the last word of a keyword in 'stem' mode, longest first.
+_SUFFIXES = ("ations", "ation", "ings", "ing", "ies", "ied", "ers", "ed", "es", "er", "ly", "s", "e")
+_MIN_STEM_LENGTH = 3
+_END = ""
+
+
+def normalize_keyword(keyword: str) -> str:
+    return " ".join(keyword.lower().split())
+
+
+def stem_word(word: str) -> str:
+    """Crude suffix stripping: 'invoicing', 'invoices' and 'invoice' all become 'invoic'."""
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= _MIN_STEM_LENGTH:
+            return word[:-len(suffix)]
+    return word
+
+
+def _trie_regex(node: dict) -> str:
+    """
+    Turns a character trie into a regex in which common prefixes are shared,
+    e.g. {"invoice", "invoicing", "invest"} -> "inv(?:e(?:st)|oic(?:e|ing))".
+    Longer continuations are tried first, so a match is the longest keyword at its position.
+    """
+    branches = []
+    for char in sorted(k for k in node if k != _END):
+        atom = r"\s+" if char == " " else re.escape(char)
+        branches.append(atom + _trie_regex(node[char]))
+    if not branches:
+        return ""
+    if _END in node:
+        return "(?:" + "|".join(branches) + ")?"
+    if len(branches) == 1:
+        return branches[0]
+    return "(?:" + "|".join(branches) + ")"
+
+
+class KeywordMatcher:
+    """
+    Finds which of a (possibly long) list of keywords occur in a text, in one pass.
+    The keywords are compiled once into a single trie-shaped regex, so matching a post
+    costs about one scan of its text no matter how many keywords there are.
+
+    Modes:
+      'substring' - a keyword may occur anywhere, also inside longer words (the original behavior)
+      'word'      - a keyword must start and end on word boundaries
+      'stem'      - like 'word', but the last word of a keyword also matches its inflections
+                    ('invoicing' matches 'invoice' and 'invoices')
+    Phrases match across any whitespace between their words.
+    """
+    def __init__(self, keywords: List[str], mode: str = "substring"):
+        if mode not in MATCH_MODES:
+            raise ValueError(f"Unknown keyword match mode: {mode}")
+        self.mode = mode
+
+        # Pattern key (normalized keyword, or its stem) -> the keywords it stands for, in input order.
+        self._keywords_by_key: Dict[str, List[str]] = {}
+        for keyword in keywords:
+            normalized = normalize_keyword(keyword)
+            if not normalized:
+                continue
+            if mode == "stem":
+                *head, last = normalized.split(" ")
+                normalized = " ".join(head + [stem_word(last)])
+            self._keywords_by_key.setdefault(normalized, [])
+            if keyword not in self._keywords_by_key[normalized]:
+                self._keywords_by_key[normalized].append(keyword)
+        self.keywords = [k for ks in self._keywords_by_key.values() for k in ks]
+
+        # At each position the regex reports only the longest key, so remember which shorter
+        # keys are also matched whenever a longer one is.
+        self._implied: Dict[str, List[str]] = {}
+        for key in self._keywords_by_key:
+            self._implied[key] = [
+                other for other in self._keywords_by_key
+                if other != key and key.startswith(other) and self._prefix_matches(key, other)
+            ]
+
+        trie: dict = {}
+        for key in self._keywords_by_key:
+            node = trie
+            for char in key:
+                node = node.setdefault(char, {})
+            node[_END] = {}
+        body = _trie_regex(trie) if trie else r"(?!)"
+        if mode == "substring":
+            pattern = f"(?=({body}))"
+        elif mode == "word":
+            pattern = rf"(?<!\w)(?=({body})(?!\w))"
+        else:
+            pattern = rf"(?<!\w)({body})"
+        # The lookahead form reports overlapping matches ('invoice' and 'voice' in 'invoices').
+        self._regex = re.compile(pattern)
+
+    def _prefix_matches(self, key: str, prefix: str) -> bool:
+        if self.mode == "word":
+            # A shorter keyword inside a longer match only counts if it ends on a word boundary.
+            return not re.match(r"\w", key[len(prefix)])
+        return True
+
+    def prefilter_terms(self) -> List[str]:
+        """
+        Lowercase substrings of which every matching text contains at least one, for a cheap check
+        before matching: the longest word of each keyword, stemmed in 'stem' mode ('invoic' for 'invoicing').
+        """
+        terms = []
+        for key in self._keywords_by_key:
+            term = max(key.split(" "), key=len)
+            if term not in terms:
+                terms.append(term)
+        return terms
+
+    def find(self, text: str) -> List[str]:
+        """Returns the keywords that occur in text, in the order they were given."""
+        if not text:
+            return []
+        found = set()
+        for match in self._regex.finditer(text.lower()):
+            key = normalize_keyword(match.group(1))
+            if key in found:
+                continue
+            found.add(key)
+            found.update(self._implied.get(key, []))
+        return [k for key, ks in self._keywords_by_key.items() if key in found for k in ks]
+
+    def matches(self, text: str) -> bool:
+        return bool(text) and self._regex.search(text.lower()) is not None
@@ -1,10 +1,26 @@
 from langchain_groq import ChatGroq
 from langchain.prompts import ChatPromptTemplate
+from langchain_core.exceptions import OutputParserException
 from langchain_core.output_parsers import JsonOutputParser
 from pydantic.v1 import BaseModel, Field
-from typing import List
-from .config import api_keys
+from typing import List, Dict
+from . import config
+from . import database, metrics
+from .output_repair import REQUIRED_FIELDS, OutputRepairer, extract_json
+from .prompt_packer import estimate_tokens
+from .rate_limiter import shared_limiter
+import hashlib
+import httpx
 import json
+import threading
+import unicodedata
+
+MODEL_NAME = "llama-3.3-70b-versatile"
+
+# Rough output size of one OpportunityAnalysis object, reserved per post when packing batches.
+BATCH_OUTPUT_TOKENS_PER_POST = 400
+# Output tokens reserved for a re-ask, which returns only the fields that could not be repaired.
+REASK_OUTPUT_TOKENS = 200
 
 # --- Category Definitions ---
 CATEGORIES = {
@@ -39,15 +55,38 @@ class LLMAnalyzer:
     """
     Uses a LangChain model to analyze Reddit posts and return structured JSON.
     """
-    def __init__(self):
+    def __init__(self, use_cache: bool = True, cache_max_age_days: int = 90, cache_max_entries: int = 50000):
+        self.model_name = MODEL_NAME
+        self.limiter = shared_limiter("groq", config.GROQ_REQUESTS_PER_MINUTE, config.GROQ_TOKENS_PER_MINUTE)
         self.llm = ChatGroq(
-            model_name="llama-3.3-70b-versatile",
-            groq_api_key=api_keys.get("groq_api_key"),
+            model_name=self.model_name,
+            groq_api_key=config.api_keys.get("groq_api_key"),
             model_kwargs={"response_format": {"type": "json_object"}},
+            # Retries and pacing are handled by the shared limiter, which also reads Groq's rate-limit headers.
+            max_retries=0,
+            http_client=httpx.Client(event_hooks={"response": [lambda response: self.limiter.observe_headers(response.headers)]}),
         )
         self.parser = JsonOutputParser(pydantic_object=OpportunityAnalysis)
         self.prompt_template = self._create_prompt_template()
-        self.chain = self.prompt_template | self.llm | self.parser
+        self.batch_prompt_template = self._create_batch_prompt_template()
+        self._overhead_tokens = None
+        self.prompt_version = self._compute_prompt_version()
+        # The chains stop at the model so token usage can be read before the reply is parsed.
+        self.chain = self.prompt_template | self.llm
+        self.batch_chain = self.batch_prompt_template | self.llm
+        self.batch_parser = JsonOutputParser()
+        # Replies are repaired locally; the model is asked again only for fields that cannot be.
+        self.repairer = OutputRepairer(CATEGORIES)
+        self.reask_template = self._create_reask_template()
+        self.reask_chain = self.reask_template | self.llm
+
+        self.use_cache = use_cache
+        self.cache_max_age_days = cache_max_age_days
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._stats_lock = threading.Lock()
+        if self.use_cache:
+            database.evict_llm_cache(max_entries=cache_max_entries, max_age_days=cache_max_age_days)
 
     def _create_prompt_template(self):
         """
@@ -56,7 +95,7 @@ class LLMAnalyzer:
         # Format the categories and sub-categories for the prompt
         category_text = json.dumps(CATEGORIES, indent=2)
 
-        template = '''
+        self._template_text = '''
         You are an expert business analyst. Your task is to analyze the following Reddit post and its comments
         to identify potential business opportunities and classify them.
 
@@ -80,20 +119,336 @@ class LLMAnalyzer:
         {format_instructions}
         '''
         return ChatPromptTemplate.from_template(
-            template,
+            self._template_text,
             partial_variables={
                 "format_instructions": self.parser.get_format_instructions(),
                 "category_structure": category_text
             }
         )
 
+    def _create_batch_prompt_template(self):
+        """
+        Creates the prompt template for analyzing several posts in one request.
+        The category structure and format instructions are sent once for the whole batch.
+        """
+        category_text = json.dumps(CATEGORIES, indent=2)
+
+        self._batch_template_text = '''
+        You are an expert business analyst. Your task is to analyze each of the following Reddit posts and their
+        comments to identify potential business opportunities and classify them. Analyze every post independently.
+
+        {posts}
+
+        **Instructions:**
+        1.  For each post, analyze the content to identify user pain points, potential business ideas, and automation opportunities.
+        2.  First, choose the single most relevant **main category** for the opportunity from the keys in the JSON structure below.
+        3.  Second, choose the single most relevant **sub-category** from the list corresponding to your chosen main category.
+        4.  Return a JSON object with a single key "analyses". Its value must be an array with exactly one object per post.
+            Each object must contain a "post_id" field with the post's ID, plus every field described by the format instructions.
+
+        **Category and Sub-Category Structure:**
+        ```json
+        {category_structure}
+        ```
+
+        {format_instructions}
+        '''
+        return ChatPromptTemplate.from_template(
+            self._batch_template_text,
+            partial_variables={
+                "format_instructions": self.parser.get_format_instructions(),
+                "category_structure": category_text
+            }
+        )
+
+    def _create_reask_template(self):
+        """
+        Creates the prompt asking the model for just the fields of an analysis that were missing or invalid.
+        The partial analysis stands in for the post, so the post is not sent again.
+        """
+        return ChatPromptTemplate.from_template('''
+        You are an expert business analyst. You analyzed the Reddit post titled "{post_title}" and produced
+        this analysis:
+        ```json
+        {analysis}
+        ```
+
+        These fields are missing or invalid: {fields}. {constraints}
+
+        Return a JSON object containing only these fields:
+        {field_descriptions}
+        ''')
+
+    def _compute_prompt_version(self) -> str:
+        """
+        Returns a short hash identifying the prompts, category structure and format instructions.
+        Stored with each opportunity so stale analyses can be detected when the prompt changes.
+        """
+        material = "\n".join([
+            self._template_text,
+            self._batch_template_text,
+            json.dumps(CATEGORIES, sort_keys=True),
+            self.parser.get_format_instructions(),
+        ])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()[:12]
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+    def cache_key(self, post_title: str, post_body: str, comments: List[str]) -> str:
+        """
+        Content address of an analysis: the normalized inputs plus the model and prompt version.
+        """
+        payload = json.dumps({
+            "model": self.model_name,
+            "prompt_version": self.prompt_version,
+            "title": self._normalize(post_title),
+            "body": self._normalize(post_body),
+            "comments": [self._normalize(c) for c in comments],
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def cache_stats(self) -> dict:
+        with self._stats_lock:
+            return {"hits": self.cache_hits, "misses": self.cache_misses}
+
+    def _cache_lookup(self, key: str):
+        cached = database.get_cached_analysis(key, max_age_days=self.cache_max_age_days)
+        if cached is not None:
+            # Entries cached before validation existed may hold invalid categories; repair or skip them.
+            cached, _, invalid = self.repairer.repair(json.loads(cached))
+            if invalid:
+                cached = None
+        with self._stats_lock:
+            if cached is not None:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+        metrics.LLM_CACHE.inc(result="miss" if cached is None else "hit")
+        return cached
+
+    def _cache_store(self, key: str, result: dict):
+        database.put_cached_analysis(key, self.model_name, self.prompt_version, json.dumps(result))
+
+    @staticmethod
+    def _format_comments(comments: List[str]) -> str:
+        return "\n".join([f"- {comment}" for comment in comments])
+
     def analyze_post(self, post_title: str, post_body: str, comments: List[str]) -> dict:
         """
         Analyzes a single post and returns a structured dictionary.
+        Identical inputs analyzed with the same model and prompt are served from the cache.
+        """
+        key = None
+        if self.use_cache:
+            key = self.cache_key(post_title, post_body, comments)
+            cached = self._cache_lookup(key)
+            if cached is not None:
+                return cached
+
+        return self._analyze_uncached(post_title, post_body, comments, key)
+
+    def _prompt_overhead_tokens(self) -> int:
+        """Estimated tokens of the instructions, categories and format instructions sent with every request."""
+        if self._overhead_tokens is None:
+            self._overhead_tokens = estimate_tokens(self._batch_template_text) \
+                + estimate_tokens(json.dumps(CATEGORIES, indent=2)) \
+                + estimate_tokens(self.parser.get_format_instructions())
+        return self._overhead_tokens
+
+    def _request_tokens(self, posts_text: str, num_posts: int = 1) -> int:
+        return self._prompt_overhead_tokens() + estimate_tokens(posts_text) + BATCH_OUTPUT_TOKENS_PER_POST * num_posts
+
+    @staticmethod
+    def _parse(message, parser, mode: str):
+        """Records the token usage Groq reported for a reply and parses it into JSON."""
+        usage = getattr(message, "usage_metadata", None) or {}
+        metrics.LLM_TOKENS.inc(usage.get("input_tokens", 0), kind="input")
+        metrics.LLM_TOKENS.inc(usage.get("output_tokens", 0), kind="output")
+        with metrics.LLM_PARSE_SECONDS.time(mode=mode):
+            try:
+                return parser.invoke(message)
+            except OutputParserException:
+                # Prose around the JSON, trailing commas and similar slips.
+                try:
+                    return extract_json(message.content)
+                except ValueError:
+                    metrics.LLM_OUTPUTS.inc(outcome="rejected")
+                    raise
+
+    def _validate(self, raw, post_title: str) -> dict:
         """
-        comment_text = "\n".join([f"- {comment}" for comment in comments])
-        return self.chain.invoke({
+        Checks an analysis against the schema and the category taxonomy, repairs what it can locally
+        and asks the model again only for the fields that are still invalid.
+        Raises ValueError if the analysis cannot be made valid.
+        """
+        analysis, repaired, invalid = self.repairer.repair(raw)
+        for field in repaired:
+            metrics.LLM_FIELD_FIXES.inc(field=field, action="repaired")
+        if not invalid:
+            metrics.LLM_OUTPUTS.inc(outcome="repaired" if repaired else "valid")
+            return analysis
+        if len(invalid) == len(REQUIRED_FIELDS):
+            # Nothing to build on. The post is not sent again: the same prompt would likely fail the same way.
+            metrics.LLM_OUTPUTS.inc(outcome="rejected")
+            raise ValueError("The model output is not an analysis.")
+
+        for field in invalid:
+            metrics.LLM_FIELD_FIXES.inc(field=field, action="reasked")
+        try:
+            answer = self._reask(post_title, analysis, invalid)
+        except Exception as e:
+            metrics.LLM_OUTPUTS.inc(outcome="rejected")
+            raise ValueError(f"Asking again for {', '.join(invalid)} failed: {e}")
+        answer = answer if isinstance(answer, dict) else {}
+        analysis, _, invalid = self.repairer.repair({**analysis, **{field: answer.get(field) for field in invalid}})
+        if invalid:
+            metrics.LLM_OUTPUTS.inc(outcome="rejected")
+            raise ValueError(f"Invalid {', '.join(invalid)} in the model output, even after asking again.")
+        metrics.LLM_OUTPUTS.inc(outcome="reasked")
+        return analysis
+
+    def _reask(self, post_title: str, analysis: dict, fields: List[str]):
+        """Asks the model for the given fields of an analysis only."""
+        constraints = []
+        if "category" in fields:
+            constraints.append("category and sub_category must come from this structure: " + json.dumps(CATEGORIES))
+        elif "sub_category" in fields:
+            constraints.append(f"sub_category must be one of: {', '.join(CATEGORIES[analysis['category']])}.")
+        if "confidence_score" in fields:
+            constraints.append("confidence_score must be an integer from 1 to 10.")
+        inputs = {
+            "post_title": post_title,
+            "analysis": json.dumps(analysis, indent=2),
+            "fields": ", ".join(fields),
+            "constraints": " ".join(constraints),
+            "field_descriptions": "\n".join(f"- {field}: {OpportunityAnalysis.__fields__[field].field_info.description}"
+                                            for field in fields),
+        }
+        tokens = estimate_tokens(self.reask_template.format(**inputs)) + REASK_OUTPUT_TOKENS
+        message = self.limiter.call(self.reask_chain.invoke, inputs, tokens=tokens, operation="chat_reask")
+        return self._parse(message, self.batch_parser, "reask")
+
+    def _analyze_uncached(self, post_title: str, post_body: str, comments: List[str], key: str = None) -> dict:
+        inputs = {
             "post_title": post_title,
             "post_body": post_body,
-            "comments": comment_text
-        })
\ No newline at end of file
+            "comments": self._format_comments(comments)
+        }
+        message = self.limiter.call(self.chain.invoke, inputs, tokens=self._request_tokens(" ".join(inputs.values())), operation="chat")
+        result = self._validate(self._parse(message, self.parser, "single"), post_title)
+
+        if key is not None:
+            self._cache_store(key, result)
+        return result
+
+    def _format_batch_post(self, post: dict) -> str:
+        return (
+            f"### Post ID: {post['post_id']}\n"
+            f"**Post Title:** {post['post_title']}\n"
+            f"**Post Body:** {post['post_body']}\n\n"
+            f"**Top Comments:**\n{self._format_comments(post['comments'])}\n"
+        )
+
+    def pack_batches(self, posts: List[dict], max_posts: int, token_budget: int) -> List[List[dict]]:
+        """
+        Greedily groups posts into batches of at most max_posts whose estimated prompt
+        plus output size stays within token_budget. A post that is too large on its own
+        gets a batch of its own.
+        """
+        fixed_cost = self._prompt_overhead_tokens()
+        batches = []
+        current, current_cost = [], fixed_cost
+        for post in posts:
+            cost = estimate_tokens(self._format_batch_post(post)) + BATCH_OUTPUT_TOKENS_PER_POST
+            if current and (len(current) >= max_posts or current_cost + cost > token_budget):
+                batches.append(current)
+                current, current_cost = [], fixed_cost
+            current.append(post)
+            current_cost += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    def analyze_posts_batch(self, posts: List[dict], errors: Dict[str, Exception] = None) -> Dict[str, dict]:
+        """
+        Analyzes several posts in a single request.
+        Each post is a dict with post_id, post_title, post_body and comments.
+        Returns {post_id: analysis}; posts that could not be analyzed are left out, and the error
+        that ended each of them is added to `errors` if given.
+        """
+        results = {}
+        pending = []
+        for post in posts:
+            if self.use_cache:
+                key = self.cache_key(post["post_title"], post["post_body"], post["comments"])
+                cached = self._cache_lookup(key)
+                if cached is not None:
+                    results[post["post_id"]] = cached
+                    continue
+            pending.append(post)
+
+        self._analyze_uncached_batch(pending, results, {} if errors is None else errors)
+        return results
+
+    def _analyze_uncached_batch(self, posts: List[dict], results: Dict[str, dict], errors: Dict[str, Exception]):
+        """
+        Sends one batch request and keeps every well-formed item. Only the posts whose
+        item is missing are retried: as a smaller batch if some items came back, split in
+        half if the whole request failed, and on their own as a last resort. An item that
+        fails validation is rejected, not sent again.
+        """
+        if not posts:
+            return
+        if len(posts) == 1:
+            post = posts[0]
+            key = self.cache_key(post["post_title"], post["post_body"], post["comments"]) if self.use_cache else None
+            try:
+                results[post["post_id"]] = self._analyze_uncached(post["post_title"], post["post_body"], post["comments"], key)
+            except Exception as e:
+                print(f"Could not analyze or parse post {post['post_id']}: {e}")
+                errors[post["post_id"]] = e
+            return
+
+        try:
+            posts_text = "\n".join(self._format_batch_post(p) for p in posts)
+            message = self.limiter.call(self.batch_chain.invoke, {"posts": posts_text},
+                                        tokens=self._request_tokens(posts_text, len(posts)), operation="chat_batch")
+            raw = self._parse(message, self.batch_parser, "batch")
+            items = raw.get("analyses", []) if isinstance(raw, dict) else raw
+        except Exception as e:
+            print(f"Batch request for {len(posts)} posts failed, splitting it: {e}")
+            items = []
+
+        titles = {str(p["post_id"]): p["post_title"] for p in posts}
+        ids = {str(p["post_id"]): p["post_id"] for p in posts}
+        parsed = {}
+        rejected = set()
+        for item in items if isinstance(items, list) else []:
+            if not isinstance(item, dict) or str(item.get("post_id")) not in titles:
+                continue
+            try:
+                parsed[str(item["post_id"])] = self._validate(item, titles[str(item["post_id"])])
+            except ValueError as e:
+                print(f"Could not validate the analysis of post {item['post_id']}: {e}")
+                rejected.add(str(item["post_id"]))
+                errors[ids[str(item["post_id"])]] = e
+
+        failed = []
+        for post in posts:
+            analysis = parsed.get(str(post["post_id"]))
+            if analysis is None:
+                if str(post["post_id"]) not in rejected:
+                    failed.append(post)
+                continue
+            results[post["post_id"]] = analysis
+            if self.use_cache:
+                self._cache_store(self.cache_key(post["post_title"], post["post_body"], post["comments"]), analysis)
+
+        if len(failed) == len(posts):
+            middle = len(failed) // 2
+            self._analyze_uncached_batch(failed[:middle], results, errors)
+            self._analyze_uncached_batch(failed[middle:], results, errors)
+        else:
+            self._analyze_uncached_batch(failed, results, errors)
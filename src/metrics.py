@@ -0,0 +1,264 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is +Inf.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def _labels(self, key: tuple, **extra) -> Dict[str, str]:
+        return {**dict(zip(self.label_names, key)), **extra}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self, **labels) -> float:
+        """Sum over all series whose labels match the given ones."""
+        with self._lock:
+            return sum(v for k, v in self._values.items() if all(self._labels(k).get(n) == str(l) for n, l in labels.items()))
+
+    def samples(self):
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                yield self.name, self._labels(key), value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the duration of a with-block; also usable as a function decorator."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def totals(self, **labels):
+        """(count, sum) over all series whose labels match the given ones."""
+        count, seconds = 0, 0.0
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                if all(self._labels(key).get(n) == str(l) for n, l in labels.items()):
+                    count += sum(counts)
+                    seconds += total
+        return count, seconds
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(counts), total) for key, (counts, total) in self._values.items())
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", self._labels(key, le="+Inf" if bound == float("inf") else repr(bound)), cumulative
+            yield f"{self.name}_sum", self._labels(key), total
+            yield f"{self.name}_count", self._labels(key), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name: str, help_text: str, label_names=()) -> Counter:
+        metric = Counter(name, help_text, label_names)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, label_names=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, label_names, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def reset(self):
+        for metric in self.metrics:
+            with metric._lock:
+                metric._values.clear()
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+NODE_SECONDS = REGISTRY.histogram("miner_node_duration_seconds", "Time spent in each analysis graph node.", ["node"])
+STAGE_POSTS = REGISTRY.counter("miner_stage_posts_total", "Posts entering and leaving each pipeline stage.", ["stage", "direction"])
+API_SECONDS = REGISTRY.histogram("miner_api_request_duration_seconds", "Latency of each attempt of a Reddit, Pushshift or Groq call.", ["provider", "operation"])
+RATE_LIMIT_WAIT_SECONDS = REGISTRY.histogram("miner_rate_limit_wait_seconds", "Time calls waited for the shared rate limiter.", ["provider"])
+API_RETRIES = REGISTRY.counter("miner_api_retries_total", "Calls retried after rate limiting or a transient error.", ["provider", "reason"])
+API_ERRORS = REGISTRY.counter("miner_api_errors_total", "Calls that failed for good.", ["provider", "operation"])
+LLM_TOKENS = REGISTRY.counter("miner_llm_tokens_total", "Tokens reported by the LLM provider.", ["kind"])
+LLM_PARSE_SECONDS = REGISTRY.histogram("miner_llm_parse_duration_seconds", "Time spent parsing LLM responses into JSON.", ["mode"])
+LLM_OUTPUTS = REGISTRY.counter("miner_llm_outputs_total", "LLM analyses by validation outcome: valid, repaired, reasked or rejected.", ["outcome"])
+LLM_FIELD_FIXES = REGISTRY.counter("miner_llm_field_fixes_total", "Analysis fields repaired locally or re-asked from the model.", ["field", "action"])
+LLM_CACHE = REGISTRY.counter("miner_llm_cache_lookups_total", "LLM result cache lookups.", ["result"])
+COMMENT_CACHE = REGISTRY.counter("miner_comment_cache_lookups_total", "Comment cache lookups, one per post.", ["result"])
+DB_WRITE_SECONDS = REGISTRY.histogram("miner_db_write_duration_seconds", "Duration of SQLite write transactions.", ["operation"])
+DB_ROWS = REGISTRY.counter("miner_db_rows_written_total", "Rows handed to SQLite write transactions.", ["operation"])
+
+
+# --- Per-run summaries ---
+# Node timings and post counts can be attributed to a run; API, LLM and DB figures are process-wide.
+
+_runs: Dict[int, dict] = {}
+_runs_lock = threading.Lock()
+
+
+def record_node(run_id: int, node: str, seconds: float, posts_in: Optional[int] = None, posts_out: Optional[int] = None):
+    """Records one pass through a graph node (or the streaming writer) for the histograms and the run's summary."""
+    NODE_SECONDS.observe(seconds, node=node)
+    if posts_in is not None:
+        STAGE_POSTS.inc(posts_in, stage=node, direction="in")
+    if posts_out is not None:
+        STAGE_POSTS.inc(posts_out, stage=node, direction="out")
+    with _runs_lock:
+        run = _runs.setdefault(run_id, {"started_at": time.time(), "nodes": {}})
+        stats = run["nodes"].setdefault(node, {"calls": 0, "seconds": 0.0, "posts_in": 0, "posts_out": 0})
+        stats["calls"] += 1
+        stats["seconds"] += seconds
+        stats["posts_in"] += posts_in or 0
+        stats["posts_out"] += posts_out or 0
+
+
+def reset():
+    """Clears every metric and run summary, e.g. between benchmark scenarios."""
+    REGISTRY.reset()
+    with _runs_lock:
+        _runs.clear()
+
+
+def run_ids() -> list:
+    with _runs_lock:
+        return list(_runs)
+
+
+def _provider_summary(provider: str) -> dict:
+    count, seconds = API_SECONDS.totals(provider=provider)
+    waits, waited = RATE_LIMIT_WAIT_SECONDS.totals(provider=provider)
+    return {
+        "calls": count, "seconds": round(seconds, 3), "rate_limit_wait_seconds": round(waited, 3),
+        "retries": API_RETRIES.total(provider=provider), "errors": API_ERRORS.total(provider=provider),
+    }
+
+
+def run_summary(run_id: int) -> dict:
+    """This run's node timings and post counts plus a snapshot of the process-wide figures."""
+    with _runs_lock:
+        run = _runs.get(run_id, {"started_at": time.time(), "nodes": {}})
+        nodes = {name: dict(stats, seconds=round(stats["seconds"], 3)) for name, stats in run["nodes"].items()}
+    writes, write_seconds = DB_WRITE_SECONDS.totals()
+    parses, parse_seconds = LLM_PARSE_SECONDS.totals()
+    return {
+        "wall_seconds": round(time.time() - run["started_at"], 3),
+        "nodes": nodes,
+        "process": {
+            "reddit": _provider_summary("reddit"),
+            "pushshift": _provider_summary("pushshift"),
+            "groq": _provider_summary("groq"),
+            "llm_tokens": {"input": LLM_TOKENS.total(kind="input"), "output": LLM_TOKENS.total(kind="output")},
+            "llm_parse_seconds": round(parse_seconds, 3),
+            "llm_outputs": {outcome: LLM_OUTPUTS.total(outcome=outcome) for outcome in ("valid", "repaired", "reasked", "rejected")},
+            "llm_cache": {"hits": LLM_CACHE.total(result="hit"), "misses": LLM_CACHE.total(result="miss")},
+            "comment_cache": {"hits": COMMENT_CACHE.total(result="hit"), "misses": COMMENT_CACHE.total(result="miss")},
+            "db_writes": writes,
+            "db_write_seconds": round(write_seconds, 3),
+        },
+    }
+
+
+# --- Export ---
+
+_export_path: Optional[str] = None
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def configure(file_path: str = None, port: int = None):
+    """Writes the metrics to file_path on every export() and/or serves them on http://localhost:<port>/metrics."""
+    global _export_path, _server
+    _export_path = file_path
+    if port and _server is None:
+        _server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+        print(f"Serving metrics on http://127.0.0.1:{port}/metrics")
+
+
+def export():
+    """Rewrites the metrics file, if one is configured. Replaced atomically, so scrapers never see half a file."""
+    if not _export_path:
+        return
+    temp_path = f"{_export_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(REGISTRY.render())
+    os.replace(temp_path, _export_path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
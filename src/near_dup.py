@@ -0,0 +1,100 @@
+import hashlib
+import re
+from array import array
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+NUM_PERM = 128
+# 32 bands of 4 rows: posts with a Jaccard similarity of ~0.5 or more almost always share a band;
+# candidates are then checked against the configured threshold on the full signature.
+BANDS = 32
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+# Very short posts ("Is there a tool for X?") share most of their shingles by construction.
+MIN_SHINGLES = 10
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD_RE = re.compile(r"\w+")
+
+
+def _hash64(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def _permutations(seed: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    # Fixed seeds so signatures stored by earlier runs stay comparable.
+    a = [_hash64(f"a{seed}:{i}".encode()) % (_MERSENNE_PRIME - 1) + 1 for i in range(NUM_PERM)]
+    b = [_hash64(f"b{seed}:{i}".encode()) % _MERSENNE_PRIME for i in range(NUM_PERM)]
+    return np.array(a, dtype=np.uint64)[:, None], np.array(b, dtype=np.uint64)[:, None]
+
+
+_PERM_A, _PERM_B = _permutations()
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    words = _WORD_RE.findall((text or "").lower())
+    return {" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 0))}
+
+
+def minhash(text: str) -> Optional[List[int]]:
+    """MinHash signature of a text's word shingles, or None if the text is too short to compare."""
+    hashed = np.array([_hash64(s.encode("utf-8")) & _MAX_HASH for s in shingles(text)], dtype=np.uint64)
+    if len(hashed) < MIN_SHINGLES:
+        return None
+    # (a*h + b) mod p over all permutations at once; uint64 arithmetic wraps, which keeps the hashes well mixed.
+    permuted = (_PERM_A * hashed[None, :] + _PERM_B) % np.uint64(_MERSENNE_PRIME) & np.uint64(_MAX_HASH)
+    return permuted.min(axis=1).tolist()
+
+
+def band_buckets(signature: List[int]) -> List[int]:
+    """One bucket value per LSH band, as signed 64-bit ints so SQLite can store them."""
+    buckets = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        buckets.append(int.from_bytes(
+            hashlib.blake2b(array("Q", rows).tobytes(), digest_size=8).digest(), "big", signed=True
+        ))
+    return buckets
+
+
+def similarity(a: List[int], b: List[int]) -> float:
+    """Estimated Jaccard similarity of the texts behind two signatures."""
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+def encode_signature(signature: List[int]) -> bytes:
+    return array("Q", signature).tobytes()
+
+
+def decode_signature(blob: bytes) -> List[int]:
+    signature = array("Q")
+    signature.frombytes(blob)
+    return signature.tolist()
+
+
+def post_text(post: dict) -> str:
+    return f"{post.get('title') or ''}\n{post.get('selftext') or ''}"
+
+
+class BatchIndex:
+    """In-memory LSH index for near-duplicates among the posts of one batch."""
+    def __init__(self):
+        self._buckets: Dict[Tuple[int, int], List[int]] = {}
+        self._entries: List[Tuple[dict, List[int]]] = []
+
+    def find(self, signature: List[int], buckets: List[int], threshold: float) -> Optional[Tuple[dict, float]]:
+        candidates = {i for band, bucket in enumerate(buckets) for i in self._buckets.get((band, bucket), [])}
+        best = None
+        for i in sorted(candidates):
+            post, other = self._entries[i]
+            score = similarity(signature, other)
+            if score >= threshold and (best is None or score > best[1]):
+                best = (post, score)
+        return best
+
+    def add(self, post: dict, signature: List[int], buckets: List[int]):
+        index = len(self._entries)
+        self._entries.append((post, signature))
+        for band, bucket in enumerate(buckets):
+            self._buckets.setdefault((band, bucket), []).append(index)
@@ -0,0 +1,156 @@
+import difflib
+import json
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+
+LIST_FIELDS = ("pain_points", "business_opportunities", "automation_ideas")
+REQUIRED_FIELDS = LIST_FIELDS + ("confidence_score", "summary", "category", "sub_category")
+CONFIDENCE_MIN, CONFIDENCE_MAX = 1, 10
+# Names this similar (difflib ratio of the normalized forms) to exactly one valid name are mapped to it.
+MATCH_CUTOFF = 0.8
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.S)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?(?:e[+-]?\d+)?")
+_ABBREVIATION_RE = re.compile(r"\s*\(([^)]+)\)")
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+_WORD_NUMBERS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+                 "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
+
+
+def normalize_name(name) -> str:
+    """Lowercase letters and digits only, with '&' read as 'and': 'Health & Wellness' -> 'healthandwellness'."""
+    return re.sub(r"[^a-z0-9]+", "", str(name).lower().replace("&", " and "))
+
+
+def extract_json(text: str):
+    """
+    Parses the JSON in a model reply that is not clean JSON: wrapped in a code fence or prose,
+    with trailing commas, smart quotes or raw newlines inside strings. Raises ValueError if there is none.
+    """
+    text = text or ""
+    candidates = [text] + _FENCE_RE.findall(text)
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    end = max(text.rfind("}"), text.rfind("]"))
+    if starts and end > min(starts):
+        candidates.append(text[min(starts):end + 1])
+    for candidate in candidates:
+        for variant in (candidate, _TRAILING_COMMA_RE.sub(r"\1", candidate.translate(_SMART_QUOTES))):
+            try:
+                return json.loads(variant, strict=False)
+            except ValueError:
+                continue
+    raise ValueError("No JSON found in the model output.")
+
+
+class OutputRepairer:
+    """
+    Validates analyses against the expected fields and the category taxonomy, and fixes locally what
+    can be fixed: field types, the confidence_score range, and category names close to a valid one.
+    The lookups are built once from the taxonomy.
+    """
+    def __init__(self, categories: Dict[str, List[str]]):
+        self.categories = categories
+        self._category_lookup = {}
+        self._sub_category_lookups = {}
+        # Normalized sub-category name -> the categories that list it.
+        self._sub_category_owners = {}
+        for category, sub_categories in categories.items():
+            for alias in self._aliases(category):
+                self._category_lookup.setdefault(alias, category)
+            lookup = self._sub_category_lookups[category] = {}
+            for sub_category in sub_categories:
+                for alias in self._aliases(sub_category):
+                    lookup.setdefault(alias, sub_category)
+                    self._sub_category_owners.setdefault(alias, set()).add(category)
+
+    @staticmethod
+    def _aliases(name: str) -> List[str]:
+        """The name, plus for names like 'Infrastructure as Code (IaC)' the name without and only the abbreviation."""
+        aliases = [normalize_name(name)]
+        match = _ABBREVIATION_RE.search(name)
+        if match:
+            aliases += [normalize_name(_ABBREVIATION_RE.sub("", name)), normalize_name(match.group(1))]
+        return aliases
+
+    @staticmethod
+    def _match(value, lookup: Dict[str, str]) -> Tuple[Optional[str], bool]:
+        """Returns (valid name or None, whether it matched exactly)."""
+        if not isinstance(value, str) or not value.strip():
+            return None, False
+        key = normalize_name(value)
+        if key in lookup:
+            return lookup[key], True
+        close = difflib.get_close_matches(key, list(lookup), n=2, cutoff=MATCH_CUTOFF)
+        names = {lookup[c] for c in close}
+        return (names.pop(), False) if len(names) == 1 else (None, False)
+
+    def classify(self, category, sub_category) -> Tuple[Optional[str], Optional[str]]:
+        """Maps the model's category and sub_category to the taxonomy; None for a part that cannot be mapped."""
+        valid_category, exact = self._match(category, self._category_lookup)
+        valid_sub = None
+        if valid_category is not None:
+            valid_sub, _ = self._match(sub_category, self._sub_category_lookups[valid_category])
+        if valid_sub is None and not exact:
+            # The sub-category is more specific than a category the model got wrong; follow it if it
+            # belongs to a single category.
+            owners = self._sub_category_owners.get(normalize_name(sub_category or ""), set())
+            if len(owners) == 1:
+                valid_category = next(iter(owners))
+                valid_sub, _ = self._match(sub_category, self._sub_category_lookups[valid_category])
+        return valid_category, valid_sub
+
+    @staticmethod
+    def _as_list(value) -> Optional[List[str]]:
+        if isinstance(value, str):
+            value = [value] if value.strip() else []
+        if not isinstance(value, (list, tuple)):
+            return None
+        return [str(item).strip() for item in value if item is not None and str(item).strip()]
+
+    @staticmethod
+    def _as_score(value) -> Optional[int]:
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, str):
+            text = value.strip().lower()
+            if text in _WORD_NUMBERS:
+                value = _WORD_NUMBERS[text]
+            else:
+                # "8", "8/10", "8 out of 10", "score: 7.5"
+                match = _NUMBER_RE.search(text)
+                value = float(match.group()) if match else None
+        if not isinstance(value, (int, float)) or not math.isfinite(value):
+            # JSON allows NaN and Infinity, and "1e999" parses as infinity.
+            return None
+        return min(CONFIDENCE_MAX, max(CONFIDENCE_MIN, int(round(value))))
+
+    def repair(self, raw) -> Tuple[dict, List[str], List[str]]:
+        """
+        Returns (analysis, repaired fields, invalid fields). The analysis holds the valid and repaired
+        fields only; invalid fields are missing or could not be mapped to a valid value.
+        """
+        if not isinstance(raw, dict):
+            return {}, [], list(REQUIRED_FIELDS)
+        analysis, repaired, invalid = {}, [], []
+
+        def put(field, value):
+            if value is None:
+                invalid.append(field)
+                return
+            if value != raw.get(field):
+                repaired.append(field)
+            analysis[field] = value
+
+        for field in LIST_FIELDS:
+            put(field, self._as_list(raw.get(field)))
+        put("confidence_score", self._as_score(raw.get("confidence_score")))
+        summary = raw.get("summary")
+        if isinstance(summary, (list, tuple)):
+            summary = " ".join(str(part) for part in summary)
+        put("summary", summary.strip() if isinstance(summary, str) and summary.strip() else None)
+        category, sub_category = self.classify(raw.get("category"), raw.get("sub_category"))
+        put("category", category)
+        put("sub_category", sub_category)
+        return analysis, repaired, invalid
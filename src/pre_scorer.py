@@ -0,0 +1,184 @@
+import math
+import re
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# LLM confidence scores at or above this count as a worthwhile opportunity.
+GOOD_CONFIDENCE = 7
+
+# Phrases people use when describing a problem they would pay to have solved.
+PAIN_PHRASES = (
+    "is there a tool", "is there an app", "is there any software", "is there a way",
+    "looking for a tool", "looking for software", "looking for an app", "recommend a tool",
+    "any recommendations", "what do you use", "how do you manage", "how do you handle", "how do you track",
+    "wish there was", "i wish", "would pay", "willing to pay", "pay for",
+    "frustrated", "frustrating", "struggling", "struggle", "pain in the", "nightmare", "hate",
+    "waste of time", "time consuming", "takes forever", "tedious", "manually", "by hand",
+    "spreadsheet", "excel", "copy and paste", "workaround", "too expensive", "overpriced",
+    "alternative to", "switching from", "doesn't support", "no way to",
+)
+_PAIN_RE = re.compile("|".join(re.escape(p) for p in sorted(PAIN_PHRASES, key=len, reverse=True)))
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def _terms(text: str) -> List[str]:
+    words = _WORD_RE.findall((text or "").lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class TitleModel:
+    """
+    Logistic regression over TF-IDF weighted words and word pairs of post titles,
+    trained with a few epochs of SGD. Small enough to train at startup on our own
+    history of LLM confidence scores.
+    """
+    def __init__(self, epochs: int = 8, learning_rate: float = 0.5, min_df: int = 2):
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.min_df = min_df
+        self.idf: Dict[str, float] = {}
+        self.weights: Dict[str, float] = {}
+        self.bias = 0.0
+
+    def _vector(self, text: str) -> Dict[str, float]:
+        counts = Counter(t for t in _terms(text) if t in self.idf)
+        vector = {t: c * self.idf[t] for t, c in counts.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {t: v / norm for t, v in vector.items()}
+
+    def fit(self, texts: List[str], labels: List[int]):
+        doc_freq = Counter(t for text in texts for t in set(_terms(text)))
+        n = len(texts)
+        self.idf = {t: math.log((1 + n) / (1 + df)) + 1 for t, df in doc_freq.items() if df >= self.min_df}
+        vectors = [self._vector(text) for text in texts]
+
+        positives = sum(labels)
+        self.bias = math.log((positives + 1) / (n - positives + 1))
+        self.weights = {}
+        for epoch in range(self.epochs):
+            rate = self.learning_rate / (1 + epoch)
+            for vector, label in zip(vectors, labels):
+                error = label - self._sigmoid(self._margin(vector))
+                self.bias += rate * error
+                for term, value in vector.items():
+                    self.weights[term] = self.weights.get(term, 0.0) + rate * error * value
+        return self
+
+    def _margin(self, vector: Dict[str, float]) -> float:
+        return self.bias + sum(self.weights.get(t, 0.0) * v for t, v in vector.items())
+
+    @staticmethod
+    def _sigmoid(x: float) -> float:
+        return 1 / (1 + math.exp(-max(min(x, 30), -30)))
+
+    def predict(self, text: str) -> float:
+        return self._sigmoid(self._margin(self._vector(text)))
+
+
+class PreScorer:
+    """
+    Scores posts locally (no network) so only promising ones are sent to the LLM.
+    The score in [0, 1] combines pain-point phrases, engagement (comments, votes and, for fresh posts,
+    comment velocity) and keyword hits; once enough analyzed posts exist, a title model trained on
+    their LLM confidence scores is blended in.
+    A post is forwarded if its score is at least `threshold` and, per batch, it ranks within the
+    top `top_fraction` of posts. Either limit may be None.
+    """
+    def __init__(self, threshold: Optional[float] = None, top_fraction: Optional[float] = None,
+                 min_training_rows: int = 200):
+        self.threshold = threshold
+        self.top_fraction = top_fraction
+        self.min_training_rows = min_training_rows
+        self.model: Optional[TitleModel] = None
+        # select() and record_outcomes() run on several run workers and the streaming writer at once.
+        self._stats_lock = threading.Lock()
+        self.scored = 0
+        self.skipped = 0
+        self.forwarded_analyzed = 0
+        self.forwarded_good = 0
+
+    def train(self, rows: List[Tuple[str, int]]) -> Optional[dict]:
+        """
+        Trains the title model on (title, confidence_score) rows. Every fifth row is held out first
+        to measure how well the gate would have done; the model is then refit on all rows.
+        Returns {"rows", "base_rate", "precision", "forwarded"} or None if there is too little data.
+        """
+        rows = [(title, score) for title, score in rows if title and score is not None]
+        labels = [int(score >= GOOD_CONFIDENCE) for _, score in rows]
+        if len(rows) < self.min_training_rows or sum(labels) in (0, len(labels)):
+            self.model = None
+            return None
+
+        train = [(r, l) for i, (r, l) in enumerate(zip(rows, labels)) if i % 5]
+        holdout = [(r, l) for i, (r, l) in enumerate(zip(rows, labels)) if not i % 5]
+        self.model = TitleModel().fit([r[0] for r, _ in train], [l for _, l in train])
+        scored = [(self.score({"title": r[0]}), l) for r, l in holdout]
+        forwarded = [l for keep, (_, l) in zip(self._gate([s for s, _ in scored]), scored) if keep]
+        metrics = {
+            "rows": len(rows),
+            "base_rate": sum(l for _, l in holdout) / len(holdout),
+            "precision": sum(forwarded) / len(forwarded) if forwarded else None,
+            "forwarded": len(forwarded) / len(holdout),
+        }
+
+        self.model = TitleModel().fit([r[0] for r in rows], labels)
+        return metrics
+
+    def score(self, post: dict) -> float:
+        text = f"{post.get('title') or ''}\n{post.get('selftext') or ''}".lower()
+        pain = min(len(_PAIN_RE.findall(text)), 3) / 3
+
+        num_comments = max(post.get("num_comments") or 0, 0)
+        engagement = 0.5 * min(1.0, math.log1p(num_comments) / math.log1p(100)) \
+            + 0.5 * min(1.0, math.log1p(max(post.get("score") or 0, 0)) / math.log1p(100))
+        created = post.get("created_utc")
+        if isinstance(created, datetime):
+            age_hours = (datetime.now() - created).total_seconds() / 3600
+            if 0 < age_hours < 48:
+                velocity = num_comments / max(age_hours, 1)
+                engagement = max(engagement, min(1.0, math.log1p(velocity) / math.log1p(10)))
+
+        keywords = min(len(post.get("matched_keywords") or []), 3) / 3
+        heuristic = 0.5 * pain + 0.3 * engagement + 0.2 * keywords
+        if self.model is None:
+            return heuristic
+        return 0.5 * heuristic + 0.5 * self.model.predict(post.get("title") or "")
+
+    def _gate(self, scores: List[float]) -> List[bool]:
+        keep = [self.threshold is None or s >= self.threshold for s in scores]
+        if self.top_fraction is not None and scores:
+            allowed = math.ceil(len(scores) * self.top_fraction)
+            ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+            top = set(ranked[:allowed])
+            keep = [k and i in top for i, k in enumerate(keep)]
+        return keep
+
+    def select(self, posts: List[dict]) -> Tuple[List[dict], List[dict]]:
+        """Scores posts (stored as post['prescore']) and splits them into (forwarded, skipped)."""
+        for post in posts:
+            post["prescore"] = round(self.score(post), 4)
+        keep = self._gate([post["prescore"] for post in posts])
+        forwarded = [p for p, k in zip(posts, keep) if k]
+        skipped = [p for p, k in zip(posts, keep) if not k]
+        with self._stats_lock:
+            self.scored += len(posts)
+            self.skipped += len(skipped)
+        return forwarded, skipped
+
+    def record_outcomes(self, analyses: List[dict]):
+        """Counts how many forwarded posts the LLM went on to rate as good opportunities."""
+        good = sum((analysis.get("confidence_score") or 0) >= GOOD_CONFIDENCE for analysis in analyses)
+        with self._stats_lock:
+            self.forwarded_analyzed += len(analyses)
+            self.forwarded_good += good
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "scored": self.scored,
+                "skipped": self.skipped,
+                "skip_rate": self.skipped / self.scored if self.scored else 0.0,
+                "precision": self.forwarded_good / self.forwarded_analyzed if self.forwarded_analyzed else None,
+            }
@@ -0,0 +1,132 @@
+import math
+import re
+from typing import List
+
+# Words, numbers and individual punctuation marks, roughly how BPE tokenizers split English text.
+_TOKEN_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+TRUNCATION_MARKER = "[...]"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Local approximation of the model's token count.
+    Short words count as one token and longer words as one token per ~5 characters;
+    every punctuation mark counts as one token.
+    """
+    if not text:
+        return 0
+    return sum(1 + (len(piece) - 1) // 5 for piece in _TOKEN_PIECE_RE.findall(text))
+
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """
+    Shortens text to about max_tokens at sentence boundaries, keeping the opening
+    (where the question usually is) and the ending (where the follow-up usually is).
+    """
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text or ""
+    if max_tokens <= 0:
+        return ""
+
+    sentences = [s for s in _SENTENCE_SPLIT_RE.split(text) if s.strip()]
+    head_budget = max_tokens * 2 // 3
+    tail_budget = max_tokens - head_budget
+
+    head, used = [], 0
+    for sentence in sentences:
+        cost = estimate_tokens(sentence)
+        if used + cost > head_budget:
+            break
+        head.append(sentence)
+        used += cost
+
+    tail, used = [], 0
+    for sentence in reversed(sentences[len(head):]):
+        cost = estimate_tokens(sentence)
+        if used + cost > tail_budget:
+            break
+        tail.insert(0, sentence)
+        used += cost
+
+    if not head:
+        # A single run-on sentence; fall back to a hard cut on words.
+        words = text.split()
+        kept, used = [], 0
+        for word in words:
+            cost = estimate_tokens(word)
+            if used + cost > head_budget:
+                break
+            kept.append(word)
+            used += cost
+        # Unbroken text (URLs, base64, ...) has no words to cut on; keep ~4 characters per token.
+        head = [" ".join(kept) if kept else text[:head_budget * 4]]
+
+    truncated = " ".join(head) + f" {TRUNCATION_MARKER}"
+    if tail:
+        truncated += " " + " ".join(tail)
+    return truncated
+
+
+class PromptPacker:
+    """
+    Fits a post and its comments into a per-request token budget before they are sent to the LLM.
+    """
+    def __init__(self, token_budget: int = 3000, max_comment_tokens: int = 300, min_comment_chars: int = 20):
+        self.token_budget = token_budget
+        self.max_comment_tokens = max_comment_tokens
+        self.min_comment_chars = min_comment_chars
+
+    def _rank_comments(self, comments: List[dict]) -> List[dict]:
+        """
+        Orders comments by score, then by how much they say. One-liners like "+1" or "this"
+        are moved to the end because they rarely add anything for the analysis.
+        """
+        def sort_key(comment):
+            body = comment.get("body") or ""
+            substantive = len(body.strip()) >= self.min_comment_chars
+            return (substantive, comment.get("score") or 0, math.log1p(len(body)))
+        return sorted(comments, key=sort_key, reverse=True)
+
+    def pack(self, title: str, body: str, comments: List[dict]) -> dict:
+        """
+        Returns the text to send for one post along with token counts:
+        {"title", "body", "comments", "input_tokens", "input_tokens_untrimmed"}.
+        `comments` items are dicts with "body" and "score".
+        """
+        title = title or ""
+        body = body or ""
+        comment_bodies = [c.get("body") or "" for c in comments]
+        untrimmed = estimate_tokens(title) + estimate_tokens(body) + sum(estimate_tokens(c) for c in comment_bodies)
+
+        if not self.token_budget or untrimmed <= self.token_budget:
+            return {
+                "title": title, "body": body, "comments": comment_bodies,
+                "input_tokens": untrimmed, "input_tokens_untrimmed": untrimmed,
+            }
+
+        title_tokens = estimate_tokens(title)
+        remaining = max(self.token_budget - title_tokens, 0)
+
+        # The body gets up to half of what is left; comments get the rest plus whatever the body leaves unused.
+        body_tokens = estimate_tokens(body)
+        body_budget = min(body_tokens, remaining // 2)
+        comment_budget = remaining - body_budget
+
+        packed_comments, comment_tokens = [], 0
+        for comment in self._rank_comments(comments):
+            text = truncate_text(comment.get("body") or "", self.max_comment_tokens)
+            cost = estimate_tokens(text)
+            if comment_tokens + cost > comment_budget:
+                continue
+            packed_comments.append(text)
+            comment_tokens += cost
+
+        body_budget = remaining - comment_tokens
+        packed_body = truncate_text(body, body_budget)
+        input_tokens = title_tokens + estimate_tokens(packed_body) + comment_tokens
+
+        return {
+            "title": title, "body": packed_body, "comments": packed_comments,
+            "input_tokens": input_tokens, "input_tokens_untrimmed": untrimmed,
+        }
@@ -0,0 +1,238 @@
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, Mapping, Optional
+
+import requests
+from . import metrics
+
+# Retries of one call after rate limiting or a transient error, with jittered exponential backoff.
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 120.0
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_DURATION_RE = re.compile(r"(?:(\d+(?:\.\d+)?)h)?(?:(\d+(?:\.\d+)?)m(?!s))?(?:(\d+(?:\.\d+)?)s)?(?:(\d+(?:\.\d+)?)ms)?$")
+
+
+def parse_duration(value) -> Optional[float]:
+    """Parses reset headers: plain seconds ('42', '7.66') or Groq-style durations ('2m59.56s', '120ms')."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    match = _DURATION_RE.match(value)
+    if not match or not any(match.groups()):
+        return None
+    hours, minutes, seconds, millis = (float(g) if g else 0.0 for g in match.groups())
+    return hours * 3600 + minutes * 60 + seconds + millis / 1000
+
+
+def _header(headers: Mapping[str, str], name: str) -> Optional[float]:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: refills at `rate_per_minute`, holds at most `capacity`.
+    acquire() blocks until enough tokens are available; a pause holds everyone back until a given time.
+    """
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.base_rate = rate_per_minute
+        self.rate = rate_per_minute
+        self.capacity = capacity or rate_per_minute
+        self.level = self.capacity
+        self.paused_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if now > self.paused_until:
+            elapsed = now - max(self._updated, self.paused_until)
+            self.level = min(self.capacity, self.level + elapsed * self.rate / 60)
+        self._updated = now
+
+    def acquire(self, amount: float = 1.0):
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.level >= amount:
+                    self.level -= amount
+                    return
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    wait = (amount - self.level) * 60 / max(self.rate, 1e-6)
+            time.sleep(min(wait, 5.0))
+
+    def resize(self, rate_per_minute: float):
+        """Adopts the provider's actual per-minute limit as the new base rate and capacity."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.base_rate = self.rate = rate_per_minute
+            self.capacity = rate_per_minute
+            self.level = min(self.level, self.capacity)
+
+    def sync(self, remaining: float, reset_seconds: Optional[float]):
+        """
+        Aligns the bucket with what the provider says is left in its window: never hold more than
+        `remaining`, spread the remainder evenly until the reset, and stop entirely at zero.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.level = min(self.level, max(remaining, 0.0))
+            if reset_seconds and reset_seconds > 0:
+                self.rate = min(self.base_rate, max(remaining, 0.0) / reset_seconds * 60) or self.base_rate
+                if remaining < 1:
+                    self.paused_until = max(self.paused_until, now + reset_seconds)
+            else:
+                self.rate = self.base_rate
+
+    def pause(self, seconds: float):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Let a single request probe the provider once the pause is over.
+            self.level = min(self.level, 1.0)
+            self.paused_until = max(self.paused_until, now + seconds)
+
+
+class ProviderLimiter:
+    """
+    Rate control for one API provider, shared by every client and thread in the process:
+    a request bucket, an optional token bucket (for LLM providers with tokens-per-minute limits),
+    adaptation to the provider's rate-limit response headers, and retries with jittered
+    exponential backoff that pause all callers when the provider throttles.
+    """
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: float = None):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.throttled = 0
+        self.retries = 0
+        self._stats_lock = threading.Lock()
+
+    def acquire(self, tokens: float = 0):
+        self.requests.acquire(1)
+        if self.tokens is not None and tokens:
+            self.tokens.acquire(tokens)
+
+    def observe_headers(self, headers: Mapping[str, str]):
+        """
+        Reads rate-limit headers after a response. Understands Reddit's
+        x-ratelimit-remaining/-reset and Groq's x-ratelimit-{limit,remaining,reset}-{requests,tokens}.
+        """
+        if self.tokens is not None:
+            limit = _header(headers, "x-ratelimit-limit-tokens")
+            if limit:
+                # Groq reports the account's tokens-per-minute limit, which depends on the plan.
+                if limit != self.tokens.base_rate:
+                    self.tokens.resize(limit)
+            remaining = _header(headers, "x-ratelimit-remaining-tokens")
+            if remaining is not None:
+                self.tokens.sync(remaining, parse_duration(headers.get("x-ratelimit-reset-tokens")))
+
+        remaining = _header(headers, "x-ratelimit-remaining-requests")
+        reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+        if remaining is None:
+            remaining = _header(headers, "x-ratelimit-remaining")
+            reset = parse_duration(headers.get("x-ratelimit-reset"))
+        if remaining is not None:
+            self.requests.sync(remaining, reset)
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        delay = retry_after if retry_after else min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)
+        delay *= random.uniform(1.0, 1.5) if retry_after else random.uniform(0.5, 1.5)
+        # Everyone waits: hammering a throttled provider from other threads only prolongs the penalty.
+        self.requests.pause(delay)
+        return delay
+
+    def call(self, fn: Callable, *args, tokens: float = 0, max_retries: int = MAX_RETRIES,
+             operation: str = "request", **kwargs):
+        """
+        Calls fn(*args, **kwargs) within the rate limits, retrying rate-limited and transient failures.
+        `operation` names the call in the latency metrics.
+        """
+        attempt = 0
+        while True:
+            with metrics.RATE_LIMIT_WAIT_SECONDS.time(provider=self.name):
+                self.acquire(tokens)
+            try:
+                with metrics.API_SECONDS.time(provider=self.name, operation=operation):
+                    return fn(*args, **kwargs)
+            except Exception as e:
+                retryable, retry_after = classify_error(e)
+                if not retryable or attempt >= max_retries:
+                    metrics.API_ERRORS.inc(provider=self.name, operation=operation)
+                    raise
+                delay = self.backoff(attempt, retry_after)
+                throttled = retry_after is not None or _status_code(e) == 429
+                metrics.API_RETRIES.inc(provider=self.name, reason="throttled" if throttled else "error")
+                with self._stats_lock:
+                    self.retries += 1
+                    self.throttled += throttled
+                print(f"{self.name}: {type(e).__name__}, retrying in {delay:.1f}s (attempt {attempt + 1}/{max_retries}).")
+                attempt += 1
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {"throttled": self.throttled, "retries": self.retries}
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def classify_error(error: Exception):
+    """
+    Returns (retryable, retry_after_seconds) for an exception raised by PRAW, requests or the
+    Groq SDK: HTTP 429 and 5xx responses, timeouts and connection errors are retryable.
+    """
+    status = _status_code(error)
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    retry_after = parse_duration(headers.get("retry-after")) if status == 429 else None
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES, retry_after
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True, None
+    # Transport errors of the Groq SDK and prawcore, matched by name to avoid importing either here.
+    name = type(error).__name__
+    return name in {"APIConnectionError", "APITimeoutError", "RequestException", "ServerError", "TooManyRequests"}, None
+
+
+class CallFailure:
+    """
+    Stands in for the result of work that failed with `error`. Only rate limiting and transient
+    errors (see classify_error) are `retryable`; anything else would fail the same way again.
+    """
+    def __init__(self, error: Exception):
+        self.error = error
+        self.retryable = classify_error(error)[0]
+
+
+_limiters: Dict[str, ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def shared_limiter(name: str, requests_per_minute: float, tokens_per_minute: float = None) -> ProviderLimiter:
+    """The process-wide limiter for a provider; created with the given limits on first use."""
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = ProviderLimiter(name, requests_per_minute, tokens_per_minute)
+        return _limiters[name]
@@ -1,20 +1,49 @@
 import praw
 import requests
 import datetime
-from .config import api_keys
+import calendar
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, List, Optional, Tuple
+from . import config
+from . import database, metrics
+from .rate_limiter import shared_limiter
+
+# Only top-level comments are requested; replies are never sent to the LLM.
+COMMENT_DEPTH = 1
 
 class RedditClient:
     """
     Handles fetching data from Reddit using PRAW for recent posts
     and Pushshift for historical posts.
     """
-    def __init__(self):
+    def __init__(self, pushshift_url: str = None, pool_size: int = 10, comment_cache_hours: float = 24):
+        """
+        pool_size: keep-alive connections to Reddit, at least the number of concurrent comment fetches.
+        comment_cache_hours: how long fetched comments are reused for posts whose comment count is unchanged; 0 disables.
+        """
+        self.limiter = shared_limiter("reddit", config.REDDIT_REQUESTS_PER_MINUTE)
+        self.pushshift_limiter = shared_limiter("pushshift", config.PUSHSHIFT_REQUESTS_PER_MINUTE)
+
+        # Every Reddit response passes its rate-limit headers to the shared limiter.
+        reddit_session = requests.Session()
+        reddit_session.hooks["response"].append(lambda response, *args, **kwargs: self.limiter.observe_headers(response.headers))
+        reddit_session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=max(10, pool_size)))
+        self.pool_size = max(1, pool_size)
+        # Caps concurrent comment requests at the pool size, however many callers fetch at once.
+        self._request_slots = threading.BoundedSemaphore(self.pool_size)
         self.reddit = praw.Reddit(
-            client_id=api_keys.get("reddit_client_id"),
-            client_secret=api_keys.get("reddit_client_secret"),
-            user_agent=api_keys.get("reddit_user_agent"),
+            client_id=config.api_keys.get("reddit_client_id"),
+            client_secret=config.api_keys.get("reddit_client_secret"),
+            user_agent=config.api_keys.get("reddit_user_agent"),
+            requestor_kwargs={"session": reddit_session},
         )
-        self.pushshift_url = "https://api.pushshift.io/reddit/search/submission/"
+        self.pushshift_url = pushshift_url or config.PUSHSHIFT_URL
+        self.http = requests.Session()
+        self.http.hooks["response"].append(lambda response, *args, **kwargs: self.pushshift_limiter.observe_headers(response.headers))
+        self.comment_cache_hours = comment_cache_hours
+        if comment_cache_hours:
+            database.evict_comment_cache(comment_cache_hours)
 
     def get_new_posts(self, subreddit_name: str, limit: int = 100, after: str = None):
         """
@@ -26,39 +55,140 @@ class RedditClient:
         if after:
             params['after'] = after
             
-        posts = list(subreddit.new(limit=limit, params=params))
+        posts = self.limiter.call(lambda: list(subreddit.new(limit=limit, params=params)), operation="new")
         
         last_post_fullname = posts[-1].fullname if posts else None
         
         return posts, last_post_fullname
 
+    def get_posts_before(self, subreddit_name: str, before: str = None, limit: int = 100, max_pages: int = 5):
+        """
+        Fetches posts newer than the post with fullname `before`, newest first. Reddit returns the
+        page right after the anchor, so pages are walked towards the newest post and nothing between
+        the anchor and the newest post is skipped. Without an anchor, returns the newest page.
+        """
+        subreddit = self.reddit.subreddit(subreddit_name)
+        posts = []
+        for _ in range(max_pages):
+            params = {'before': before} if before else {}
+            page = self.limiter.call(lambda: list(subreddit.new(limit=limit, params=params)), operation="new")
+            posts = page + posts
+            if not before or len(page) < limit:
+                break
+            before = page[0].fullname
+        return posts
+
+    def get_posts_by_fullname(self, fullnames: list):
+        """Fetches the current state (score, comment count) of posts by fullname, 100 per request."""
+        posts = []
+        for i in range(0, len(fullnames), 100):
+            chunk = fullnames[i:i + 100]
+            posts.extend(self.limiter.call(lambda: list(self.reddit.info(fullnames=chunk)), operation="info"))
+        return posts
+
     def get_historical_posts(self, subreddit_name: str, keywords: list, start_date: str, end_date: str, limit: int = 100):
         """
         Fetches historical posts from a subreddit using Pushshift.
         Date format: YYYY-MM-DD
         """
-        start_timestamp = int(datetime.datetime.strptime(start_date, "%Y-%m-%d").timestamp())
-        end_timestamp = int(datetime.datetime.strptime(end_date, "%Y-%m-%d").timestamp())
-        query = "|".join(keywords)
+        start_timestamp = calendar.timegm(datetime.datetime.strptime(start_date, "%Y-%m-%d").timetuple())
+        end_timestamp = calendar.timegm(datetime.datetime.strptime(end_date, "%Y-%m-%d").timetuple())
+        return self.get_historical_page(subreddit_name, keywords, start_timestamp, end_timestamp, limit)
 
+    def get_historical_page(self, subreddit_name: str, keywords: list, after_ts: int, before_ts: int, limit: int = 100):
+        """
+        Fetches one page of posts created between after_ts and before_ts (epoch seconds),
+        newest first. Page backwards by passing the oldest created_utc (plus one, to keep posts sharing
+        that second; before_ts is exclusive) as the next before_ts.
+        """
         params = {
             "subreddit": subreddit_name,
-            "q": query,
-            "after": start_timestamp,
-            "before": end_timestamp,
+            "after": after_ts,
+            "before": before_ts,
             "size": limit,
             "sort": "desc",
-            "sort_type": "score"
+            "sort_type": "created_utc"
         }
-        response = requests.get(self.pushshift_url, params=params)
-        response.raise_for_status()
-        return response.json().get("data", [])
+        if keywords:
+            params["q"] = "|".join(keywords)
+        def fetch():
+            response = self.http.get(self.pushshift_url, params=params, timeout=60)
+            response.raise_for_status()
+            return response.json().get("data", [])
+        return self.pushshift_limiter.call(fetch, operation="search")
+
+    def get_comments(self, post_id: str, limit: int = 20, num_comments: int = None) -> List[dict]:
+        """
+        Fetches the top comments of a post as [{"body", "score"}], or reuses the cached ones
+        if the post still has num_comments comments.
+        """
+        for _, comments, error in self.iter_comments([{"id": post_id, "num_comments": num_comments}], limit):
+            if error is not None:
+                raise error
+            return comments
+
+    def iter_comments(self, posts: List[dict], limit: int = 20) -> Iterator[Tuple[str, Optional[List[dict]], Optional[Exception]]]:
+        """
+        Yields (post_id, comments, error) for posts given as {"id", "num_comments"}, cached ones first,
+        then the others as their requests complete. The requests run concurrently on the pooled session;
+        the fetched comments are cached in one write at the end.
+        """
+        cached = self._cached_comments(posts)
+        missing = [post for post in posts if post["id"] not in cached]
+        for post_id, comments in cached.items():
+            yield post_id, comments, None
+
+        fetched = []
+        executor = None
+        try:
+            if len(missing) <= 1:
+                results = [self._fetch_comments_safely(post, limit) for post in missing]
+            else:
+                executor = ThreadPoolExecutor(max_workers=min(self.pool_size, len(missing)))
+                futures = [executor.submit(self._fetch_comments_safely, post, limit) for post in missing]
+                results = (future.result() for future in as_completed(futures))
+            for post, comments, error in results:
+                if error is None:
+                    fetched.append((post["id"], post.get("num_comments"), comments))
+                yield post["id"], comments, error
+        finally:
+            if executor is not None:
+                # Requests not started yet are dropped if the caller stops early.
+                executor.shutdown(wait=False, cancel_futures=True)
+            if self.comment_cache_hours:
+                database.put_cached_comments(fetched)
+
+    def _cached_comments(self, posts: List[dict]) -> dict:
+        if not self.comment_cache_hours:
+            return {}
+        entries = database.get_cached_comments([post["id"] for post in posts], self.comment_cache_hours)
+        cached = {}
+        for post in posts:
+            entry = entries.get(post["id"])
+            # A thread that gained or lost comments since it was cached is fetched again.
+            if entry is not None and (post.get("num_comments") is None or entry[0] == post["num_comments"]):
+                cached[post["id"]] = entry[1]
+        metrics.COMMENT_CACHE.inc(len(cached), result="hit")
+        metrics.COMMENT_CACHE.inc(len(posts) - len(cached), result="miss")
+        return cached
+
+    def _fetch_comments_safely(self, post: dict, limit: int):
+        try:
+            with self._request_slots:
+                return post, self._fetch_comments(post["id"], limit), None
+        except Exception as e:
+            return post, None, e
 
-    def get_comments(self, post_id: str, limit: int = 20):
+    def _fetch_comments(self, post_id: str, limit: int) -> List[dict]:
         """
-        Fetches top comments for a given post ID using PRAW.
+        Requests only the top `limit` top-level comments of a post, instead of loading the whole
+        comment tree through a PRAW submission.
         """
-        submission = self.reddit.submission(id=post_id)
-        submission.comment_sort = "top"
-        submission.comments.replace_more(limit=0)
-        return submission.comments[:limit]
\ No newline at end of file
+        params = {"sort": "top", "limit": limit, "depth": COMMENT_DEPTH, "raw_json": 1}
+        def fetch():
+            _, comment_listing = self.reddit.request(method="GET", path=f"comments/{post_id}", params=params)
+            return [
+                {"body": child["data"]["body"], "score": child["data"].get("score", 0)}
+                for child in comment_listing["data"]["children"] if child["kind"] == "t1"
+            ][:limit]
+        return self.limiter.call(fetch, operation="comments")
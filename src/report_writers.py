@@ -0,0 +1,152 @@
+import csv
+import json
+import sys
+from itertools import islice
+from typing import Iterable, List, Optional, Sequence
+
+# The table format sizes its columns from this many leading rows, then streams the rest.
+TABLE_SAMPLE_ROWS = 200
+# Longer values are cut short in the table format, except in the last column, which cannot push
+# others out of line; the other formats keep them whole.
+TABLE_MAX_CELL = 60
+# Rows per Arrow record batch for the Parquet and Arrow formats.
+ARROW_BATCH_ROWS = 10000
+
+
+class TableWriter:
+    """Aligned plain-text table with a title, the default for the terminal."""
+    binary = False
+
+    def write(self, out, title: Optional[str], columns: Sequence[str], rows: Iterable[tuple], empty_message: str):
+        rows = iter(rows)
+        sample = list(islice(rows, TABLE_SAMPLE_ROWS))
+        if title:
+            out.write(f"\n--- {title} ---\n")
+        if not sample:
+            out.write(f"{empty_message}\n")
+        else:
+            sample_cells = [self._cells(row) for row in sample]
+            widths = [max([len(column)] + [len(cells[i]) for cells in sample_cells]) for i, column in enumerate(columns)]
+            numeric = [all(isinstance(row[i], (int, float)) or row[i] is None for row in sample) for i in range(len(columns))]
+            out.write(self._line(columns, widths, numeric) + "\n")
+            for cells in sample_cells:
+                out.write(self._line(cells, widths, numeric) + "\n")
+            for row in rows:
+                out.write(self._line(self._cells(row), widths, numeric) + "\n")
+        if title:
+            out.write("-" * (len(title) + 8) + "\n\n")
+
+    @staticmethod
+    def _cells(row: tuple) -> List[str]:
+        cells = ["" if value is None else str(value) for value in row]
+        return [cell if len(cell) <= TABLE_MAX_CELL else cell[:TABLE_MAX_CELL - 3] + "..."
+                for cell in cells[:-1]] + cells[-1:]
+
+    @staticmethod
+    def _line(cells: Sequence[str], widths: List[int], numeric: List[bool]) -> str:
+        return " ".join(cell.rjust(width) if right else cell.ljust(width)
+                        for cell, width, right in zip(cells, widths, numeric)).rstrip()
+
+
+class CsvWriter:
+    binary = False
+
+    def write(self, out, title, columns, rows, empty_message):
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+
+class JsonLinesWriter:
+    """One JSON object per row."""
+    binary = False
+
+    def write(self, out, title, columns, rows, empty_message):
+        for row in rows:
+            out.write(json.dumps(dict(zip(columns, row)), default=str) + "\n")
+
+
+def _load_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("The parquet and arrow formats require the 'pyarrow' package (pip install pyarrow).")
+    return pyarrow
+
+
+class ArrowWriter:
+    """Parquet or Arrow IPC files, written in record batches. Needs the optional 'pyarrow' package."""
+    binary = True
+
+    def __init__(self, file_format: str):
+        self.file_format = file_format
+
+    @staticmethod
+    def _schema(pa, columns, sample):
+        fields = []
+        for i, column in enumerate(columns):
+            value = next((row[i] for row in sample if row[i] is not None), None)
+            if isinstance(value, int):
+                kind = pa.int64()
+            elif isinstance(value, float):
+                kind = pa.float64()
+            else:
+                kind = pa.string()
+            fields.append(pa.field(column, kind))
+        return pa.schema(fields)
+
+    @staticmethod
+    def _arrays(pa, schema, batch) -> list:
+        arrays = []
+        for i, field in enumerate(schema):
+            values = [row[i] for row in batch]
+            if pa.types.is_string(field.type):
+                values = [None if v is None else str(v) for v in values]
+            arrays.append(values)
+        return arrays
+
+    def write(self, out, title, columns, rows, empty_message):
+        pa = _load_pyarrow()
+        rows = iter(rows)
+        batch = list(islice(rows, ARROW_BATCH_ROWS))
+        schema = self._schema(pa, columns, batch)
+        if self.file_format == "parquet":
+            import pyarrow.parquet as pq
+            writer = pq.ParquetWriter(out, schema)
+        else:
+            import pyarrow.ipc
+            writer = pyarrow.ipc.new_file(out, schema)
+        try:
+            while batch:
+                writer.write_batch(pa.record_batch(self._arrays(pa, schema, batch), schema=schema))
+                batch = list(islice(rows, ARROW_BATCH_ROWS))
+        finally:
+            writer.close()
+
+
+WRITERS = {
+    "table": TableWriter(),
+    "csv": CsvWriter(),
+    "jsonl": JsonLinesWriter(),
+    "parquet": ArrowWriter("parquet"),
+    "arrow": ArrowWriter("arrow"),
+}
+
+
+def write_rows(title: Optional[str], columns: Sequence[str], rows: Iterable[tuple], output_format: str = "table",
+               output_path: str = None, empty_message: str = "No data found for the specified criteria."):
+    """
+    Writes rows as they are produced, in one of the WRITERS formats, to output_path or stdout.
+    Only the table format prints the title; the binary formats need an output_path.
+    """
+    writer = WRITERS[output_format]
+    if output_path is None:
+        if writer.binary:
+            raise ValueError(f"The {output_format} format needs an output file (--output PATH).")
+        writer.write(sys.stdout, title, columns, rows, empty_message)
+        return
+    if writer.binary:
+        _load_pyarrow()  # fail before creating the output file
+    mode, encoding, newline = ("wb", None, None) if writer.binary else ("w", "utf-8", "")
+    with open(output_path, mode, encoding=encoding, newline=newline) as out:
+        writer.write(out, title, columns, rows, empty_message)
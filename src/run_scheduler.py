@@ -0,0 +1,288 @@
+import json
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List, Optional
+from . import database
+
+# Pause after a 'recent' batch that found nothing new. Request pacing is up to the shared rate limiters.
+IDLE_PAUSE_SECONDS = 60
+# With the streaming pipeline, how many pages a run may fetch ahead of the last fully saved one.
+MAX_PAGES_AHEAD = 2
+
+
+class RunJob:
+    """
+    One run: a subreddit with its keywords, time period and target, plus the checkpointed
+    pagination cursor and progress. Each call to run_batch() processes one page of posts.
+    A page interrupted before its checkpoint is fetched again on resume; its posts that were already
+    saved are found in the database by dedup_posts, and repeated LLM requests hit the analysis cache.
+
+    With the graph's streaming pipeline, a page is only handed over for analysis and the next page
+    is fetched while it is analyzed. The checkpointed cursor then moves past a page only once all
+    earlier pages and the page itself are saved, so a crash never skips unsaved posts.
+    """
+    # Seconds the scheduler waits before the first batch.
+    start_delay = 0.0
+
+    def __init__(self, run_id: int, checkpoint: dict):
+        self.run_id = run_id
+        self.checkpoint = checkpoint
+        self.error = None
+        # Streaming only: the cursor of the next page to fetch, and (ticket, cursor after it) per unsaved page.
+        self._fetch_after = checkpoint['after_token']
+        self._tickets = deque()
+
+    @classmethod
+    def create(cls, subreddit: str, keywords: List[str], time_period: str = "recent", target: int = 10,
+               dump_path: str = None) -> "RunJob":
+        run_id = database.create_run(subreddit=subreddit, keywords=", ".join(keywords))
+        checkpoint = {
+            'subreddit': subreddit, 'keywords': keywords, 'time_period': time_period, 'target': target,
+            'dump_path': dump_path, 'after_token': None, 'batch_num': 0, 'total_new_found': 0, 'status': 'running',
+        }
+        database.save_run_checkpoint(run_id, checkpoint)
+        print(f"Created new run with ID: {run_id} for r/{subreddit}. Target: {target} new opportunities.")
+        return cls(run_id, checkpoint)
+
+    @classmethod
+    def resume(cls, run_id: int, target: int = None) -> Optional["RunJob"]:
+        checkpoint = database.get_run_checkpoint(run_id)
+        if checkpoint is None:
+            print(f"Run {run_id} has no checkpoint to resume from.")
+            return None
+        if checkpoint['status'] == 'completed':
+            print(f"Run {run_id} already completed.")
+            return None
+        checkpoint.pop('run_id', None)
+        checkpoint.pop('updated_at', None)
+        if target:
+            checkpoint['target'] = target
+        checkpoint['status'] = 'running'
+        database.save_run_checkpoint(run_id, checkpoint)
+        print(f"Resuming run {run_id} on r/{checkpoint['subreddit']} after batch {checkpoint['batch_num']} "
+              f"(Found {checkpoint['total_new_found']}/{checkpoint['target']}).")
+        return cls(run_id, checkpoint)
+
+    @property
+    def label(self) -> str:
+        return f"r/{self.checkpoint['subreddit']} (run {self.run_id})"
+
+    @property
+    def done(self) -> bool:
+        return self.checkpoint['status'] == 'completed'
+
+    def run_batch(self, graph, options: dict) -> Optional[float]:
+        """
+        Runs the graph for the next page of posts and checkpoints the result.
+        Returns how many seconds to wait before the next batch, or None once the run is finished.
+        """
+        cp = self.checkpoint
+        self._collect_tickets()
+        if cp['total_new_found'] >= cp['target']:
+            self._collect_tickets(wait=True)
+            cp['status'] = 'completed'
+            database.save_run_checkpoint(self.run_id, cp)
+            graph.close_source(self.run_id)
+            return None
+        while len(self._tickets) >= MAX_PAGES_AHEAD:
+            self._tickets[0][0].wait()
+            self._collect_tickets()
+        cp['batch_num'] += 1
+        print(f"\n--- Starting Batch {cp['batch_num']} for {self.label} (Found {cp['total_new_found']}/{cp['target']}) ---")
+
+        initial_state = {
+            "run_id": self.run_id,
+            "subreddit": cp['subreddit'],
+            "keywords": cp['keywords'],
+            "time_period": cp['time_period'],
+            "after": self._fetch_after,
+            "start_date": "", "end_date": "", "posts": [], "filtered_posts": [],
+            "analysis_results": [], "new_opportunities_count": 0,
+            "reanalyze_after_days": options.get('reanalyze_after_days'),
+            "reanalyze_on_prompt_change": options.get('reanalyze_on_prompt_change', False),
+            "linked_opportunities_count": 0,
+            "dump_path": cp['dump_path'],
+        }
+        try:
+            final_state = graph.run(initial_state)
+        except Exception:
+            # Pages already handed to the streaming pipeline still get saved; checkpoint them before giving up.
+            self._collect_tickets(wait=True)
+            raise
+
+        batch_new_count = final_state.get("new_opportunities_count", 0)
+        cp['total_new_found'] += batch_new_count
+        self._fetch_after = final_state.get("after")
+        ticket = final_state.get("ticket")
+        queued = 0
+        if ticket is None:
+            cp['after_token'] = self._fetch_after
+        else:
+            self._tickets.append((ticket, self._fetch_after))
+            queued = len(final_state.get("filtered_posts") or [])
+            self._collect_tickets()
+
+        exhausted = not self._fetch_after
+        if exhausted or cp['total_new_found'] >= cp['target']:
+            self._collect_tickets(wait=True)
+        finished = cp['total_new_found'] >= cp['target']
+        if exhausted:
+            print(f"--- Reached the end of available posts for {self.label}. Stopping run. ---")
+            finished = True
+        if finished:
+            cp['status'] = 'completed'
+        database.save_run_checkpoint(self.run_id, cp)
+        if finished:
+            graph.close_source(self.run_id)
+            return None
+
+        if batch_new_count == 0 and not queued and cp['time_period'] == 'recent' and not cp['dump_path']:
+            print(f"--- No new posts found for {self.label}. Waiting before retrying... ---")
+            return IDLE_PAUSE_SECONDS # Wait a minute if we're scanning for recent posts and find nothing
+        return 0
+
+    def _collect_tickets(self, wait: bool = False):
+        """Counts the pages the streaming pipeline has saved, in order, and moves the checkpointed cursor past them."""
+        cp = self.checkpoint
+        collected = False
+        while self._tickets and (wait or self._tickets[0][0].done):
+            ticket, after = self._tickets.popleft()
+            ticket.wait()
+            if ticket.error is not None:
+                raise ticket.error
+            cp['total_new_found'] += ticket.new_count
+            cp['after_token'] = after
+            collected = True
+        if collected:
+            database.save_run_checkpoint(self.run_id, cp)
+
+
+class RunScheduler:
+    """
+    Runs several RunJobs over one shared AnalysisGraph, so all runs share its Reddit and LLM
+    clients and its concurrency limits. Batches are scheduled round-robin: after a batch a run goes
+    to the back of the queue, and a run that is waiting (nothing new yet, or its pause between
+    batches) does not hold a worker. At most `parallel_runs` batches are processed at a time.
+    """
+    def __init__(self, graph, options: dict, parallel_runs: int = 4):
+        self.graph = graph
+        self.options = options
+        self.parallel_runs = max(1, parallel_runs)
+        self.jobs: List[RunJob] = []
+
+    def run(self, jobs: List[RunJob]):
+        self.jobs = list(jobs)
+        queue = deque(self.jobs)
+        ready_at = {job.run_id: time.monotonic() + job.start_delay for job in self.jobs}
+
+        if self.parallel_runs == 1 or len(self.jobs) == 1:
+            # Batches run on this thread, so Ctrl-C stops the current batch right away.
+            while queue:
+                job = min(queue, key=lambda j: ready_at[j.run_id])
+                queue.remove(job)
+                time.sleep(max(0.0, ready_at[job.run_id] - time.monotonic()))
+                delay = self._run_batch(job)
+                if delay is not None:
+                    ready_at[job.run_id] = time.monotonic() + delay
+                    queue.append(job)
+                self.print_progress()
+            return
+
+        in_flight = {}
+        executor = ThreadPoolExecutor(max_workers=self.parallel_runs)
+        try:
+            while queue or in_flight:
+                now = time.monotonic()
+                for _ in range(len(queue)):
+                    if len(in_flight) >= self.parallel_runs:
+                        break
+                    job = queue.popleft()
+                    if ready_at[job.run_id] <= now:
+                        in_flight[executor.submit(self._run_batch, job)] = job
+                    else:
+                        queue.append(job)
+
+                timeout = None
+                if queue and len(in_flight) < self.parallel_runs:
+                    timeout = max(0.0, min(ready_at[job.run_id] for job in queue) - now)
+                if not in_flight:
+                    time.sleep(timeout or 0)
+                    continue
+
+                finished, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    job = in_flight.pop(future)
+                    delay = future.result()
+                    if delay is not None:
+                        ready_at[job.run_id] = time.monotonic() + delay
+                        queue.append(job)
+                if finished:
+                    self.print_progress()
+        except KeyboardInterrupt:
+            print("\nStopping: waiting for the batches in progress to finish...")
+            raise
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _run_batch(self, job: RunJob) -> Optional[float]:
+        try:
+            return job.run_batch(self.graph, self.options)
+        except Exception as e:
+            # One failing subreddit (private, banned, API errors) should not stop the others.
+            job.error = e
+            self.graph.close_source(job.run_id)
+            print(f"An error occurred during {job.label}: {e}")
+            print(f"Continue it with: python main.py run --resume {job.run_id}")
+            return None
+
+    def print_progress(self):
+        if len(self.jobs) < 2:
+            return
+        found = sum(job.checkpoint['total_new_found'] for job in self.jobs)
+        target = sum(job.checkpoint['target'] for job in self.jobs)
+        done = sum(job.done for job in self.jobs)
+        failed = sum(job.error is not None for job in self.jobs)
+        print(f"\n=== Progress: {done}/{len(self.jobs)} runs complete, {failed} failed, "
+              f"{found}/{target} new opportunities ===")
+        for job in self.jobs:
+            cp = job.checkpoint
+            status = "failed" if job.error is not None else cp['status']
+            print(f"  {job.label:<40} batch {cp['batch_num']:>4}  {cp['total_new_found']:>5}/{cp['target']:<5} {status}")
+
+    def unfinished_run_ids(self) -> List[int]:
+        return [job.run_id for job in self.jobs if not job.done]
+
+
+def load_jobs_file(path: str) -> List[dict]:
+    """
+    Reads run definitions from a JSON or YAML file: either a list of jobs, or
+    {"defaults": {...}, "jobs": [...]}. Each job has a subreddit and optionally keywords,
+    target, time and dump; missing values come from the defaults.
+    """
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("Reading YAML job files requires the 'pyyaml' package (pip install pyyaml).")
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+
+    if isinstance(spec, list):
+        spec = {"jobs": spec}
+    defaults = spec.get("defaults") or {}
+    jobs = []
+    for entry in spec.get("jobs") or []:
+        if isinstance(entry, str):
+            entry = {"subreddit": entry}
+        job = {**defaults, **entry}
+        if not job.get("subreddit"):
+            raise ValueError(f"Job without a subreddit in {path}: {entry}")
+        if isinstance(job.get("keywords"), str):
+            job["keywords"] = [job["keywords"]]
+        if job.get("time") is not None:
+            job["time"] = str(job["time"])
+        jobs.append(job)
+    return jobs
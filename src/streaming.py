@@ -0,0 +1,182 @@
+import queue
+import threading
+import time
+from typing import List
+from tqdm import tqdm
+from . import database, metrics
+from .rate_limiter import CallFailure
+
+
+class Ticket:
+    """
+    The posts of one page handed to the streaming pipeline. Completes once every post is
+    either saved or given up on; `new_count` is then the number of new opportunities saved.
+    """
+    def __init__(self, run_id: int, size: int, near_duplicates: List[dict] = None):
+        self.run_id = run_id
+        self.remaining = size
+        self.new_count = 0
+        self.near_duplicates = near_duplicates or []
+        self.error = None
+        self._done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+
+class StreamingPipeline:
+    """
+    Analyzes and saves posts while the graph keeps fetching. Posts go through a bounded queue to
+    analysis workers, and every result goes through a second bounded queue to a single writer that
+    saves whatever is ready in one transaction. A full queue blocks the graph's next hand-off,
+    so fetching never runs far ahead of the LLM.
+    """
+    def __init__(self, graph, queue_size: int = 200, max_attempts: int = 3):
+        self.graph = graph
+        self.max_attempts = max_attempts
+        self._posts = queue.Queue(maxsize=max(1, queue_size))
+        self._results = queue.Queue(maxsize=max(1, queue_size))
+        self._bar = None
+        self._bar_lock = threading.Lock()
+
+        if graph.analysis_mode == "batch":
+            # Each worker packs up to batch_size queued posts into one request.
+            workers = graph.llm_concurrency
+        else:
+            workers = graph.reddit_concurrency + graph.llm_concurrency
+        self._workers = [threading.Thread(target=self._analyze_worker, daemon=True) for _ in range(workers)]
+        self._writer = threading.Thread(target=self._write_worker, daemon=True)
+        for thread in self._workers + [self._writer]:
+            thread.start()
+
+    def submit(self, run_id: int, posts: List[dict], near_duplicates: List[dict] = None) -> Ticket:
+        """Queues a page of posts for analysis; blocks while the queue is full."""
+        ticket = Ticket(run_id, len(posts), near_duplicates)
+        if not posts:
+            self._finish(ticket)
+            return ticket
+        with self._bar_lock:
+            if self._bar is None:
+                self._bar = tqdm(total=0, desc="Analyzed Posts")
+            self._bar.total += len(posts)
+            self._bar.refresh()
+        for post in posts:
+            self._posts.put((ticket, post))
+        return ticket
+
+    @property
+    def queued(self) -> int:
+        return self._posts.qsize()
+
+    def _take_batch(self) -> list:
+        items = [self._posts.get()]
+        if items[0] is None:
+            return items
+        if self.graph.analysis_mode == "batch":
+            while len(items) < self.graph.batch_size:
+                try:
+                    item = self._posts.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    # Leave the stop signal for this worker's next round.
+                    self._posts.put(None)
+                    break
+                items.append(item)
+        return items
+
+    def _analyze_worker(self):
+        while True:
+            items = self._take_batch()
+            if items[0] is None:
+                return
+            results = [None] * len(items)
+            pending = list(range(len(items)))
+            # A post that failed with a transient error is retried here, behind the rate limiter's backoff,
+            # before it is given up; other failures would only repeat.
+            for _ in range(self.max_attempts):
+                posts = [items[i][1] for i in pending]
+                try:
+                    if self.graph.analysis_mode == "batch":
+                        batch_results = self.graph._analyze_posts_batched(posts, progress=False)
+                    else:
+                        batch_results = [self.graph._analyze_single_post(post) for post in posts]
+                except Exception as e:
+                    tqdm.write(f"Could not analyze {len(posts)} posts: {e}")
+                    batch_results = [CallFailure(e)] * len(posts)
+                for i, result in zip(pending, batch_results):
+                    results[i] = result
+                pending = [i for i in pending if isinstance(results[i], CallFailure) and results[i].retryable]
+                if not pending:
+                    break
+            for (ticket, _), result in zip(items, results):
+                self._results.put((ticket, None if isinstance(result, CallFailure) else result))
+
+    def _write_worker(self):
+        while True:
+            items = [self._results.get()]
+            if items[0] is None:
+                return
+            # Save everything that is ready now, but never wait for more.
+            while True:
+                try:
+                    item = self._results.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._results.put(None)
+                    break
+                items.append(item)
+            self._save(items)
+
+    def _save(self, items: list):
+        by_run = {}
+        for ticket, record in items:
+            by_run.setdefault(ticket.run_id, []).append((ticket, record))
+        for run_id, run_items in by_run.items():
+            records = [(ticket, record) for ticket, record in run_items if record is not None]
+            start = time.perf_counter()
+            # The writer serves every run; a failure is reported through the run's tickets instead.
+            try:
+                statuses = database.insert_opportunities(run_id, [record for _, record in records])
+                for (ticket, _), is_new in zip(records, statuses):
+                    ticket.new_count += is_new
+                metrics.record_node(run_id, "save_to_database", time.perf_counter() - start, len(records), sum(statuses))
+                if self.graph.pre_scorer is not None:
+                    self.graph.pre_scorer.record_outcomes([record for _, record in records])
+            except Exception as e:
+                tqdm.write(f"Could not save results for run {run_id}: {e}")
+                for ticket, _ in run_items:
+                    ticket.error = e
+            for ticket, _ in run_items:
+                ticket.remaining -= 1
+                if ticket.remaining == 0:
+                    self._finish(ticket)
+        with self._bar_lock:
+            self._bar.update(len(items))
+
+    def _finish(self, ticket: Ticket):
+        try:
+            if ticket.error is None:
+                # Duplicates within the page point at their canonical post, which is saved by now.
+                database.add_opportunity_aliases(ticket.run_id, ticket.near_duplicates)
+        except Exception as e:
+            tqdm.write(f"Could not link near-duplicates for run {ticket.run_id}: {e}")
+            ticket.error = e
+        finally:
+            ticket._done.set()
+
+    def close(self):
+        """Finishes the queued posts and stops the worker threads."""
+        for _ in self._workers:
+            self._posts.put(None)
+        for thread in self._workers:
+            thread.join()
+        self._results.put(None)
+        self._writer.join()
+        if self._bar is not None:
+            self._bar.close()
@@ -0,0 +1,176 @@
+import time
+from typing import List, Optional
+from . import database
+from .run_scheduler import RunScheduler
+
+# The poll interval aims for about this many new posts per poll, a quarter of a page,
+# so a burst of up to four times the usual rate still fits in one request.
+TARGET_POSTS_PER_POLL = 25
+# Weight of the latest observation in the smoothed posts-per-hour rate.
+RATE_SMOOTHING = 0.5
+# After this many polls without new posts, poll once without the cursor in case its post was deleted
+# (Reddit returns nothing 'before' a removed post). It costs the same single request as a normal poll.
+ANCHOR_CHECK_POLLS = 2
+
+
+def next_poll_interval(posts_per_hour: Optional[float], previous: Optional[float], full: bool,
+                       min_interval: float, max_interval: float) -> float:
+    """
+    Seconds until the next poll of a subreddit posting at `posts_per_hour`: long enough to collect
+    about TARGET_POSTS_PER_POLL new posts. Without any observed posts the previous interval doubles;
+    after a poll that had to stop at its page limit it at least halves.
+    """
+    if posts_per_hour:
+        interval = TARGET_POSTS_PER_POLL / posts_per_hour * 3600
+    else:
+        interval = (previous or min_interval) * 2
+    if full and previous:
+        interval = min(interval, previous / 2)
+    return max(min_interval, min(max_interval, interval))
+
+
+def _format_seconds(seconds: float) -> str:
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+
+
+class WatchJob:
+    """
+    Continuous watch of one subreddit. Each poll fetches only posts newer than a cursor (the newest
+    post seen), analyzes those old enough to have comments, and schedules the next poll from the
+    subreddit's observed post rate. The state, including the posts still waiting to be analyzed,
+    is saved after every poll, so a restarted watch continues from the same cursor and schedule.
+    """
+    # The run scheduler keys its queue by run_id and checks these on every job.
+    done = False
+
+    def __init__(self, state: dict):
+        self.state = state
+        self.run_id = state['run_id']
+        self.error = None
+
+    @classmethod
+    def load(cls, subreddit: str, keywords: List[str] = None) -> Optional["WatchJob"]:
+        """Resumes the saved watch of a subreddit, or starts one. New keywords start a new run."""
+        state = database.get_watch_state(subreddit)
+        if state is None and not keywords:
+            print(f"Skipping r/{subreddit}: no keywords given and it was never watched before.")
+            return None
+        if state is None or (keywords and keywords != state['keywords']):
+            run_id = database.create_run(subreddit=subreddit, keywords=", ".join(keywords))
+            if state is None:
+                state = {'subreddit': subreddit, 'before_fullname': None, 'before_created': None, 'pending': [],
+                         'posts_per_hour': None, 'poll_interval': None, 'last_polled_at': None, 'next_poll_at': None,
+                         'polls': 0, 'empty_polls': 0}
+            state.update(run_id=run_id, keywords=keywords, total_new_found=0)
+            database.save_watch_state(state)
+            print(f"Watching r/{subreddit} as run {run_id}.")
+        else:
+            print(f"Resuming watch of r/{subreddit} (run {state['run_id']}, {state['polls']} polls, "
+                  f"{state['total_new_found']} new opportunities so far).")
+        state.pop('updated_at', None)
+        return cls(state)
+
+    @property
+    def label(self) -> str:
+        return f"r/{self.state['subreddit']} (run {self.run_id})"
+
+    @property
+    def start_delay(self) -> float:
+        return max(0.0, (self.state['next_poll_at'] or 0) - time.time())
+
+    def run_batch(self, graph, options: dict) -> float:
+        """Polls once and saves the new state. Returns the seconds until the next poll."""
+        s = self.state
+        min_interval, max_interval = options['min_interval'], options['max_interval']
+        check_anchor = s['before_fullname'] and s['empty_polls'] and s['empty_polls'] % ANCHOR_CHECK_POLLS == 0
+        initial_state = {
+            "run_id": self.run_id,
+            "subreddit": s['subreddit'],
+            "keywords": s['keywords'],
+            "time_period": "watch",
+            "after": None,
+            "start_date": "", "end_date": "", "posts": [], "filtered_posts": [],
+            "analysis_results": [], "new_opportunities_count": 0,
+            "reanalyze_after_days": options.get('reanalyze_after_days'),
+            "reanalyze_on_prompt_change": options.get('reanalyze_on_prompt_change', False),
+            "linked_opportunities_count": 0,
+            "dump_path": None,
+            "watch": {
+                "before_fullname": None if check_anchor else s['before_fullname'],
+                "before_created": s['before_created'],
+                "pending": s['pending'],
+                "settle_seconds": options['settle_seconds'],
+            },
+        }
+        now = time.time()
+        try:
+            final_state = graph.run(initial_state)
+        except Exception as e:
+            # Keep watching: the limiters already retried transient errors, so wait a full interval.
+            self.error = e
+            s['next_poll_at'] = now + max_interval
+            database.save_watch_state(s)
+            print(f"Polling {self.label} failed: {e}. Trying again in {_format_seconds(max_interval)}.")
+            return max_interval
+        self.error = None
+        watch = final_state["watch"]
+
+        observed = None
+        if s['last_polled_at']:
+            observed = watch['arrivals'] / max(now - s['last_polled_at'], 1) * 3600
+        elif watch['span_seconds']:
+            # First poll: estimate the rate from the spacing of the newest page.
+            observed = (watch['arrivals'] - 1) / watch['span_seconds'] * 3600
+        if observed is not None:
+            previous = s['posts_per_hour']
+            s['posts_per_hour'] = observed if previous is None else RATE_SMOOTHING * observed + (1 - RATE_SMOOTHING) * previous
+
+        # Posts still collecting comments are picked up by whichever poll comes after they are ready.
+        interval = next_poll_interval(s['posts_per_hour'], s['poll_interval'], watch['full'], min_interval, max_interval)
+
+        new_count = final_state.get("new_opportunities_count", 0)
+        ticket = final_state.get("ticket")
+        if ticket is not None:
+            # Polls are small; wait for the streaming pipeline so the saved state matches the database.
+            ticket.wait()
+            new_count += ticket.new_count
+        s.update(
+            before_fullname=watch['before_fullname'] or s['before_fullname'],
+            before_created=watch['before_created'],
+            pending=watch['pending'],
+            poll_interval=interval,
+            last_polled_at=now,
+            next_poll_at=now + interval,
+            polls=s['polls'] + 1,
+            empty_polls=0 if watch['arrivals'] else s['empty_polls'] + 1,
+            total_new_found=s['total_new_found'] + new_count,
+        )
+        database.save_watch_state(s)
+        print(f"--- {self.label}: {watch['arrivals']} new posts, {new_count} new opportunities; "
+              f"~{s['posts_per_hour'] or 0:.1f} posts/hour, next poll in {_format_seconds(interval)} ---")
+        return interval
+
+
+class WatchScheduler(RunScheduler):
+    """
+    Round-robin scheduler for WatchJobs. Watches never finish, so it runs until interrupted;
+    a watch waiting for its next poll does not hold a worker.
+    """
+    def print_progress(self):
+        if len(self.jobs) < 2:
+            return
+        found = sum(job.state['total_new_found'] for job in self.jobs)
+        print(f"\n=== Watching {len(self.jobs)} subreddits, {found} new opportunities ===")
+        for job in self.jobs:
+            s = job.state
+            status = "failed, retrying" if job.error is not None else f"next poll in {_format_seconds(job.start_delay)}"
+            print(f"  {job.label:<40} polls {s['polls']:>5}  ~{s['posts_per_hour'] or 0:>7.1f} posts/h  "
+                  f"{s['total_new_found']:>5} new  {status}")
+
+    def unfinished_run_ids(self) -> List[int]:
+        return []
@@ -0,0 +1,38 @@
+import pytest
+
+from src.output_repair import OutputRepairer, extract_json
+
+CATEGORIES = {"SaaS": ["CRM", "BI & Analytics"], "FinTech": ["Invoicing"]}
+
+
+def _analysis(**fields) -> dict:
+    analysis = {
+        "pain_points": ["Chasing late payments"],
+        "business_opportunities": ["Automated reminders"],
+        "automation_ideas": ["Email unpaid invoices weekly"],
+        "confidence_score": 7,
+        "summary": "Freelancers lose time on collections.",
+        "category": "FinTech",
+        "sub_category": "Invoicing",
+    }
+    analysis.update(fields)
+    return analysis
+
+
+@pytest.mark.parametrize("value", [float("nan"), float("inf"), float("-inf"), "1e999", "NaN", "Infinity"])
+def test_non_finite_confidence_score_is_invalid(value):
+    assert OutputRepairer._as_score(value) is None
+    analysis, _, invalid = OutputRepairer(CATEGORIES).repair(_analysis(confidence_score=value))
+    assert invalid == ["confidence_score"]
+    assert "confidence_score" not in analysis
+
+
+def test_non_finite_confidence_score_from_json():
+    raw = extract_json('{"confidence_score": 1e999, "summary": "x"}')
+    assert OutputRepairer._as_score(raw["confidence_score"]) is None
+    assert OutputRepairer._as_score(extract_json('{"confidence_score": NaN}')["confidence_score"]) is None
+
+
+@pytest.mark.parametrize("value, expected", [("8/10", 8), ("7.5", 8), (12, 10), (0, 1), ("three", 3)])
+def test_confidence_score_is_repaired(value, expected):
+    assert OutputRepairer._as_score(value) == expected